@@ -0,0 +1,155 @@
+"""Maintenance commands for mothra.
+
+Example :
+    $ python -m mothra cache stats
+    $ python -m mothra cache prune --max_size 2048
+    $ python -m mothra results export results.sqlite results.csv
+"""
+
+import argparse
+import os
+import time
+
+from mothra import cache, database
+
+
+def _generate_parser():
+    """Helper function. Parses the arguments of the maintenance commands."""
+    parser = argparse.ArgumentParser(prog='python -m mothra')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_cache = commands.add_parser('cache',
+                                       help='Inspect or prune the\
+                                       computation cache')
+    parser_cache.add_argument('action',
+                              choices=['stats', 'prune'],
+                              help='Print statistics of the cache, or remove\
+                              its least recently used results')
+    parser_cache.add_argument('--cache_dir',
+                              type=str,
+                              default=cache.DEFAULT_LOCATION,
+                              help='Folder of the cache')
+    parser_cache.add_argument('--max_size',
+                              type=int,
+                              default=None,
+                              help='With prune, maximum size of the cache, in\
+                              MB')
+    parser_cache.add_argument('--max_items',
+                              type=int,
+                              default=None,
+                              help='With prune, maximum number of cached\
+                              results')
+
+    parser_results = commands.add_parser('results',
+                                         help='Export or query a SQLite\
+                                         results database')
+    parser_results.add_argument('action',
+                                choices=['export', 'find'],
+                                help='Export the results to a CSV file, or\
+                                print the results of an image')
+    parser_results.add_argument('database',
+                                type=str,
+                                help='SQLite results database')
+    parser_results.add_argument('target',
+                                type=str,
+                                help='With export, the CSV file to write;\
+                                with find, the image id (its filename)')
+    parser_results.add_argument('--run_id',
+                                type=str,
+                                default=None,
+                                help='With export, only export the results\
+                                of this run')
+    parser_results.add_argument('--all',
+                                action='store_true',
+                                help='Export or print all the results of\
+                                each image, one per version of the image\
+                                file, instead of the most recent one')
+
+    return parser.parse_args()
+
+
+def _format_time(seconds):
+    """Helper function. Returns a readable local time, or '-' for None."""
+    if seconds is None:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+
+
+def cache_command(args):
+    """Prints statistics of the cache, or prunes it.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the command; see `_generate_parser`.
+
+    Returns
+    -------
+    None
+    """
+    store = cache.StageCache(args.cache_dir)
+
+    if args.action == 'prune':
+        if args.max_size is None and args.max_items is None:
+            print('* Nothing to prune; give --max_size or --max_items.')
+            return None
+        max_bytes = None
+        if args.max_size is not None:
+            max_bytes = args.max_size * 2**20
+        removed_items, removed_bytes = store.prune(max_bytes, args.max_items)
+        print(f'Removed {removed_items} results '
+              f'({removed_bytes / 2**20:.1f} MB).')
+
+    stats = store.stats()
+    print(f"Cache: {args.cache_dir}\n"
+          f"* results: {stats['items']}\n"
+          f"* size: {stats['bytes'] / 2**20:.1f} MB\n"
+          f"* least recently used: {_format_time(stats['oldest'])}\n"
+          f"* most recently used: {_format_time(stats['newest'])}")
+    return None
+
+
+def results_command(args):
+    """Exports a SQLite results database to a CSV file, or prints the
+    results of an image.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the command; see `_generate_parser`.
+
+    Returns
+    -------
+    None
+    """
+    if not os.path.isfile(args.database):
+        print(f'* {args.database} does not exist.')
+        return None
+
+    with database.ResultStore(args.database) as store:
+        if args.action == 'export':
+            count = store.export_csv(args.target, args.run_id, args.all)
+            print(f'Exported {count} results to {args.target}.')
+        else:
+            results = store.find(args.target, args.all)
+            if not results:
+                print(f'* No results for {args.target}.')
+            for result in results:
+                result['processed_at'] = _format_time(result['processed_at'])
+                print('\n'.join(f'{column}: {value}'
+                                 for column, value in result.items()))
+                print()
+    return None
+
+
+def main():
+    args = _generate_parser()
+    if args.command == 'cache':
+        cache_command(args)
+    elif args.command == 'results':
+        results_command(args)
+    return None
+
+
+if __name__ == '__main__':
+    main()
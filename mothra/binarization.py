@@ -1,14 +1,10 @@
 import numpy as np
 import scipy as sp
-from skimage.measure import label, regionprops
+from itertools import islice
 from skimage.transform import rescale
 from skimage.util import img_as_bool
-from joblib import Memory
-from fastai.vision.learner import load_learner
-from pathlib import Path
-from mothra import connection, ruler_detection
+from mothra import components, labels, registry, ruler_detection
 
-from .cache import memory
 
 # Height of extra margin to make sure all of the ruler is cropped out in find_tags_edge.
 # Percent of height of the image
@@ -22,6 +18,16 @@ WEIGHTS_BIN = './models/segmentation_test-4classes.pkl'
 # the lepidopteran.
 TOL_ELEM = 50
 
+# Number of images processed by the U-net in one forward pass.
+BATCH_SIZE = 8
+
+# Maximum difference in log(width / height) between images in the same batch.
+ASPECT_TOLERANCE = 0.1
+
+# Size (width, height) of images decoded for the U-net, used if it cannot be
+# read from the learner.
+INPUT_SIZE = (1024, 1024)
+
 
 def _rescale_image(image_refer, image_to_rescale):
     """Helper function. Rescale image back to original size, according to
@@ -52,17 +58,16 @@ def find_tags_edge(tags_bin, top_ruler, axes=None):
     # Make sure ruler is cropped out with some extra margin.
     tags_bin = tags_bin[:top_ruler - int(RULER_CROP_MARGIN * tags_bin.shape[0])]
 
-    # Calculate regionprops
-    tags_regions = regionprops(label(tags_bin))
+    # the leftmost edge of all tags is the first column containing a tag.
+    tags_cols = np.flatnonzero(tags_bin.any(axis=0))
 
-    # if labels are not identified, tags_regions will be empty.
+    # if labels are not identified, tags_cols will be empty.
     # in that case, return the last column of the input image as a result:
-    if not tags_regions:
+    if not tags_cols.size:
         return tags_bin.shape[-1]
 
     # checking where the first tag starts.
-    tags_leftedges = [region.bbox[1] for region in tags_regions]
-    first_tag_edge = np.min(tags_leftedges)
+    first_tag_edge = tags_cols[0]
 
     if axes and axes[6]:
         halfway = tags_bin.shape[1] // 2
@@ -75,7 +80,7 @@ def find_tags_edge(tags_bin, top_ruler, axes=None):
     return first_tag_edge
 
 
-def binarization(image_rgb, weights=WEIGHTS_BIN):
+def binarization(image_rgb, weights=WEIGHTS_BIN, shape=None, clean=False):
     """Extract the shape of the elements in an input image using the U-net
     deep learning architecture.
 
@@ -85,36 +90,192 @@ def binarization(image_rgb, weights=WEIGHTS_BIN):
         Input RGB image of a lepidopteran, with ruler and tags.
     weights : str or pathlib.Path
         Path of the file containing weights for segmentation.
+    shape : (M, N) tuple, optional
+        Shape of the input image, when `image_rgb` is a reduced resolution
+        version of it. Defaults to the shape of `image_rgb`.
+    clean : bool, optional
+        If True, noise is removed from the segmentation; see `clean_bins`.
 
     Returns
     -------
-    tags_bin : (M, N) ndarray
-        Binary image containing tags in the input image.
-    ruler_bin : (M, N) ndarray
-        Binary image containing the ruler in the input image.
-    lepidop_bin : (M, N) ndarray
-        Binary image containing the lepidopteran in the input image.
+    label_map : labels.LabelMap
+        Classes of the pixels in the input image: tags, ruler and
+        lepidopteran. Iterating over it yields their binary images,
+        `tags_bin`, `ruler_bin` and `lepidop_bin`.
     """
-    if isinstance(weights, str):
-        weights = Path(weights)
-
-    connection.download_weights(weights)
-    learner = load_learner(fname=weights)
+    learner = registry.get_learner(weights)
 
     print('Processing U-net...')
     _, _, classes = learner.predict(image_rgb)
-    _, tags_bin, ruler_bin, lepidop_bin = np.asarray(classes)[:4]
 
-    # rescale the predicted images back up and binarize them.
-    tags_bin = img_as_bool(_rescale_image(image_rgb, tags_bin))
-    ruler_bin = img_as_bool(_rescale_image(image_rgb, ruler_bin))
-    lepidop_bin = img_as_bool(_rescale_image(image_rgb, lepidop_bin))
+    if shape is None:
+        shape = image_rgb.shape
+    return _classes_to_labels(shape, classes, clean)
+
+
+def binarization_batch(images, batch_size=BATCH_SIZE, weights=WEIGHTS_BIN,
+                       aspect_tolerance=ASPECT_TOLERANCE, shapes=None,
+                       clean=False, errors=False):
+    """Extract the shape of the elements in several input images, using the
+    U-net with one forward pass per batch.
+
+    Parameters
+    ----------
+    images : iterable of (M, N, 3) ndarray
+        Input RGB images of lepidopterans, with ruler and tags.
+    batch_size : int, optional
+        Maximum number of images processed in one forward pass.
+    weights : str or pathlib.Path
+        Path of the file containing weights for segmentation.
+    aspect_tolerance : float, optional
+        Maximum difference in log(width / height) between images processed
+        in the same batch.
+    shapes : iterable of (M, N) tuple, optional
+        Shapes of the input images, when `images` are reduced resolution
+        versions of them. Defaults to the shapes of `images`.
+    clean : bool, optional
+        If True, noise is removed from the segmentation; see `clean_bins`.
+    errors : bool, optional
+        If True, the exception raised while processing an image is yielded
+        in its place, and the other images are still processed.
+
+    Yields
+    ------
+    label_map : labels.LabelMap or Exception
+        Classes of the pixels in each input image, in the same order as
+        `images`. See `binarization`.
+
+    Notes
+    -----
+    `images` is consumed in chunks of a few batches. Images in a chunk are
+    grouped by aspect ratio, so the network input for images in the same
+    batch is resized or padded alike.
+    """
+    learner = registry.get_learner(weights)
+
+    images = iter(images)
+    if shapes is not None:
+        shapes = iter(shapes)
+    while True:
+        chunk = list(islice(images, 4 * batch_size))
+        if not chunk:
+            break
+
+        print(f'Processing U-net for {len(chunk)} images...')
+        classes = [None] * len(chunk)
+        input_shapes = [image.shape for image in chunk]
+        for batch in _group_by_aspect(input_shapes, batch_size,
+                                      aspect_tolerance):
+            try:
+                probs = _predict_batch(learner,
+                                       [chunk[idx] for idx in batch])
+            except Exception:
+                if not errors:
+                    raise
+                # predicting the images one by one, so that only the ones
+                # failing are reported.
+                probs = [_predict_or_error(learner, chunk[idx])
+                         for idx in batch]
+            for idx, prob in zip(batch, probs):
+                classes[idx] = prob
+
+        output_shapes = input_shapes
+        if shapes is not None:
+            output_shapes = list(islice(shapes, len(chunk)))
+        for shape, prob in zip(output_shapes, classes):
+            try:
+                if isinstance(prob, Exception):
+                    raise prob
+                label_map = _classes_to_labels(shape, prob, clean)
+            except Exception as exc:
+                if not errors:
+                    raise
+                label_map = exc
+            yield label_map
+
+
+def input_size(weights=WEIGHTS_BIN):
+    """Returns the size of the images seen by the U-net.
+
+    Parameters
+    ----------
+    weights : str or pathlib.Path
+        Path of the file containing weights for segmentation.
 
+    Returns
+    -------
+    size : (width, height) tuple
+        Size to which the learner resizes its input images, or `INPUT_SIZE`
+        if the learner does not resize them.
+    """
+    learner = registry.get_learner(weights)
+
+    after_item = getattr(getattr(learner, 'dls', None), 'after_item', None)
+    for transform in getattr(after_item, 'fs', []):
+        size = getattr(transform, 'size', None)
+        if size is not None:
+            # fastai sizes are (height, width).
+            return tuple(int(value) for value in size)[::-1]
+
+    return INPUT_SIZE
+
+
+def _group_by_aspect(shapes, batch_size, aspect_tolerance):
+    """Helper function. Groups image indices into batches of at most
+    `batch_size` images with similar aspect ratio."""
+    log_aspects = [np.log(shape[1] / shape[0]) for shape in shapes]
+    order = np.argsort(log_aspects, kind='stable')
+
+    batches, batch = [], []
+    for idx in order:
+        if batch and (len(batch) == batch_size or
+                      log_aspects[idx] - log_aspects[batch[0]] > aspect_tolerance):
+            batches.append(batch)
+            batch = []
+        batch.append(int(idx))
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _predict_batch(learner, images):
+    """Helper function. Returns the class probabilities predicted by
+    `learner` for `images`, in one forward pass."""
+    dl = learner.dls.test_dl(images, bs=len(images), num_workers=0)
+    with learner.no_bar():
+        probs, _ = learner.get_preds(dl=dl)
+    return probs
+
+
+def _predict_or_error(learner, image):
+    """Helper function. Returns the class probabilities predicted by
+    `learner` for a single image, or the exception raised."""
+    try:
+        return _predict_batch(learner, [image])[0]
+    except Exception as exc:
+        return exc
+
+
+def _classes_to_labels(shape, classes, clean=False):
+    """Helper function. Binarizes the class probabilities predicted by the
+    U-net, returning them as a LabelMap for an image of the (rows, cols) in
+    `shape`."""
+    _, tags_bin, ruler_bin, lepidop_bin = np.asarray(classes)[:4] > 0.5
+
+    # binarized images are processed at the resolution of the U-net, and
+    # only rescaled when used.
     tags_bin = sp.ndimage.binary_fill_holes(tags_bin)
     ruler_bin = sp.ndimage.binary_fill_holes(ruler_bin)
     lepidop_bin = sp.ndimage.binary_fill_holes(lepidop_bin)
 
-    return tags_bin, ruler_bin, lepidop_bin
+    if clean:
+        tol_elem = np.round(TOL_ELEM * np.asarray(lepidop_bin.shape) /
+                            np.asarray(shape[:2])).astype(int)
+        tags_bin, ruler_bin, lepidop_bin = clean_bins(tags_bin, ruler_bin,
+                                                      lepidop_bin, tol_elem)
+
+    return labels.LabelMap.from_masks(tags_bin, ruler_bin, lepidop_bin, shape)
 
 
 def return_bbox_largest_region(image_bin):
@@ -130,12 +291,9 @@ def return_bbox_largest_region(image_bin):
     image_bbox : (min_row, min_col, max_row, max_col) list
         A list containing the coordinates of the bounding box.
     """
-    props = regionprops(label(image_bin))
+    regions = components.Components(image_bin)
 
-    # largest_reg will receive the largest region properties.
-    largest_reg = max(props, key=lambda x: x.area)
-
-    return largest_reg.bbox
+    return regions.bbox(regions.largest())
 
 
 def return_largest_region(image_bin):
@@ -151,16 +309,95 @@ def return_largest_region(image_bin):
     image_bin : (M, N) ndarray
         The input binary image containing only the largest region.
     """
-    props = regionprops(label(image_bin))
+    return _keep_largest_region(image_bin)[0]
+
+
+def _keep_largest_region(image_bin):
+    """Helper function. Removes all but the largest region from the input
+    image, returning it with the bounding box of the region."""
+    regions = components.Components(image_bin)
+    largest = regions.largest()
+    image_bin[regions.markers != largest] = 0
+
+    return img_as_bool(image_bin), regions.bbox(largest)
+
 
-    # largest_reg will receive the largest region properties.
-    largest_reg = max(props, key=lambda x: x.area)
-    image_bin[label(image_bin) != largest_reg.label] = 0
+def clean_bins(tags_bin, ruler_bin, lepidop_bin, tol_elem=TOL_ELEM):
+    """Removes noise from the binary images returned by the U-net.
 
-    return img_as_bool(image_bin)
+    Parameters
+    ----------
+    tags_bin, ruler_bin, lepidop_bin : (M, N) ndarray
+        Binary images containing tags, ruler and lepidopteran, as returned by
+        `binarization`.
+    tol_elem : int or (int, int), optional
+        Tolerance in pixels (rows, cols) on where ruler and tags can start,
+        according to the lepidopteran.
+
+    Returns
+    -------
+    tags_bin, ruler_bin, lepidop_bin : (M, N) ndarray
+        Binary images containing tags, ruler and lepidopteran. Only the
+        largest region is kept for the lepidopteran, and ruler and tags
+        are removed from the area of the lepidopteran.
+    """
+    # if the binary image has more than one region, returns the largest one.
+    lepidop_bin, (_, _, max_row, max_col) = _keep_largest_region(lepidop_bin)
+
+    # removing possible noise from ruler and tags before proceeding.
+    tol_row, tol_col = np.broadcast_to(tol_elem, 2)
+    ruler_bin[:max_row-tol_row, :max_col-tol_col] = False
+    tags_bin[:max_row-tol_row, :max_col-tol_col] = False
+
+    return tags_bin, ruler_bin, lepidop_bin
+
+
+def segment(image_rgb, shape=None):
+    """Binarizes the input image and removes noise from its elements.
+
+    Parameters
+    ----------
+    image_rgb : 3D array
+        RGB image of the entire picture
+    shape : (M, N) tuple, optional
+        Shape of the picture, when `image_rgb` is a reduced resolution
+        version of it. See `binarization`.
+
+    Returns
+    -------
+    label_map : labels.LabelMap
+        Classes of the pixels in image_rgb: tags, ruler and lepidopteran.
+        See `binarization` and `clean_bins`.
+    """
+    return binarization(image_rgb, weights=WEIGHTS_BIN, shape=shape,
+                        clean=True)
+
+
+def plot_bins(lepidop_bin, first_tag_edge=None, axes=None):
+    """Plots the binarized lepidopteran and the edge of the tags area.
+
+    Parameters
+    ----------
+    lepidop_bin : (M, N) ndarray
+        Binary image containing the lepidopteran.
+    first_tag_edge : int, optional
+        X coordinate of the vertical line separating the tags area from the
+        lepidopteran area.
+    axes : obj
+        If any, the binarization result will be plotted on it.
+
+    Returns
+    -------
+    None
+    """
+    if axes and axes[1]:
+        axes[1].imshow(lepidop_bin)
+        axes[1].set_title('Binarized lepidopteran')
+    if axes and axes[3] and first_tag_edge is not None:
+        axes[3].axvline(x=first_tag_edge, color='c', linestyle='dashed')
+    return None
 
 
-@memory.cache(ignore=['axes'])
 def main(image_rgb, axes=None):
     """Binarizes and crops the lepidopteran in image_rgb.
 
@@ -179,18 +416,14 @@ def main(image_rgb, axes=None):
         Binary image containing the ruler in image_rgb.
     lepidop_bin : (M, N) ndarray
         Binary image containing the lepidopteran in image_rgb.
+
+    Notes
+    -----
+    `mothra.stages` runs these steps separately, so that ruler detection is
+    not repeated by the pipeline.
     """
     # binarizing the input image and separating its elements.
-    tags_bin, ruler_bin, lepidop_bin = binarization(image_rgb,
-                                                    weights=WEIGHTS_BIN)
-
-    # if the binary image has more than one region, returns the largest one.
-    lepidop_bin = return_largest_region(lepidop_bin)
-
-    # removing possible noise from ruler and tags before proceeding.
-    _, _, max_row, max_col = return_bbox_largest_region(lepidop_bin)
-    ruler_bin[:max_row-TOL_ELEM, :max_col-TOL_ELEM] = False
-    tags_bin[:max_row-TOL_ELEM, :max_col-TOL_ELEM] = False
+    tags_bin, ruler_bin, lepidop_bin = segment(image_rgb)
 
     # detecting where the ruler starts.
     _, top_ruler = ruler_detection.main(image_rgb, ruler_bin, axes)
@@ -198,10 +431,6 @@ def main(image_rgb, axes=None):
     # detecting where the tags start.
     first_tag_edge = find_tags_edge(tags_bin, top_ruler, axes)
 
-    if axes and axes[1]:
-        axes[1].imshow(lepidop_bin)
-        axes[1].set_title('Binarized lepidopteran')
-    if axes and axes[3]:
-        axes[3].axvline(x=first_tag_edge, color='c', linestyle='dashed')
+    plot_bins(lepidop_bin, first_tag_edge, axes)
 
     return tags_bin, ruler_bin, lepidop_bin
@@ -1,5 +1,346 @@
-from joblib import Memory
+import errno
+import hashlib
+import io
+import numpy as np
+import os
+import pickle
+import time
+import zlib
+
+from pathlib import Path
+from mothra import codec
+
+
+# Changing this invalidates all cached results; the source code of mothra and
+# the files given to StageCache are also part of the keys.
+VERSION = 1
+
+# Zlib compression level of cached results; low levels are much faster, and
+# results are mostly small values and label images, which compress well.
+COMPRESSION_LEVEL = 1
+
+# Default folder of the cache.
+DEFAULT_LOCATION = './cachedir'
+
+# When pruning during a run, the cache is reduced to this fraction of its
+# limits, so that it is not pruned again after every result.
+PRUNE_TARGET = 0.9
+
+# Fraction of the limits written between two prunings during a run.
+PRUNE_INTERVAL = 0.05
+
+# Age, in seconds, of temporary files left by interrupted writes, after which
+# they are removed when pruning.
+STALE_SECONDS = 3600
+
+# Extension of cached results.
+SUFFIX = '.pkl.z'
 
 # The main script will override this as necessary.
-# By default, no caching is performed (backend=None).
-memory = Memory(backend=None)
+# By default, no caching is performed.
+stage_cache = None
+
+
+def source_digest(image_path):
+    """Returns a digest identifying the contents of a file, computed from its
+    absolute path, size and modification time, without reading it.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the file.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal digest of the file.
+    """
+    stat = os.stat(image_path)
+    source = f'{os.path.abspath(image_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def code_version():
+    """Returns a digest of the source code of mothra, so that cached results
+    are recomputed when any part of the pipeline is tweaked."""
+    digest = hashlib.sha256()
+    for filename in sorted(Path(__file__).parent.glob('*.py')):
+        digest.update(filename.name.encode())
+        digest.update(filename.read_bytes())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Results of the pipeline stages, stored on disk and addressed by the
+    source image, the stage, its parameters and the version of the code.
+
+    Parameters
+    ----------
+    location : str
+        Folder containing the cached results.
+    params : dict, optional
+        Parameters of the pipeline that change the results of stages (e.g.
+        `auto_rotate`). Must have a stable `repr`.
+    files : iterable of str, optional
+        Files whose contents change the results of stages, e.g. network
+        weights. Their sizes and modification times are read on first use,
+        so they do not need to exist before that.
+    max_bytes : int, optional
+        Maximum size of the cache, in bytes. None means no limit.
+    max_items : int, optional
+        Maximum number of cached results. None means no limit.
+
+    Notes
+    -----
+    Images are identified by `source_digest`, so cached results are found
+    without reading or hashing images, and without hashing the arrays passed
+    between stages. Results are pickled and compressed with zlib, with
+    binary masks encoded by `codec.encode_mask`; each one is written to a
+    temporary file first, so that concurrent workers never read partial
+    results.
+
+    With limits, the least recently used results are evicted; see `prune`.
+    The cache is pruned while results are saved, and when the disk is full,
+    in which case results that still do not fit are not cached.
+    """
+    def __init__(self, location, params=None, files=(), max_bytes=None,
+                 max_items=None):
+        self.location = Path(location)
+        self.params = dict(params or {})
+        self.files = tuple(files)
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._version = None
+        # bytes and items written since the cache was last pruned; the
+        # cache is pruned at the first save.
+        self._written = None
+
+    def version(self):
+        """Returns a digest of VERSION, the source code of mothra,
+        `params` and `files`."""
+        if self._version is None:
+            digest = hashlib.sha256()
+            digest.update(f'{VERSION}:{code_version()}'.encode())
+            digest.update(repr(sorted(self.params.items())).encode())
+            for filename in self.files:
+                try:
+                    stat = os.stat(filename)
+                    digest.update(f'{filename}:{stat.st_size}:'
+                                  f'{stat.st_mtime_ns}'.encode())
+                except OSError:
+                    digest.update(f'{filename}:missing'.encode())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def key(self, image_path, stage_name):
+        """Returns the key of the results of stage `stage_name` for the
+        image in `image_path`."""
+        digest = hashlib.sha256()
+        digest.update(f'{self.version()}:{source_digest(image_path)}:'
+                      f'{stage_name}'.encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        """Helper function. Returns the path of the entry with `key`."""
+        return self.location / key[:2] / f'{key}{SUFFIX}'
+
+    def contains(self, image_path, stage_name):
+        """Checks if results of stage `stage_name` are cached for the image
+        in `image_path`."""
+        try:
+            return self._path(self.key(image_path, stage_name)).is_file()
+        except OSError:
+            return False
+
+    def load(self, image_path, stage_name):
+        """Returns the cached outputs of stage `stage_name` for the image in
+        `image_path`, or None if they are not cached."""
+        try:
+            path = self._path(self.key(image_path, stage_name))
+            data = path.read_bytes()
+            # recording the access, as access times are often not updated
+            # by file systems.
+            os.utime(path)
+            return pickle.loads(zlib.decompress(data))
+        except (OSError, ValueError, zlib.error, pickle.UnpicklingError,
+                EOFError):
+            return None
+
+    def save(self, image_path, stage_name, outputs):
+        """Stores the outputs of stage `stage_name` for the image in
+        `image_path`. Outputs are not stored if the disk is full, even after
+        pruning the cache."""
+        path = self._path(self.key(image_path, stage_name))
+        data = zlib.compress(_dumps(tuple(outputs)), COMPRESSION_LEVEL)
+        self._maybe_prune(len(data))
+        try:
+            self._write(path, data)
+        except OSError as exc:
+            if exc.errno != errno.ENOSPC:
+                raise
+            self.prune(*self._targets(len(data)))
+            try:
+                self._write(path, data)
+            except OSError as exc:
+                if exc.errno != errno.ENOSPC:
+                    raise
+                print(f'* Disk full, could not cache results in '
+                      f'{self.location}')
+        return None
+
+    def _write(self, path, data):
+        """Helper function. Writes `data` in `path`, atomically."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+        except OSError:
+            temporary.unlink(missing_ok=True)
+            raise
+        return None
+
+    def _targets(self, extra_bytes=0):
+        """Helper function. Returns the (max_bytes, max_items) the cache is
+        reduced to while running, leaving room for `extra_bytes`."""
+        max_bytes, max_items = self.max_bytes, self.max_items
+        if max_bytes is not None:
+            max_bytes = max(int(PRUNE_TARGET * max_bytes) - extra_bytes, 0)
+        if max_items is not None:
+            max_items = max(int(PRUNE_TARGET * max_items) - 1, 0)
+        return max_bytes, max_items
+
+    def _maybe_prune(self, size):
+        """Helper function. Prunes the cache if enough results were written
+        since it was last pruned, before writing `size` bytes."""
+        if self.max_bytes is None and self.max_items is None:
+            return None
+        if self._written is not None:
+            written_bytes, written_items = self._written
+            self._written = (written_bytes + size, written_items + 1)
+            if not ((self.max_bytes is not None and
+                     written_bytes >= PRUNE_INTERVAL * self.max_bytes) or
+                    (self.max_items is not None and
+                     written_items >= PRUNE_INTERVAL * self.max_items)):
+                return None
+        self.prune(*self._targets(size))
+        self._written = (0, 0)
+        return None
+
+    def entries(self):
+        """Returns the cached results as a list of (path, size, last access)
+        tuples, from the least to the most recently used."""
+        entries = []
+        if not self.location.is_dir():
+            return entries
+        for folder in os.scandir(self.location):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:  # evicted by another process.
+                    continue
+                entries.append((Path(entry.path), stat.st_size,
+                                max(stat.st_atime, stat.st_mtime)))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def stats(self):
+        """Returns the number of cached results, their size in bytes, and
+        the times of the least and most recent accesses (None if the cache
+        is empty)."""
+        entries = self.entries()
+        oldest = entries[0][2] if entries else None
+        newest = entries[-1][2] if entries else None
+        return {'items': len(entries),
+                'bytes': sum(entry[1] for entry in entries),
+                'oldest': oldest,
+                'newest': newest}
+
+    def prune(self, max_bytes=None, max_items=None):
+        """Evicts the least recently used results until the cache fits the
+        limits.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Maximum size of the cache, in bytes. Defaults to
+            `self.max_bytes`; None means no limit.
+        max_items : int, optional
+            Maximum number of cached results. Defaults to `self.max_items`;
+            None means no limit.
+
+        Returns
+        -------
+        removed_items : int
+            Number of evicted results.
+        removed_bytes : int
+            Size of the evicted results, in bytes.
+
+        Notes
+        -----
+        Other processes may use the cache meanwhile: results are evicted by
+        deleting their files, which is atomic, and results evicted or in use
+        by others are skipped. Temporary files left by interrupted writes
+        are also removed.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_items is None:
+            max_items = self.max_items
+
+        self._remove_stale()
+        entries = self.entries()
+        total_bytes = sum(entry[1] for entry in entries)
+        total_items = len(entries)
+
+        removed_items, removed_bytes = 0, 0
+        for path, size, _ in entries:
+            if ((max_bytes is None or total_bytes <= max_bytes) and
+                    (max_items is None or total_items <= max_items)):
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:  # evicted by another process.
+                pass
+            except OSError:  # in use, e.g. on Windows.
+                continue
+            else:
+                removed_items += 1
+                removed_bytes += size
+            total_bytes -= size
+            total_items -= 1
+
+        return removed_items, removed_bytes
+
+    def _remove_stale(self):
+        """Helper function. Removes temporary files left by interrupted
+        writes."""
+        limit = time.time() - STALE_SECONDS
+        for path in self.location.glob('*/*.tmp'):
+            try:
+                if path.stat().st_mtime < limit:
+                    path.unlink()
+            except OSError:
+                continue
+        return None
+
+
+class _MaskPickler(pickle.Pickler):
+    """Helper class. Pickles binary masks encoded by `codec.encode_mask`,
+    with 1 bit per pixel instead of 1 byte."""
+    def reducer_override(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype == bool:
+            # compressed later, with the rest of the pickle.
+            return codec.decode_mask, (codec.encode_mask(obj, level=0),)
+        return NotImplemented
+
+
+def _dumps(obj):
+    """Helper function. Pickles `obj`, encoding its binary masks."""
+    buffer = io.BytesIO()
+    _MaskPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
@@ -0,0 +1,178 @@
+import numpy as np
+import struct
+import zlib
+
+
+# Identifies encoded masks, and the version of their format.
+MAGIC = b'MTHM'
+FORMAT_VERSION = 1
+
+# Encodings: binary masks are packed into 8 pixels per byte; label images
+# are stored as runs of pixels with the same label.
+PACKED_BITS = 0
+RUNS = 1
+
+# Zlib compression level used by default; 0 disables compression.
+COMPRESSION_LEVEL = 6
+
+# Magic, format version, encoding, compressed flag, number of dimensions.
+_HEADER = struct.Struct('<4sBBBB')
+
+
+def encode_mask(mask, level=COMPRESSION_LEVEL):
+    """Encodes a binary mask or a label image into compact bytes.
+
+    Parameters
+    ----------
+    mask : ndarray of bool or uint8
+        Binary mask (stored with 1 bit per pixel), or label image (stored as
+        runs of equal labels).
+    level : int, optional
+        Zlib compression level of the encoded pixels, from 0 (no
+        compression) to 9.
+
+    Returns
+    -------
+    data : bytes
+        Encoded mask; see `decode_mask`.
+
+    Raises
+    ------
+    ValueError
+        If the mask is not an array of bool or uint8.
+    """
+    mask = np.asarray(mask)
+    if mask.dtype == bool:
+        encoding = PACKED_BITS
+        body = np.packbits(mask.ravel()).tobytes()
+    elif mask.dtype == np.uint8:
+        encoding = RUNS
+        body = _encode_runs(mask.ravel())
+    else:
+        raise ValueError(f'cannot encode masks of type {mask.dtype}; '
+                         'expected bool or uint8')
+
+    if level:
+        body = zlib.compress(body, level)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, encoding, bool(level),
+                          mask.ndim)
+    shape = np.array(mask.shape, dtype='<u8').tobytes()
+    return header + shape + body
+
+
+def decode_mask(data):
+    """Decodes a mask encoded by `encode_mask`.
+
+    Parameters
+    ----------
+    data : bytes
+        Encoded mask.
+
+    Returns
+    -------
+    mask : ndarray of bool or uint8
+        The mask, exactly as it was encoded.
+
+    Raises
+    ------
+    ValueError
+        If `data` is not an encoded mask.
+    """
+    data = memoryview(data)
+    if len(data) < _HEADER.size:
+        raise ValueError('data is not an encoded mask')
+    magic, version, encoding, compressed, ndim = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError('data is not an encoded mask, or has an unknown '
+                         'format version')
+
+    offset = _HEADER.size + 8 * ndim
+    shape = tuple(int(size) for size in
+                  np.frombuffer(data[_HEADER.size:offset], dtype='<u8'))
+    body = data[offset:]
+    if compressed:
+        body = zlib.decompress(body)
+    size = int(np.prod(shape, dtype=np.int64))
+
+    if encoding == PACKED_BITS:
+        bits = np.unpackbits(np.frombuffer(body, dtype=np.uint8), count=size)
+        mask = bits.view(bool)
+    elif encoding == RUNS:
+        mask = _decode_runs(body)
+        if mask.size != size:
+            raise ValueError('encoded mask is corrupted')
+    else:
+        raise ValueError(f'unknown mask encoding {encoding}')
+
+    return mask.reshape(shape)
+
+
+def save_mask(path, mask, level=COMPRESSION_LEVEL):
+    """Saves a binary mask or a label image to a file.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the file.
+    mask : ndarray of bool or uint8
+        Mask to be saved; see `encode_mask`.
+    level : int, optional
+        Zlib compression level, from 0 (no compression) to 9.
+
+    Returns
+    -------
+    None
+    """
+    with open(path, 'wb') as mask_file:
+        mask_file.write(encode_mask(mask, level))
+    return None
+
+
+def load_mask(path):
+    """Loads a mask saved by `save_mask`.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the file.
+
+    Returns
+    -------
+    mask : ndarray of bool or uint8
+        The saved mask.
+    """
+    with open(path, 'rb') as mask_file:
+        return decode_mask(mask_file.read())
+
+
+def _encode_runs(flat):
+    """Helper function. Returns the runs of equal values in a flat uint8
+    array, as their number, values and lengths."""
+    if not flat.size:
+        return np.zeros(1, dtype='<u8').tobytes()
+
+    starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+    lengths = np.diff(np.append(starts, flat.size))
+    # long runs are only possible in large arrays.
+    width = 4 if flat.size < 2**32 else 8
+
+    return b''.join([np.array([starts.size], dtype='<u8').tobytes(),
+                     bytes([width]),
+                     flat[starts].tobytes(),
+                     lengths.astype(f'<u{width}').tobytes()])
+
+
+def _decode_runs(body):
+    """Helper function. Returns the flat uint8 array encoded by
+    `_encode_runs`."""
+    count = int(np.frombuffer(body[:8], dtype='<u8')[0])
+    if not count:
+        return np.zeros(0, dtype=np.uint8)
+
+    width = body[8]
+    values = np.frombuffer(body[9:9 + count], dtype=np.uint8)
+    lengths = np.frombuffer(body[9 + count:], dtype=f'<u{width}')
+    if lengths.size != count:
+        raise ValueError('encoded mask is corrupted')
+    return np.repeat(values, lengths.astype(np.int64))
@@ -0,0 +1,185 @@
+import numpy as np
+import scipy as sp
+
+
+class Components:
+    """Connected components of a binary image, labelled once.
+
+    Parameters
+    ----------
+    image_bin : (M, N) ndarray
+        A binary image.
+    connectivity : int, optional
+        1 for 4-connectivity, 2 for 8-connectivity, as in
+        `skimage.measure.label`. Defaults to 2.
+
+    Attributes
+    ----------
+    markers : (M, N) ndarray of int
+        Label of each pixel: 0 for background, and 1 to `count` for the
+        components.
+    count : int
+        Number of components.
+    areas : (count,) ndarray of int
+        Number of pixels of each component; `areas[idx]` is the area of the
+        component labelled `idx + 1`.
+    bboxes : (count, 4) ndarray of int
+        Bounding box (min_row, min_col, max_row, max_col) of each component,
+        ordered as `areas`. As in `regionprops`, max_row and max_col are
+        exclusive.
+    """
+    def __init__(self, image_bin, connectivity=2):
+        # labelling is much faster for boolean images.
+        image_bin = np.asarray(image_bin).astype(bool, copy=False)
+        self._structure = sp.ndimage.generate_binary_structure(2,
+                                                               connectivity)
+        self.markers, self.count = sp.ndimage.label(image_bin,
+                                                    self._structure)
+
+        # counting the pixels of the components only: bincount copies its
+        # input to 64-bit integers.
+        self.areas = np.bincount(self.markers[image_bin],
+                                 minlength=self.count + 1)[1:]
+        self.bboxes = np.array(
+            [(rows.start, cols.start, rows.stop, cols.stop)
+             for rows, cols in sp.ndimage.find_objects(self.markers)],
+            dtype=int
+            ).reshape(-1, 4)
+        self._centroids = None
+
+    def largest(self):
+        """Returns the label of the largest component (the first one, if
+        several are as large).
+
+        Raises
+        ------
+        ValueError
+            If there are no components.
+        """
+        if not self.count:
+            raise ValueError('binary image has no components')
+        return int(np.argmax(self.areas)) + 1
+
+    def centroids(self):
+        """Returns the (row, col) centroid of each component, ordered as
+        `areas`."""
+        if self._centroids is None:
+            rows, cols = np.nonzero(self.markers)
+            markers = self.markers[rows, cols]
+            sums = [np.bincount(markers, weights=coords,
+                                minlength=self.count + 1)[1:]
+                    for coords in (rows, cols)]
+            self._centroids = np.stack(sums, axis=-1) / self.areas[:, None]
+        return self._centroids
+
+    def eccentricities(self):
+        """Returns the eccentricity of the ellipse with the same second
+        moments as each component, ordered as `areas`, as
+        `regionprops(...).eccentricity`."""
+        # moments are computed from the pixels of the components only,
+        # with coordinates relative to their bounding boxes, for accuracy.
+        rows, cols = np.nonzero(self.markers)
+        markers = self.markers[rows, cols]
+        rows = (rows - self.bboxes[markers - 1, 0]).astype(float)
+        cols = (cols - self.bboxes[markers - 1, 1]).astype(float)
+
+        def mean(values):
+            return np.bincount(markers, weights=values,
+                               minlength=self.count + 1)[1:] / self.areas
+
+        mean_row, mean_col = mean(rows), mean(cols)
+        var_row = mean(rows * rows) - mean_row ** 2
+        var_col = mean(cols * cols) - mean_col ** 2
+        cov = mean(rows * cols) - mean_row * mean_col
+
+        # eigenvalues of the inertia tensor.
+        half_sum = (var_row + var_col) / 2
+        radius = np.sqrt(((var_row - var_col) / 2) ** 2 + cov ** 2)
+        largest = half_sum + radius
+        smallest = np.clip(half_sum - radius, 0, None)
+
+        eccentricities = np.zeros(self.count)
+        nonzero = largest > 0
+        eccentricities[nonzero] = np.sqrt(
+            1 - np.clip(smallest[nonzero] / largest[nonzero], 0, 1)
+            )
+        return eccentricities
+
+    def filled_areas(self, image_bin):
+        """Returns the number of pixels of each component with its holes
+        filled, ordered as `areas`.
+
+        Parameters
+        ----------
+        image_bin : (M, N) ndarray
+            The binary image the components were computed from.
+
+        Notes
+        -----
+        Holes are filled in the whole image at once. Components sharing a
+        filled region (i.e. inside the hole of another component, or
+        around one) are filled one by one, as by `regionprops`.
+        """
+        # as regionprops, holes are not connected to the outside by any
+        # neighbor, diagonals included.
+        filled = sp.ndimage.binary_fill_holes(image_bin, np.ones((3, 3)))
+        filled_markers, filled_count = sp.ndimage.label(filled,
+                                                        self._structure)
+
+        filled_areas = np.bincount(filled_markers[filled],
+                                   minlength=filled_count + 1)
+        # filled component containing each component.
+        foreground = self.markers > 0
+        enclosing = np.zeros(self.count + 1, dtype=int)
+        enclosing[self.markers[foreground]] = filled_markers[foreground]
+
+        enclosing = enclosing[1:]
+        result = filled_areas[enclosing]
+
+        shared = np.bincount(enclosing, minlength=filled_count + 1) > 1
+        for idx in np.flatnonzero(shared[enclosing]):
+            min_row, min_col, max_row, max_col = self.bbox(idx + 1)
+            image = self.markers[min_row:max_row, min_col:max_col] == idx + 1
+            result[idx] = np.count_nonzero(
+                sp.ndimage.binary_fill_holes(image, np.ones((3, 3)))
+                )
+
+        return result
+
+    def bbox(self, label):
+        """Returns the bounding box of the component labelled `label`."""
+        return tuple(int(value) for value in self.bboxes[label - 1])
+
+    def mask(self, label):
+        """Returns the binary image of the component labelled `label`."""
+        return self.markers == label
+
+    def coords(self, label):
+        """Returns the (row, col) coordinates of the pixels in the component
+        labelled `label`, in raster order."""
+        min_row, min_col, max_row, max_col = self.bbox(label)
+        coords = np.argwhere(self.markers[min_row:max_row,
+                                          min_col:max_col] == label)
+        return coords + np.array([min_row, min_col])
+
+    def row_extremes(self, label):
+        """Returns the (row, col) coordinates of the leftmost and rightmost
+        pixels of each row in the component labelled `label`, in raster
+        order.
+
+        Notes
+        -----
+        These pixels include all vertices of the convex hull of the
+        component; e.g. the pixel farthest from any point is one of them.
+        Rows with a single pixel return it twice.
+        """
+        min_row, min_col, max_row, max_col = self.bbox(label)
+        mask = self.markers[min_row:max_row, min_col:max_col] == label
+
+        rows = np.arange(min_row, max_row)
+        first = min_col + np.argmax(mask, axis=1)
+        last = max_col - 1 - np.argmax(mask[:, ::-1], axis=1)
+
+        coords = np.stack([np.stack([rows, first], axis=-1),
+                           np.stack([rows, last], axis=-1)], axis=1)
+        return coords.reshape(-1, 2)
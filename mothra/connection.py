@@ -1,7 +1,11 @@
+from pathlib import Path
 from pooch import retrieve
-from urllib import request
+from urllib import parse, request
 
 import hashlib
+import json
+import os
+import shutil
 import socket
 
 
@@ -16,6 +20,20 @@ URL_HASH = {
     'segmentation_test-4classes' : 'https://gitlab.com/mothra/mothra-data/-/raw/main/models/segmentation/SHA256SUM-segmentation_test-4classes'
     }
 
+# Name of the file, in the folder of the weights, recording size, modification
+# time and verified SHA256 hash of each weights file.
+MANIFEST_FNAME = 'manifest.json'
+
+# The main script will override these as necessary.
+# If True, the internet is never used: weights are not checked for updates,
+# and missing weights are only fetched from `mirror_url`.
+offline = False
+# If True, weights verified once are not checked for updates again.
+check_once = False
+# Folder or URL used instead of URL_MODEL and URL_HASH. It contains the
+# weights files, and their hash files named SHA256SUM-<weights stem>.
+mirror_url = None
+
 
 def _get_model_info(weights):
     """Helper function. Returns info from the model according the filename of
@@ -33,9 +51,24 @@ def _get_model_info(weights):
     url_hash : str
         URL of the hash file for the latest model.
     """
+    if mirror_url is not None:
+        return (_join_url(mirror_url, weights.name),
+                _join_url(mirror_url, f'SHA256SUM-{weights.stem}'))
     return (URL_MODEL.get(weights.stem), URL_HASH.get(weights.stem))
 
 
+def _join_url(base, fname):
+    """Helper function. Joins a filename to a base URL or folder."""
+    if _is_url(base):
+        return base.rstrip('/') + '/' + fname
+    return str(Path(base) / fname)
+
+
+def _is_url(location):
+    """Helper function. Checks if location is an URL, instead of a path."""
+    return parse.urlparse(str(location)).scheme in ('http', 'https', 'ftp')
+
+
 def download_weights(weights):
     """Triggers functions to download weights.
 
@@ -47,21 +80,34 @@ def download_weights(weights):
     Returns
     -------
     None
+
+    Notes
+    -----
+    Depending on `offline`, `check_once` and `mirror_url`, the weights are
+    not checked for updates, or are checked against a local mirror.
     """
+    weights = Path(weights)
     _, url_hash = _get_model_info(weights)
 
     # check if weights is in its folder. If not, download the file.
     if not weights.is_file():
+        if offline and mirror_url is None:
+            raise FileNotFoundError(f'{weights} not in the path, and mothra '
+                                    'is offline. Set a mirror to fetch it.')
         print(f'{weights} not in the path. Downloading...')
         fetch_data(weights)
     # file exists: check if we have the last version; download if not.
     else:
-        if has_internet():
-            local_hash_val = read_hash_local(weights)
+        if offline or (check_once and is_verified(weights)):
+            return None
+        if mirror_url is not None or has_internet():
+            local_hash_val = local_hash(weights)
             url_hash_val = read_hash_from_url(url_hash)
             if local_hash_val != url_hash_val:
                 print('New training data available. Downloading...')
                 fetch_data(weights)
+            else:
+                _record_hash(weights, local_hash_val, verified=True)
 
     return None
 
@@ -71,24 +117,142 @@ def fetch_data(weights):
 
     Parameters
     ----------
-    weights : str
+    weights : str or pathlib.Path
         Weights containing the model file.
 
     Returns
     -------
     None
     """
+    weights = Path(weights)
     url_model, url_hash = _get_model_info(weights)
 
     url_hash_val = read_hash_from_url(url_hash)
-    retrieve(url=url_model,
-             known_hash=f'sha256:{url_hash_val}',
-             fname=weights,
-             path='.')
+    if _is_url(url_model):
+        retrieve(url=url_model,
+                 known_hash=f'sha256:{url_hash_val}',
+                 fname=weights,
+                 path='.')
+    else:
+        _copy_from_folder(url_model, weights, url_hash_val)
+
+    _record_hash(weights, url_hash_val, verified=True)
 
     return None
 
 
+def _copy_from_folder(source, weights, hash_val):
+    """Helper function. Copies weights from a folder, checking their hash."""
+    weights.parent.mkdir(parents=True, exist_ok=True)
+    aux_weights = weights.with_name(f'.{weights.name}.part')
+    shutil.copyfile(source, aux_weights)
+
+    if read_hash_local(aux_weights) != hash_val:
+        aux_weights.unlink()
+        raise ValueError(f'SHA256 hash of {source} does not match its hash '
+                         'file.')
+    os.replace(aux_weights, weights)
+
+    return None
+
+
+def _read_manifest(folder):
+    """Helper function. Reads the manifest in folder; returns an empty
+    manifest if it does not exist or cannot be read."""
+    try:
+        with open(Path(folder) / MANIFEST_FNAME) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _record_hash(weights, hash_val, verified=False):
+    """Helper function. Records size, modification time and hash of weights
+    in the manifest of its folder."""
+    weights = Path(weights)
+    stat = weights.stat()
+
+    manifest = _read_manifest(weights.parent)
+    entry = manifest.get(weights.name, {})
+    same_file = (entry.get('size') == stat.st_size and
+                 entry.get('mtime_ns') == stat.st_mtime_ns and
+                 entry.get('sha256') == hash_val)
+    manifest[weights.name] = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hash_val,
+        'verified': verified or (same_file and entry.get('verified', False)),
+    }
+
+    # writing to an auxiliary file first, so the manifest is never truncated.
+    aux_manifest = weights.parent / f'.{MANIFEST_FNAME}.{os.getpid()}'
+    try:
+        with open(aux_manifest, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(aux_manifest, weights.parent / MANIFEST_FNAME)
+    except OSError:  # read-only folder: the manifest is an optimization.
+        pass
+
+    return None
+
+
+def _manifest_entry(weights):
+    """Helper function. Returns the manifest entry for weights, if it
+    matches the size and modification time of the file."""
+    weights = Path(weights)
+    try:
+        stat = weights.stat()
+    except FileNotFoundError:
+        return None
+
+    entry = _read_manifest(weights.parent).get(weights.name)
+    if (entry and entry.get('size') == stat.st_size and
+            entry.get('mtime_ns') == stat.st_mtime_ns):
+        return entry
+    return None
+
+
+def local_hash(weights):
+    """Returns the SHA256 hash of weights, reading it from the manifest when
+    the file did not change.
+
+    Parameters
+    ----------
+    weights : str or pathlib.Path
+        Path of the file containing weights.
+
+    Returns
+    -------
+    local_hash : str or None
+        SHA256 hash of weights file, or None if file is not found.
+    """
+    entry = _manifest_entry(weights)
+    if entry:
+        return entry['sha256']
+
+    hash_val = read_hash_local(weights)
+    if hash_val is not None:
+        _record_hash(weights, hash_val)
+    return hash_val
+
+
+def is_verified(weights):
+    """Checks if weights were verified against their online hash, and did
+    not change since.
+
+    Parameters
+    ----------
+    weights : str or pathlib.Path
+        Path of the file containing weights.
+
+    Returns
+    -------
+    True if weights were verified; False otherwise.
+    """
+    entry = _manifest_entry(weights)
+    return bool(entry and entry.get('verified'))
+
+
 def has_internet():
     """Small script to check if PC is connected to the internet.
 
@@ -142,13 +306,18 @@ def read_hash_from_url(url_hash):
     Parameters
     ----------
     url_hash : str
-        URL of the hash file for the latest model.
+        URL or path of the hash file for the latest model.
 
     Returns
     -------
     online_hash : str
         SHA256 hash for the file in `url_hash`.
     """
+    if not _is_url(url_hash):
+        with open(url_hash) as hash_file:
+            online_hash, *_ = hash_file.read().split()
+        return online_hash
+
     user_agent = 'Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.9.0.7) Gecko/2009021910 Firefox/3.0.7'
     headers = {'User-Agent':user_agent,}
 
@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import time
+
+from csv import writer
+from mothra import manifest, writing
+
+
+# Types of SQLite columns for the types of the data columns.
+SQL_TYPES = {'string': 'TEXT', 'float64': 'REAL'}
+
+# Value of missing results in exported CSV files, as in the files written
+# by the pipeline.
+MISSING = 'N/A'
+
+
+def _quote(column):
+    """Helper function. Quotes a column name, e.g. 'left_wing (mm)'."""
+    return '"' + column.replace('"', '""') + '"'
+
+
+class ResultStore:
+    """Stores the measurement results of images in a SQLite database, where
+    each version of an image has a single row, replaced when it is processed
+    again.
+
+    Parameters
+    ----------
+    fname : str or pathlib.Path
+        The filename of the database. Its results are kept.
+    run_id : str, optional
+        Identifier of the run writing results.
+    stage : str, optional
+        Stage computed by the run.
+    flush_rows : int, optional
+        Number of rows kept before writing them, in a single transaction.
+    flush_seconds : float, optional
+        Maximum time, in seconds, rows are kept before writing them.
+
+    Notes
+    -----
+    Rows are keyed by image id (the filename of the image) and input
+    fingerprint (its size and modification time; see
+    `manifest.fingerprint`), and also record the run that wrote them, the
+    path of the image and the time it was processed. The fingerprint is
+    not a hash of the contents of the image: copies of an image usually
+    have different fingerprints, and an image changed on disk gets a new
+    row unless its size and modification time are kept. `find` and
+    `export_csv` return the most recent row of each image, unless asked for
+    all of them. The primary key indexes image ids; runs have their own
+    index. Results are typed as in Parquet files (see
+    `writing.DATA_TYPES`).
+
+    The database uses write-ahead logging, so results can be queried while
+    the pipeline runs. Like `writing.ResultWriter`, rows are written in
+    batches, when closing the store, or when added to a full batch.
+    """
+    def __init__(self, fname, run_id=None, stage=None,
+                 flush_rows=writing.FLUSH_ROWS,
+                 flush_seconds=writing.FLUSH_SECONDS):
+        self.fname = fname
+        self.run_id = run_id
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+        self._connection = sqlite3.connect(fname)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+        if run_id is not None:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR IGNORE INTO runs (run_id, stage, started_at) '
+                    'VALUES (?, ?, ?)', (run_id, stage, time.time())
+                    )
+
+    def _create_tables(self):
+        """Helper function. Creates the tables and indexes, if needed."""
+        columns = ', '.join(
+            f'{_quote(column)} {SQL_TYPES[data_type]}'
+            for column, data_type in zip(writing.DATA_COLS,
+                                         writing.DATA_TYPES)
+            )
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, '
+                'stage TEXT, started_at REAL)'
+                )
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS results ({columns}, '
+                'input_fingerprint TEXT NOT NULL, run_id TEXT, '
+                'image_path TEXT, processed_at REAL, '
+                'PRIMARY KEY (image_id, input_fingerprint))'
+                )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_run_id ON results (run_id)'
+                )
+        return None
+
+    def write(self, image_path, row):
+        """Adds the row of results of the image in `image_path`; see
+        `writing.csv_row`."""
+        self._rows.append((image_path, row))
+        if (len(self._rows) >= self.flush_rows or
+                time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+        return None
+
+    def flush(self):
+        """Writes the rows kept, replacing previous results of their images,
+        in a single transaction."""
+        if self._rows:
+            columns = writing.DATA_COLS + ['input_fingerprint', 'run_id',
+                                           'image_path', 'processed_at']
+            updates = ', '.join(f'{_quote(column)} = excluded.{_quote(column)}'
+                                for column in columns[1:])
+            statement = (
+                f"INSERT INTO results ({', '.join(map(_quote, columns))}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                'ON CONFLICT (image_id, input_fingerprint) '
+                f'DO UPDATE SET {updates}'
+                )
+            now = time.time()
+            values = [
+                [writing._typed(value, data_type) for value, data_type
+                 in zip(row, writing.DATA_TYPES)] +
+                [manifest.fingerprint(image_path), self.run_id,
+                 None if image_path is None else os.path.abspath(image_path),
+                 now]
+                for image_path, row in self._rows
+                ]
+            with self._connection:
+                self._connection.executemany(statement, values)
+        self._rows = []
+        self._last_flush = time.monotonic()
+        return None
+
+    def find(self, image_id, history=False):
+        """Returns the results of the image `image_id`, as dictionaries with
+        the data columns, `input_fingerprint`, `run_id`, `image_path` and
+        `processed_at`: the most recent one, or all of them, the most
+        recently processed first, if `history`."""
+        self.flush()
+        query = ('SELECT * FROM results WHERE image_id = ? '
+                 'ORDER BY processed_at DESC, rowid DESC')
+        if not history:
+            query += ' LIMIT 1'
+        cursor = self._connection.execute(query, (image_id,))
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, values)) for values in cursor]
+
+    def export_csv(self, csv_fname, run_id=None, history=False):
+        """Exports results to a CSV file, with the columns of the files
+        written by the pipeline.
+
+        Parameters
+        ----------
+        csv_fname : str or pathlib.Path
+            The filename of the CSV file.
+        run_id : str, optional
+            If given, only results of this run are exported.
+        history : bool, optional
+            If True, all the results of each image are exported; otherwise,
+            only the most recent one.
+
+        Returns
+        -------
+        count : int
+            Number of exported rows.
+        """
+        self.flush()
+        columns = ', '.join(map(_quote, writing.DATA_COLS))
+        where, params = '', ()
+        if run_id is not None:
+            where, params = ' WHERE run_id = ?', (run_id,)
+        query = (f'SELECT {columns}, processed_at, rowid AS row_order '
+                 f'FROM results{where}')
+        if not history:
+            # keeping the most recent row of each image.
+            query = (f'SELECT * FROM (SELECT {columns}, processed_at, '
+                     'rowid AS row_order, ROW_NUMBER() OVER (PARTITION BY '
+                     'image_id ORDER BY processed_at DESC, rowid DESC) AS '
+                     f'recency FROM results{where}) WHERE recency = 1')
+        query = (f'SELECT {columns} FROM ({query}) '
+                 'ORDER BY processed_at, row_order')
+
+        count = 0
+        with open(csv_fname, 'w') as csv_file:
+            write_to_file = writer(csv_file)
+            write_to_file.writerow(writing.DATA_COLS)
+            for values in self._connection.execute(query, params):
+                write_to_file.writerow([MISSING if value is None else value
+                                        for value in values])
+                count += 1
+        return count
+
+    def close(self):
+        """Writes the rows kept and closes the database."""
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
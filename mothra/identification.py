@@ -1,11 +1,14 @@
-from fastai.vision.learner import load_learner
-from pathlib import Path
-from mothra import connection
+import numpy as np
+
+from mothra import registry
 
 
 WEIGHTS_CLASSES = './models/id_gender_test-3classes.pkl'
 CLASSES = {0: 'upside_down', 1: 'female', 2: 'male'}
 
+# Number of images classified in one forward pass.
+BATCH_SIZE = 8
+
 
 def predicting_classes(image_rgb, weights=WEIGHTS_CLASSES):
     """Predicts position and gender of the lepidopteran in `image_rgb`,
@@ -29,22 +32,114 @@ def predicting_classes(image_rgb, weights=WEIGHTS_CLASSES):
 
     Notes
     -----
-    If a string is given in `weights`, it will be converted into a pathlib.Path
-    object.
+    The learner is loaded once per process; see `registry.get_learner`.
     """
-    if isinstance(weights, str):
-        weights = Path(weights)
-
-    connection.download_weights(weights)
-
     # parameters here were defined when training the networks.
-    learner = load_learner(fname=weights)
+    learner = registry.get_learner(weights)
 
     prediction, _, probabilities = learner.predict(image_rgb)
 
     return prediction, probabilities
 
 
+def predicting_classes_batch(images, weights=WEIGHTS_CLASSES):
+    """Predicts position and gender of the lepidopterans in `images` in one
+    forward pass, according to `weights`.
+
+    Parameters
+    ----------
+    images : list of 3D arrays
+        RGB images of lepidopterans.
+    weights : str or pathlib.Path
+        Path of the file containing weights.
+
+    Returns
+    -------
+    predictions : (N,) structured array
+        Array with fields `prediction`, the predicted class for each image,
+        and `probabilities`, the probabilities returned by the network for
+        each class, in the order of `CLASSES`.
+    """
+    learner = registry.get_learner(weights)
+    vocab = list(learner.dls.vocab)
+
+    dl = learner.dls.test_dl(images, bs=len(images), num_workers=0)
+    with learner.no_bar():
+        probabilities, _ = learner.get_preds(dl=dl)
+    probabilities = np.asarray(probabilities, dtype='float64')
+
+    dtype = np.dtype([('prediction', f'U{max(len(cls) for cls in vocab)}'),
+                      ('probabilities', 'float64', (len(vocab),))])
+    predictions = np.empty(len(images), dtype=dtype)
+    predictions['prediction'] = np.take(vocab, probabilities.argmax(axis=1))
+    predictions['probabilities'] = probabilities
+
+    return predictions
+
+
+def _position_and_gender(prediction):
+    """Helper function. Returns position and gender from the class
+    predicted by the network."""
+    if prediction == 'down':
+        return 'upside_down', 'N/A'
+    return 'right-side_up', prediction
+
+
+def main_batch(images, batch_size=BATCH_SIZE, errors=False):
+    """Identifies position and gender of the lepidopterans in `images`,
+    classifying them in batches.
+
+    Parameters
+    ---------
+    images : list of 3D arrays
+        RGB images of the entire pictures.
+    batch_size : int, optional
+        Maximum number of images classified in one forward pass.
+    errors : bool, optional
+        If True, the exception raised while classifying an image is returned
+        in its place, and the other images are still classified.
+
+    Returns
+    -------
+    results : list of tuples
+        (position, gender, probabilities) for each image, as returned by
+        `main`, or the exception raised for it.
+    """
+    print(f'Identifying position and gender for {len(images)} images...')
+    results = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        try:
+            results.extend(_identify_batch(batch))
+        except Exception:
+            if not errors:
+                raise
+            # classifying the images one by one, so that only the ones
+            # failing are reported.
+            for image in batch:
+                try:
+                    results.extend(_identify_batch([image]))
+                except Exception as exc:
+                    results.append(exc)
+
+    return results
+
+
+def _identify_batch(batch):
+    """Helper function. Returns (position, gender, probabilities) for each
+    image in `batch`, classified in one forward pass."""
+    try:
+        predictions = predicting_classes_batch(batch, weights=WEIGHTS_CLASSES)
+    except AttributeError:  # 'Compose' object has no attribute 'is_check_args'
+        print(f'* Could not calculate position and gender')
+        return [('N/A', 'N/A', 'N/A')] * len(batch)
+
+    probabilities = np.round(predictions['probabilities'], decimals=4)
+    return [(*_position_and_gender(prediction), probs)
+            for prediction, probs in zip(predictions['prediction'],
+                                         probabilities.tolist())]
+
+
 def main(image_rgb):
     """Identifies position and gender of the lepidopteran in `image_rgb`.
 
@@ -72,12 +167,7 @@ def main(image_rgb):
         probabilities = [round(prob, ndigits=4)
                          for prob in probabilities.tolist()]
 
-        if prediction == 'down':
-            position = 'upside_down'
-            gender = 'N/A'
-        else:
-            position = 'right-side_up'
-            gender = prediction
+        position, gender = _position_and_gender(prediction)
         print(f'* Position: {position}\n* Gender: {gender}')\
 
         print('Probabilities:')
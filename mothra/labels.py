@@ -0,0 +1,135 @@
+import numpy as np
+import scipy as sp
+
+from mothra import codec
+
+
+# Labels of the classes segmented by the U-net.
+BACKGROUND = 0
+TAGS = 1
+RULER = 2
+LEPIDOP = 3
+
+# Classes returned when iterating over a LabelMap.
+CLASSES = (TAGS, RULER, LEPIDOP)
+
+
+class LabelMap:
+    """Segmentation of an image in classes, stored as a single uint8 label
+    image at the resolution of the U-net.
+
+    Parameters
+    ----------
+    labels : (m, n) ndarray of uint8
+        Class of each pixel, at the resolution of the U-net.
+    shape : (M, N) tuple
+        Shape of the segmented image, at full resolution.
+
+    Notes
+    -----
+    Binary images and bounding boxes are returned at full resolution. Binary
+    images are computed on first use and kept, but are not pickled; pickles
+    (e.g. cached results) only contain the label image, encoded by
+    `codec.encode_mask`.
+
+    For compatibility with functions returning one binary image per class,
+    iterating over a LabelMap yields the binary images for tags, ruler and
+    lepidopteran.
+    """
+    def __init__(self, labels, shape):
+        self.labels = np.asarray(labels, dtype=np.uint8)
+        self.shape = tuple(shape[:2])
+        self._masks = {}
+        self._bboxes = None
+
+    @classmethod
+    def from_masks(cls, tags_bin, ruler_bin, lepidop_bin, shape):
+        """Builds a LabelMap from binary images at the resolution of the
+        U-net. Where binary images overlap, the last one wins."""
+        labels = np.zeros(lepidop_bin.shape, dtype=np.uint8)
+        for label, image_bin in zip(CLASSES, (tags_bin, ruler_bin,
+                                              lepidop_bin)):
+            labels[image_bin] = label
+        return cls(labels, shape)
+
+    def mask(self, label):
+        """Returns the binary image of class `label`, at full resolution."""
+        if label not in self._masks:
+            self._masks[label] = _upscale_mask(self.labels == label,
+                                               self.shape)
+        return self._masks[label]
+
+    def bbox(self, label):
+        """Returns the bounding box (min_row, min_col, max_row, max_col) of
+        class `label` at full resolution, or None if the class is absent."""
+        if self._bboxes is None:
+            # bounding boxes of all classes, in one pass.
+            self._bboxes = {}
+            for idx, box in enumerate(sp.ndimage.find_objects(self.labels)):
+                if box is None:
+                    continue
+                (min_row, max_row), (min_col, max_col) = [
+                    _full_range(box[axis], self.labels.shape[axis],
+                                self.shape[axis]) for axis in range(2)
+                    ]
+                self._bboxes[idx + 1] = (min_row, min_col, max_row, max_col)
+        return self._bboxes.get(label)
+
+    def release(self, label=None):
+        """Forgets the binary images computed for `label`, or for all
+        classes if None."""
+        if label is None:
+            self._masks.clear()
+        else:
+            self._masks.pop(label, None)
+        return None
+
+    def __iter__(self):
+        return (self.mask(label) for label in CLASSES)
+
+    def __eq__(self, other):
+        if not isinstance(other, LabelMap):
+            return NotImplemented
+        return (self.shape == other.shape and
+                np.array_equal(self.labels, other.labels))
+
+    def __getstate__(self):
+        return {'labels': codec.encode_mask(self.labels), 'shape': self.shape}
+
+    def __setstate__(self, state):
+        self.__init__(codec.decode_mask(state['labels']), state['shape'])
+
+
+def _source_indices(size, size_full):
+    """Helper function. Returns the index, along an axis of `size` pixels,
+    sampled by each of the `size_full` pixels of the rescaled axis."""
+    return ((np.arange(size_full) + 0.5) * (size / size_full)).astype(int)
+
+
+def _full_range(box, size, size_full):
+    """Helper function. Returns the (start, stop) range of pixels sampling
+    the slice `box` when rescaling an axis from `size` to `size_full`."""
+    source = _source_indices(size, size_full)
+    start, stop = np.searchsorted(source, [box.start, box.stop])
+    return int(start), int(stop)
+
+
+def _upscale_mask(mask, shape):
+    """Helper function. Rescales a binary mask to the (rows, cols) in shape
+    with nearest neighbor sampling, only within the bounding box of the
+    mask."""
+    mask_full = np.zeros(shape[:2], dtype=bool)
+    if not mask.any():
+        return mask_full
+
+    bbox = sp.ndimage.find_objects(mask.astype(np.uint8))[0]
+    region, sources = [], []
+    for axis, box in enumerate(bbox):
+        start, stop = _full_range(box, mask.shape[axis], shape[axis])
+        region.append(slice(start, stop))
+        sources.append(_source_indices(mask.shape[axis],
+                                       shape[axis])[start:stop])
+
+    mask_full[tuple(region)] = mask[np.ix_(*sources)]
+
+    return mask_full
@@ -0,0 +1,177 @@
+import json
+import os
+import uuid
+
+
+# Name of the manifest in the output folder.
+MANIFEST_NAME = 'manifest.jsonl'
+
+# Version of the manifest format.
+FORMAT_VERSION = 1
+
+# Status of processed images.
+DONE = 'done'
+FAILED = 'failed'
+
+
+def fingerprint(image_path):
+    """Returns a fingerprint of an input image, from its size and
+    modification time.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the input image.
+
+    Returns
+    -------
+    fingerprint : str or None
+        Fingerprint of the image, or None if it cannot be read.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def new_run_id():
+    """Returns a unique identifier for a run of the pipeline."""
+    return uuid.uuid4().hex
+
+
+class Manifest:
+    """Record of the images processed by a run of the pipeline, so that it
+    can be resumed after a crash.
+
+    Parameters
+    ----------
+    path : str
+        Path of the manifest file.
+
+    Attributes
+    ----------
+    run : dict
+        Description of the run: `run_id` (a unique identifier), `stage`,
+        `results` (path of the results file, or None) and `format` (format
+        of the results file).
+    entries : dict
+        Last record of each image, keyed by absolute image path; see
+        `record`.
+
+    Notes
+    -----
+    The manifest is a JSON lines file: a first line describing the run,
+    followed by one line per processed image, written and flushed to disk
+    as soon as the image is processed. A line cut by a crash is ignored when
+    the manifest is loaded.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.run = {}
+        self.entries = {}
+
+    @classmethod
+    def create(cls, path, stage, results=None, file_format='csv',
+               run_id=None):
+        """Starts the manifest of a new run, replacing any previous one. The
+        run gets a new identifier, unless `run_id` is given; see
+        `new_run_id`."""
+        manifest = cls(path)
+        manifest.run = {'version': FORMAT_VERSION,
+                        'run_id': run_id or new_run_id(), 'stage': stage,
+                        'results': None if results is None else str(results),
+                        'format': file_format}
+        with open(path, 'w') as manifest_file:
+            manifest._write(manifest_file, manifest.run)
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        """Loads the manifest of a previous run.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a manifest, or has an unknown version.
+        """
+        manifest = cls(path)
+        with open(path) as manifest_file:
+            text = manifest_file.read()
+        # ending a line cut by a crash, so that new records start a line.
+        if text and not text.endswith('\n'):
+            with open(path, 'a') as manifest_file:
+                manifest_file.write('\n')
+
+        lines = text.splitlines()
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:  # cut by a crash.
+                continue
+        if not records or records[0].get('version') != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a manifest of mothra, or has an '
+                             'unknown version')
+
+        manifest.run = records[0]
+        for record in records[1:]:
+            manifest.entries[record['image']] = record
+        return manifest
+
+    def record(self, image_path, status, row=None, error=None):
+        """Records that an image was processed.
+
+        Parameters
+        ----------
+        image_path : str
+            Path of the input image.
+        status : str
+            `DONE` or `FAILED`.
+        row : list, optional
+            Row written in the results file for the image, if any.
+        error : str, optional
+            Error message, for failed images.
+
+        Returns
+        -------
+        None
+        """
+        entry = {'image': os.path.abspath(image_path),
+                 'fingerprint': fingerprint(image_path),
+                 'status': status,
+                 'row': None if row is None else [str(value)
+                                                   for value in row],
+                 'error': error}
+        self.entries[entry['image']] = entry
+        with open(self.path, 'a') as manifest_file:
+            self._write(manifest_file, entry)
+        return None
+
+    def completed(self, image_paths):
+        """Returns the images in `image_paths` processed successfully, which
+        did not change since then."""
+        completed = []
+        for image_path in image_paths:
+            entry = self.entries.get(os.path.abspath(image_path))
+            if (entry is not None and entry['status'] == DONE and
+                    entry['fingerprint'] == fingerprint(image_path)):
+                completed.append(image_path)
+        return completed
+
+    def results(self, image_paths):
+        """Returns the (image_path, row) results recorded for `image_paths`,
+        in the order they were processed."""
+        wanted = {os.path.abspath(image_path) for image_path in image_paths}
+        return [(image, entry['row']) for image, entry in self.entries.items()
+                if image in wanted and entry['row'] is not None]
+
+    @staticmethod
+    def _write(manifest_file, record):
+        """Helper function. Writes a record, making sure it reaches the
+        disk."""
+        manifest_file.write(json.dumps(record) + '\n')
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+        return None
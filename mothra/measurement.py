@@ -1,10 +1,6 @@
 import numpy as np
-from joblib import Memory
 
-from .cache import memory
 
-
-@memory.cache(ignore=['axes'])
 def main(points_interest, T_space, axes=None):
     ''' Calculates the length and draws the lines for length
     of the lepidopteran wings.
@@ -65,7 +65,8 @@ def _generate_parser():
     parser.add_argument('-s', '--stage',
                         type=str,
                         help="Stage name: 'binarization', 'ruler_detection',\
-                        'measurements'",
+                        'measurements', or one of the stages in\
+                        mothra.stages (e.g. 'segment', 'tracing')",
                         required=False,
                         default='measurements')
 
@@ -81,27 +82,151 @@ def _generate_parser():
                         help='Dots per inch of the saved figures',
                         default=300)
 
+    parser.add_argument('--plot_workers',
+                        type=int,
+                        help='Number of processes saving plots, while the\
+                        next images are processed. 0 saves plots before\
+                        processing the next images',
+                        default=2)
+
     # CSV output path
     parser.add_argument('-csv', '--path_csv',
                         type=str,
                         help='Path of the resulting csv file',
                         default='outputs/results.csv')
 
-    # Disable cache
+    parser.add_argument('--results_format',
+                        type=str,
+                        choices=['csv', 'parquet', 'sqlite'],
+                        default='csv',
+                        help='Format of the results file: CSV, Parquet\
+                        with typed columns (requires pyarrow), or a SQLite\
+                        database keeping the results of previous runs')
+
+    # Batch size
+    parser.add_argument('-bs', '--batch_size',
+                        type=int,
+                        help='Number of images processed together, in\
+                        chunks: the segmentation and classification\
+                        networks see each chunk in one forward pass, and\
+                        workers process and retry whole chunks',
+                        default=8)
+
+    # Worker processes
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        help='Number of processes working on images at the\
+                        same time. Each one loads its own networks',
+                        default=1)
+
+    parser.add_argument('--completion_order',
+                        action='store_true',
+                        help='With several workers, write results as soon as\
+                        images are processed, instead of in input order')
+
+    parser.add_argument('--parallel_wings',
+                        action='store_true',
+                        help='Trace both wings of each image at the same\
+                        time, in two threads. Useful when processing few\
+                        images')
+
+    parser.add_argument('--reuse_calibration',
+                        action='store_true',
+                        help='Reuse the ruler calibration of a previous image\
+                        taken by the same camera, with the ruler at the same\
+                        place, if the ticks of the ruler match it')
+
+    # Decoding and prefetching
+    parser.add_argument('--draft_decode',
+                        action='store_true',
+                        help='Gives reduced resolution images to the\
+                        networks. JPEG images are decoded at reduced\
+                        resolution unless the ruler is measured; then they\
+                        are decoded at full resolution, and reduced')
+
+    parser.add_argument('--prefetch',
+                        type=int,
+                        help='Number of images decoded ahead, while others\
+                        are processed. 0 disables prefetching',
+                        default=8)
+
+    parser.add_argument('--prefetch_threads',
+                        type=int,
+                        help='Number of threads decoding images',
+                        default=2)
+
+    parser.add_argument('--prefetch_memory',
+                        type=int,
+                        help='Maximum memory, in MB, taken by decoded images\
+                        waiting to be processed. 0 means no limit',
+                        default=2048)
+
+    # Weights verification
+    parser.add_argument('--offline',
+                        action='store_true',
+                        help='Do not use the internet: weights are not checked\
+                        for updates, and missing weights are only fetched\
+                        from --mirror_url')
+
+    parser.add_argument('--check_weights_once',
+                        action='store_true',
+                        help='Do not check for updates of weights that were\
+                        verified before')
+
+    parser.add_argument('--mirror_url',
+                        type=str,
+                        help='Folder or URL containing the weights and their\
+                        SHA256SUM-<name> files, used instead of the mothra\
+                        repository',
+                        default=None)
+
+    # Resuming
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='Resume a previous run with the same output\
+                        folder, skipping the images it processed and\
+                        appending to its CSV file')
+
+    # Timings
+    parser.add_argument('--timings',
+                        action='store_true',
+                        help='Print the time spent in each stage of the\
+                        pipeline')
+
+    # Enable cache
     parser.add_argument('--cache',
                         action='store_true',
-                        help='Enable computation cache (useful when developing algorithms)')
+                        help='Enable computation cache (useful when developing\
+                        algorithms, or when processing images again)')
+
+    parser.add_argument('--cache_size',
+                        type=int,
+                        default=10240,
+                        help='Maximum size of the cache, in MB; the least\
+                        recently used results are removed to stay below it.\
+                        0 means no limit')
+
+    parser.add_argument('--cache_items',
+                        type=int,
+                        default=0,
+                        help='Maximum number of cached results; 0 means no\
+                        limit')
 
     args = parser.parse_args()
 
     return args
 
 
-def initialize_path(output_folder):
+def initialize_path(output_folder, keep=()):
+    """Empties the output folder, or creates it, keeping the files in
+    `keep` (e.g. a results database; see `writing.kept_files`)."""
+    keep = {os.path.abspath(fname) for fname in keep}
     if os.path.exists(output_folder):
         oldList = os.listdir(output_folder)
         for oldFile in oldList:
-            os.remove(output_folder+"/"+oldFile)
+            oldPath = output_folder+"/"+oldFile
+            if os.path.abspath(oldPath) not in keep:
+                os.remove(oldPath)
     else:
         os.mkdir(output_folder)
     return None
@@ -1,4 +1,21 @@
 import matplotlib.pyplot as plt
+import numpy as np
+
+
+# Size of the figures, in inches, and their grid of subplots (rows, columns)
+# for each plot level; regular plots have one column per stage.
+FIGURE_SIZES = {1: (12, 5), 2: (6.4, 4.8)}
+GRIDS = {1: None, 2: (3, 3)}
+
+# Axes used by detailed plots, for each number of stages: ax_main, ax_bin,
+# ax_poi, ax_structure, ax_signal, ax_fourier, ax_tags.
+DETAILED_SLOTS = {1: (True, False, False, True, True, True, False),
+                  2: (True, True, False, True, True, True, True),
+                  3: (True, True, True, True, True, True, True)}
+
+# Methods of Axes recorded by PlotAxes.
+DRAWING_METHODS = ('add_patch', 'axhline', 'axvline', 'fill_between',
+                   'imshow', 'plot', 'scatter', 'set_title', 'text')
 
 
 def create_layout(n_stages, plot_level):
@@ -22,7 +39,8 @@ def create_layout(n_stages, plot_level):
 
     elif plot_level == 1:
         ncols = n_stages
-        fig, ax = plt.subplots(nrows=1, ncols=ncols, figsize=(12, 5))
+        fig, ax = plt.subplots(nrows=1, ncols=ncols,
+                               figsize=FIGURE_SIZES[plot_level])
         if n_stages == 1:
             ax = [ax]
         ax_list = []
@@ -31,22 +49,135 @@ def create_layout(n_stages, plot_level):
         return ax_list + [None] * (7 - n_stages)
 
     elif plot_level == 2:
-        shape = (3, 3)
-        ax_main = plt.subplot2grid(shape, (0, 0))
-        ax_structure = plt.subplot2grid(shape, (0, 1))
-        ax_signal = plt.subplot2grid(shape, (1, 0), colspan=2)
-        ax_fourier = plt.subplot2grid(shape, (2, 0), colspan=2)
-
-        ax_tags = plt.subplot2grid(shape, (0, 2))
-        ax_bin = plt.subplot2grid(shape, (1, 2))
-        ax_poi = plt.subplot2grid(shape, (2, 2))
-        plt.tight_layout()
-        if n_stages == 1:
-            return [ax_main, None, None, ax_structure, ax_signal, ax_fourier,
-                    None]
-        elif n_stages == 2:
-            return [ax_main, ax_bin, None, ax_structure, ax_signal, ax_fourier,
-                    ax_tags]
-        elif n_stages == 3:
-            return [ax_main, ax_bin, ax_poi, ax_structure, ax_signal,
-                    ax_fourier, ax_tags]
+        # creating a new figure, since layouts for several images may exist
+        # at the same time.
+        fig = plt.figure(figsize=FIGURE_SIZES[plot_level])
+        shape = GRIDS[plot_level]
+        ax_main = plt.subplot2grid(shape, (0, 0), fig=fig)
+        ax_structure = plt.subplot2grid(shape, (0, 1), fig=fig)
+        ax_signal = plt.subplot2grid(shape, (1, 0), colspan=2, fig=fig)
+        ax_fourier = plt.subplot2grid(shape, (2, 0), colspan=2, fig=fig)
+
+        ax_tags = plt.subplot2grid(shape, (0, 2), fig=fig)
+        ax_bin = plt.subplot2grid(shape, (1, 2), fig=fig)
+        ax_poi = plt.subplot2grid(shape, (2, 2), fig=fig)
+        fig.tight_layout()
+        axes = [ax_main, ax_bin, ax_poi, ax_structure, ax_signal, ax_fourier,
+                ax_tags]
+        return [ax if used else None
+                for ax, used in zip(axes, DETAILED_SLOTS[n_stages])]
+
+
+def record_layout(n_stages, plot_level, dpi):
+    """Creates PlotAxes recording the figures of an image, in the same
+    layout as `create_layout`.
+
+    Parameters
+    ----------
+    n_stages : int
+        length of pipeline process
+    plot_level : int
+        0 : no plotting
+        1 : regular plots
+        2 : detailed plots
+    dpi : int
+        Dots per inch of the saved figure.
+
+    Returns
+    -------
+    axes : list of PlotAxes
+        Recorded Axes, or None where `create_layout` has no Axes. Draw and
+        save them with `render`.
+    """
+    if plot_level == 0:
+        return None
+
+    width, height = FIGURE_SIZES[plot_level]
+    rows, cols = GRIDS[plot_level] or (1, n_stages)
+    # images are never shown larger than a cell of the grid.
+    max_shape = (int(height * dpi / rows), int(width * dpi / cols))
+    if plot_level == 1:
+        slots = [True] * n_stages + [False] * (7 - n_stages)
+    else:
+        slots = DETAILED_SLOTS[n_stages]
+    return [PlotAxes(max_shape) if used else None for used in slots]
+
+
+def render(axes, n_stages, plot_level, output_path, dpi):
+    """Draws the figure recorded by `record_layout`, and saves it.
+
+    Parameters
+    ----------
+    axes : list of PlotAxes
+        Recorded Axes, as returned by `record_layout`.
+    n_stages : int
+        length of pipeline process
+    plot_level : int
+        1 : regular plots
+        2 : detailed plots
+    output_path : str
+        Path of the saved figure.
+    dpi : int
+        Dots per inch of the saved figure.
+
+    Returns
+    -------
+    None
+    """
+    layout = create_layout(n_stages, plot_level)
+    figure = layout[0].figure
+    try:
+        for ax, recorded in zip(layout, axes):
+            if recorded is not None:
+                recorded.replay(ax)
+        figure.savefig(output_path, dpi=dpi)
+    finally:
+        plt.close(figure)
+    return None
+
+
+class PlotAxes:
+    """Records the drawing calls made on an Axes, so that figures are drawn
+    later, in another process; see `render`.
+
+    Parameters
+    ----------
+    max_shape : tuple of int
+        Maximum (rows, columns) of the images shown, in pixels. Larger
+        images are downsampled, keeping their coordinates, so that recordings
+        stay small.
+
+    Notes
+    -----
+    Only the methods in `DRAWING_METHODS` are recorded; their arguments must
+    be picklable.
+    """
+    def __init__(self, max_shape):
+        self.max_shape = max_shape
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name not in DRAWING_METHODS:
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return record
+
+    def imshow(self, image, **kwargs):
+        """Records an image, downsampled to the resolution it is shown
+        with."""
+        image = np.asarray(image)
+        rows, cols = image.shape[:2]
+        kwargs.setdefault('extent', (-0.5, cols - 0.5, rows - 0.5, -0.5))
+        step = max(1, int(max(rows / self.max_shape[0],
+                              cols / self.max_shape[1])))
+        if step > 1:
+            image = np.ascontiguousarray(image[::step, ::step])
+        self.calls.append(('imshow', (image,), kwargs))
+
+    def replay(self, ax):
+        """Draws the recorded calls on the Axes `ax`."""
+        for name, args, kwargs in self.calls:
+            getattr(ax, name)(*args, **kwargs)
+        return None
@@ -0,0 +1,79 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Number of items loaded ahead of the one being processed.
+DEPTH = 2
+
+# Number of threads loading items.
+THREADS = 2
+
+
+def prefetch(items, load, depth=DEPTH, threads=THREADS, max_bytes=None):
+    """Loads items in a pool of threads, ahead of their consumption.
+
+    Parameters
+    ----------
+    items : iterable
+        Items to be loaded (e.g. paths of images).
+    load : callable
+        Function receiving an item and returning its loaded value (e.g. an
+        image).
+    depth : int, optional
+        Maximum number of items being loaded or waiting to be consumed.
+    threads : int, optional
+        Number of threads loading items.
+    max_bytes : int, optional
+        If given, no more items are loaded while the values waiting to be
+        consumed take at least `max_bytes` (as given by their `nbytes`, or
+        the `nbytes` of their elements for tuples).
+
+    Yields
+    ------
+    item : object
+        The input item, in input order.
+    value : object
+        The value returned by `load`, or None if it raised an exception.
+    error : Exception or None
+        The exception raised by `load`, if any.
+
+    Notes
+    -----
+    The memory used is bounded by `depth` loaded values; `max_bytes` stops
+    loading earlier when the values are large.
+    """
+    items = iter(items)
+    queue = deque()
+
+    def waiting_bytes():
+        return sum(_nbytes(future.result()) for _, future in queue
+                   if future.done() and future.exception() is None)
+
+    def fill(pool):
+        while len(queue) < max(depth, 1):
+            if max_bytes is not None and queue and waiting_bytes() >= max_bytes:
+                break
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            queue.append((item, pool.submit(load, item)))
+
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        fill(pool)
+        while queue:
+            item, future = queue.popleft()
+            try:
+                value, error = future.result(), None
+            except Exception as exc:
+                value, error = None, exc
+            fill(pool)
+            yield item, value, error
+
+
+def _nbytes(value):
+    """Helper function. Returns the memory used by `value`, or by its
+    elements if it is a tuple."""
+    if isinstance(value, tuple):
+        return sum(getattr(element, 'nbytes', 0) for element in value)
+    return getattr(value, 'nbytes', 0)
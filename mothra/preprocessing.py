@@ -1,4 +1,8 @@
+import numpy as np
+
 from exif import Image
+from PIL import Image as PILImage
+from skimage.io import imread
 from skimage.transform import rotate
 from skimage.util import img_as_ubyte
 
@@ -31,6 +35,133 @@ def auto_rotate(image_rgb, image_path):
     return img_as_ubyte(image_rgb)
 
 
+def load_image(image_path, orient=False):
+    """Reads an image, rotating it according to EXIF data if requested.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the input image.
+    orient : bool, optional
+        If True, the image is rotated according to its EXIF data; see
+        `auto_rotate`.
+
+    Returns
+    -------
+    image_rgb : 3D array
+        RGB image of the lepidopteran, with ruler and tags.
+    """
+    image_rgb = imread(image_path)
+
+    # check image orientation and untilt it, if necessary.
+    if orient:
+        image_rgb = auto_rotate(image_rgb, image_path)
+
+    return image_rgb
+
+
+def load_image_draft(image_path, size, orient=False):
+    """Reads a reduced resolution version of an image, decoding only as much
+    of it as needed to keep it at least as large as `size`.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the input image.
+    size : (width, height) tuple
+        Smallest size wanted for the image.
+    orient : bool, optional
+        If True, the image is rotated according to its EXIF data; see
+        `auto_rotate`.
+
+    Returns
+    -------
+    image_small : 3D array
+        RGB image of the lepidopteran, with ruler and tags, at reduced
+        resolution.
+    shape : (rows, cols) tuple
+        Shape of the image at full resolution, after rotation.
+
+    Notes
+    -----
+    JPEG images are decoded at 1/2, 1/4 or 1/8 of their resolution, which is
+    much faster than decoding them at full resolution. Other formats are
+    decoded at full resolution.
+    """
+    with PILImage.open(image_path) as image:
+        shape = (image.height, image.width)
+        image.draft('RGB', size)
+        image_small = np.asarray(image.convert('RGB'))
+
+    # check image orientation and untilt it, if necessary.
+    if orient:
+        angle = read_angle(image_path)
+        if angle not in (None, 0):
+            image_small = img_as_ubyte(rotate(image_small, angle=angle,
+                                              resize=True))
+            if angle in (90, 270):
+                shape = shape[::-1]
+
+    return image_small, shape
+
+
+def reduce_image(image_rgb, size):
+    """Reduces the resolution of an image as `load_image_draft` does, by the
+    largest factor of 2, 4 or 8 that keeps it at least as large as `size`.
+
+    Parameters
+    ----------
+    image_rgb : 3D array
+        RGB image of the lepidopteran, with ruler and tags.
+    size : (width, height) tuple
+        Smallest size wanted for the image.
+
+    Returns
+    -------
+    image_small : 3D array
+        RGB image at reduced resolution, averaging blocks of pixels; the
+        image itself if it cannot be reduced.
+
+    Notes
+    -----
+    Used when the full resolution image is decoded anyway, e.g. to measure
+    the ruler: reducing it is much faster than decoding it again.
+    """
+    rows, cols = image_rgb.shape[:2]
+    factor = max((factor for factor in (2, 4, 8)
+                  if cols // factor >= size[0] and rows // factor >= size[1]),
+                 default=1)
+    if factor == 1:
+        return image_rgb
+    return np.asarray(PILImage.fromarray(image_rgb).reduce(factor))
+
+
+def read_camera(image_path):
+    """Read camera make and model from image on path, according to EXIF
+    data.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the input image.
+
+    Returns
+    -------
+    camera : (make, model) tuple or None
+        Camera make and model, or None if EXIF data cannot be read.
+    """
+    try:
+        with PILImage.open(image_path) as image:
+            exif = image.getexif()
+    except OSError:
+        return None
+
+    # EXIF tags 271 and 272 contain the make and model.
+    if 271 not in exif and 272 not in exif:
+        return None
+    return (exif.get(271), exif.get(272))
+
+
 def read_angle(image_path):
     """Read angle from image on path, according to EXIF data.
 
@@ -0,0 +1,115 @@
+from fastai.vision.learner import load_learner
+from pathlib import Path
+from mothra import connection
+
+
+# loaded learners, keyed by (resolved weights path, SHA256 of weights).
+_LEARNERS = {}
+
+# last known fingerprint of each weights file, keyed by resolved path. Each
+# value is (size, mtime_ns, sha256), so the file is only rehashed if it
+# changed on disk.
+_FINGERPRINTS = {}
+
+
+def _weights_key(weights):
+    """Helper function. Returns the registry key for `weights`, rehashing
+    the file only if its size or modification time changed."""
+    weights = Path(weights).resolve()
+    stat = weights.stat()
+
+    size, mtime_ns, sha256 = _FINGERPRINTS.get(weights, (None, None, None))
+    if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        sha256 = connection.local_hash(weights)
+        _FINGERPRINTS[weights] = (stat.st_size, stat.st_mtime_ns, sha256)
+
+    return (weights, sha256)
+
+
+def get_learner(weights):
+    """Returns the learner for `weights`, loading it on first use.
+
+    Parameters
+    ----------
+    weights : str or pathlib.Path
+        Path of the file containing weights.
+
+    Returns
+    -------
+    learner : fastai.learner.Learner
+        Learner loaded from `weights`. The same object is returned on
+        subsequent calls, for the life of the process.
+
+    Notes
+    -----
+    Weights are downloaded or updated only when the learner is not in the
+    registry yet. If the weights file changes on disk, the learner is
+    reloaded.
+    """
+    weights = Path(weights)
+
+    if not weights.is_file() or weights.resolve() not in _FINGERPRINTS:
+        connection.download_weights(weights)
+
+    key = _weights_key(weights)
+    learner = _LEARNERS.get(key)
+    if learner is None:
+        # dropping learners loaded from a previous version of these weights.
+        release(weights)
+        print(f'Loading {weights}...')
+        learner = load_learner(fname=weights)
+        _LEARNERS[key] = learner
+
+    return learner
+
+
+def warm_up(*weights):
+    """Loads the learners for all `weights` in advance.
+
+    Parameters
+    ----------
+    *weights : str or pathlib.Path
+        Paths of the files containing weights.
+
+    Returns
+    -------
+    None
+    """
+    for fname in weights:
+        get_learner(fname)
+    return None
+
+
+def release(weights=None):
+    """Removes learners from the registry, so they can be garbage collected.
+
+    Parameters
+    ----------
+    weights : str or pathlib.Path, optional
+        Path of the file containing weights. If None, all learners are
+        released.
+
+    Returns
+    -------
+    None
+    """
+    if weights is None:
+        _LEARNERS.clear()
+        return None
+
+    weights = Path(weights).resolve()
+    for key in [key for key in _LEARNERS if key[0] == weights]:
+        del _LEARNERS[key]
+
+    return None
+
+
+def loaded():
+    """Returns the keys of the learners currently in the registry.
+
+    Returns
+    -------
+    keys : list of (pathlib.Path, str)
+        Resolved weights path and SHA256 hash of each loaded learner.
+    """
+    return list(_LEARNERS)
@@ -1,12 +1,9 @@
 from skimage.filters import threshold_otsu
-from skimage.measure import regionprops
 from skimage import color
 import numpy as np
-from scipy import ndimage as ndi
-from joblib import Memory
 import matplotlib.patches as patches
+from mothra import components
 
-from .cache import memory
 
 RULER_TOP = 0.7
 RULER_LEFT = 0.2
@@ -14,6 +11,28 @@ RULER_RIGHT = 0.4
 FIRST_INDEX_THRESHOLD = 0.9
 LINE_WIDTH = 40
 
+# Weights of red, green and blue in the luminance of uint8 images, in
+# 1/256 units; close to the ones used by skimage.color.rgb2gray.
+LUMINANCE_WEIGHTS = (54, 183, 19)
+
+# Fraction of the image size to which ruler positions are rounded, when
+# comparing rulers of different images.
+CALIBRATION_GRID = 0.02
+
+# Minimum fraction of the ticks frequency magnitude of a previous image for
+# its calibration to be reused.
+CALIBRATION_TOLERANCE = 0.8
+
+# Maximum relative difference between the number of ticks of a previous
+# image and of the current one for the calibration to be reused.
+CALIBRATION_TICKS_TOLERANCE = 0.05
+
+# Calibrations of previous images, keyed by `calibration_key`, as
+# (t_space, (magnitude at the ticks frequency, number of ticks)); None
+# disables reusing them.
+# Set by the pipeline.
+calibrations = None
+
 
 def binarize_ruler(ruler_rgb):
     """Returns a binarized version of the image.
@@ -32,14 +51,38 @@ def binarize_ruler(ruler_rgb):
     -----
     This performs differently than the U-net; while the U-net returns the
     location of the ruler, this returns the binarized ruler and its elements.
+
+    Images of type uint8 are binarized with integers only, using
+    `LUMINANCE_WEIGHTS` and a 256 bin histogram; other images are converted
+    to float.
     """
-    gray = color.rgb2gray(ruler_rgb)
-    thresh = threshold_otsu(gray)
+    if ruler_rgb.dtype == np.uint8:
+        gray = _luminance_uint8(ruler_rgb)
+        counts = np.bincount(gray.ravel(), minlength=256)
+        thresh = threshold_otsu(hist=(counts, np.arange(256)))
+    else:
+        gray = color.rgb2gray(ruler_rgb)
+        thresh = threshold_otsu(gray)
     ruler = gray > thresh
 
     return ruler
 
 
+def _luminance_uint8(image_rgb):
+    """Helper function. Returns the luminance of an uint8 RGB image as
+    uint8, computed with integers."""
+    # weights add up to 256, so sums fit in uint16; the type is explicit,
+    # as NumPy 1.x keeps uint8 when multiplying by scalars.
+    gray = np.multiply(image_rgb[..., 0], LUMINANCE_WEIGHTS[0],
+                       dtype=np.uint16)
+    for channel in (1, 2):
+        gray += np.multiply(image_rgb[..., channel],
+                            LUMINANCE_WEIGHTS[channel], dtype=np.uint16)
+    gray >>= 8
+
+    return gray.astype(np.uint8)
+
+
 def remove_numbers(focus):
     """Returns a ruler image with the numbers stripped away.
 
@@ -58,16 +101,15 @@ def remove_numbers(focus):
     The numbers are stripped away to improve the results of the Fourier
     transform, which will process the ruler ticks.
     """
-    focus_numbers_markers, _ = ndi.label(focus, ndi.generate_binary_structure(2, 1))
-    focus_numbers_regions = regionprops(focus_numbers_markers)
-    focus_numbers_region_areas = [region.filled_area for region in focus_numbers_regions]
+    regions = components.Components(focus, connectivity=1)
+    focus_numbers_region_areas = regions.filled_areas(focus)
     focus_numbers_avg_area = np.mean(focus_numbers_region_areas)
 
+    numbers = ((regions.eccentricities() < 0.99) &
+               (focus_numbers_region_areas > focus_numbers_avg_area))
     focus_numbers_filled = np.copy(focus)
-    for region in focus_numbers_regions:
-        if region.eccentricity < 0.99 and region.filled_area > focus_numbers_avg_area:
-            min_row, min_col, max_row, max_col = region.bbox
-            focus_numbers_filled[min_row:max_row, min_col:max_col] = 0
+    for min_row, min_col, max_row, max_col in regions.bboxes[numbers]:
+        focus_numbers_filled[min_row:max_row, min_col:max_col] = 0
 
     return focus_numbers_filled
 
@@ -106,23 +148,36 @@ def fourier(signal, axes=None):
     return T_space
 
 
-@memory.cache(ignore=['axes'])
-def main(image_rgb, ruler_bin, axes=None):
-    """Finds the distance between ticks
+def _ruler_focus(image_rgb, ruler_bin, numbers=True):
+    """Helper function. Returns the binarized center of the ruler, the same
+    center without numbers (None unless `numbers`), the top of the ruler
+    and the trims (up, down, left, right) of the center."""
+    # detecting the top of the ruler.
+    ruler_row, ruler_col = np.nonzero(ruler_bin)
+    top_ruler = int(ruler_row.min())
 
-    Parameters
-    ----------
-    image_rgb : array
-        array representing the image
-    ax : array
-        array of Axes that show subplots
+    # returning a binary version of the ruler, numbers and ticks included.
+    focus = ~binarize_ruler(image_rgb[ruler_row.min():ruler_row.max(),
+                                      ruler_col.min():ruler_col.max()])
 
-    Returns
-    -------
-    t_space : float
-        distance between two ticks (.5 mm)
-    """
-    # preparing figure.
+    # Cropping the center of the ruler to improve detection
+    up_trim = int(0.1*focus.shape[0])
+    down_trim = int(0.75*focus.shape[0])
+    left_focus = int(0.1*focus.shape[1])
+    right_focus = int(0.9*focus.shape[1])
+    center = (slice(up_trim, down_trim), slice(left_focus, right_focus))
+
+    # Removing the numbers in the ruler to denoise the fourier transform analysis
+    focus_numbers_filled = None
+    if numbers:
+        focus_numbers_filled = remove_numbers(focus)[center]
+
+    return (focus[center], focus_numbers_filled, top_ruler,
+            (up_trim, down_trim, left_focus, right_focus))
+
+
+def _plot_ruler(image_rgb, axes):
+    """Helper function. Prepares the figure, showing the input image."""
     if axes and axes[0]:
         axes[0].set_title('Final output')
         axes[0].imshow(image_rgb)
@@ -131,32 +186,16 @@ def main(image_rgb, ruler_bin, axes=None):
             axes[4].set_title('Ruler signal')
             axes[5].set_title('Fourier transform of ruler signal')
             axes[3].imshow(image_rgb)
+    return None
 
-    # detecting the top of the ruler.
-    ruler_row, ruler_col = np.nonzero(ruler_bin)
-    top_ruler = int(ruler_row.min())
 
-    # returning a binary version of the ruler, numbers and ticks included.
-    focus = ~binarize_ruler(image_rgb[ruler_row.min():ruler_row.max(),
-                                      ruler_col.min():ruler_col.max()])
-
-    # Removing the numbers in the ruler to denoise the fourier transform analysis
-    focus_numbers_filled = remove_numbers(focus)
-
-    # Cropping the center of the ruler to improve detection
-    up_trim = int(0.1*focus_numbers_filled.shape[0])
-    down_trim = int(0.75*focus_numbers_filled.shape[0])
-    left_focus = int(0.1*focus_numbers_filled.shape[1])
-    right_focus = int(0.9*focus_numbers_filled.shape[1])
-    focus_numbers_filled = focus_numbers_filled[up_trim:down_trim, left_focus:right_focus]
+def _plot_ticks(focus, top_ruler, trims, t_space, axes):
+    """Helper function. Plots the distance between ticks over the ruler."""
+    up_trim, down_trim, left_focus, right_focus = trims
 
-    means = np.mean(focus_numbers_filled, axis=0)
+    means = np.mean(focus, axis=0)
     first_index = np.argmax(means > FIRST_INDEX_THRESHOLD * means.max())
 
-    # Fourier transform analysis to give us the pixels between the 1mm ticks
-    sums = np.sum(focus_numbers_filled, axis=0)
-    t_space = 2 * fourier(sums, axes)
-
     x_single = [left_focus + first_index,
                 left_focus + first_index +
                 t_space]
@@ -178,4 +217,139 @@ def main(image_rgb, ruler_bin, axes=None):
         axes[3].axhline(y=top_ruler, color='b', linestyle='dashed')
         axes[3].add_patch(rect)
 
+    return None
+
+
+def main(image_rgb, ruler_bin, axes=None):
+    """Finds the distance between ticks
+
+    Parameters
+    ----------
+    image_rgb : array
+        array representing the image
+    ax : array
+        array of Axes that show subplots
+
+    Returns
+    -------
+    t_space : float
+        distance between two ticks (.5 mm)
+    """
+    t_space, top_ruler, _ = _estimate(image_rgb, ruler_bin, axes)
     return t_space, top_ruler
+
+
+def _estimate(image_rgb, ruler_bin, axes=None):
+    """Helper function. Returns the distance between ticks, the top of the
+    ruler and the binarized center of the ruler, numbers included; see
+    `main`."""
+    # preparing figure.
+    _plot_ruler(image_rgb, axes)
+
+    focus, focus_numbers_filled, top_ruler, trims = _ruler_focus(image_rgb,
+                                                                 ruler_bin)
+
+    # Fourier transform analysis to give us the pixels between the 1mm ticks
+    sums = np.sum(focus_numbers_filled, axis=0)
+    t_space = 2 * fourier(sums, axes)
+
+    _plot_ticks(focus_numbers_filled, top_ruler, trims, t_space, axes)
+
+    return t_space, top_ruler, focus
+
+
+def calibration_key(camera, shape, ruler_bbox):
+    """Returns the key identifying images that share a ruler calibration.
+
+    Parameters
+    ----------
+    camera : tuple or None
+        Camera make and model, as returned by `preprocessing.read_camera`.
+    shape : tuple
+        Shape of the image.
+    ruler_bbox : (min_row, min_col, max_row, max_col) tuple
+        Bounding box of the ruler in the image.
+
+    Returns
+    -------
+    key : tuple
+        Camera, image size and position of the ruler, rounded to
+        `CALIBRATION_GRID` of the image size.
+    """
+    rows, cols = shape[:2]
+    step = CALIBRATION_GRID * np.array([rows, cols, rows, cols])
+    geometry = tuple(int(value) for value in
+                     np.round(np.asarray(ruler_bbox) / step))
+    return (camera, (rows, cols), geometry)
+
+
+def main_calibrated(image_rgb, ruler_bin, key, axes=None):
+    """Finds the distance between ticks, reusing the distance found for a
+    previous image with the same calibration key when possible.
+
+    Parameters
+    ----------
+    image_rgb : array
+        array representing the image
+    ruler_bin : (M, N) ndarray
+        Binary image containing the ruler in image_rgb.
+    key : tuple
+        Calibration key of the image; see `calibration_key`.
+    axes : array
+        array of Axes that show subplots
+
+    Returns
+    -------
+    t_space : float
+        distance between two ticks (.5 mm)
+    top_ruler : int
+        Y-coordinate of the top of the ruler.
+    calibration : str
+        'reused' if the distance of a previous image was verified and
+        reused, 'estimated' if it was estimated by `main`.
+
+    Notes
+    -----
+    Calibrations are kept in `calibrations`; if it is None, `main` is
+    always used. A previous distance is reused if the ruler signal, without
+    removing numbers, has at least `CALIBRATION_TOLERANCE` of the magnitude
+    it had at the ticks frequency when the distance was estimated, and as
+    many ticks, up to `CALIBRATION_TICKS_TOLERANCE`.
+    """
+    if calibrations is None:
+        return main(image_rgb, ruler_bin, axes) + ('estimated',)
+
+    if key in calibrations:
+        t_space, expected = calibrations[key]
+        focus, _, top_ruler, trims = _ruler_focus(image_rgb, ruler_bin,
+                                                  numbers=False)
+        if _matches(_ticks_signature(focus, t_space), expected):
+            _plot_ruler(image_rgb, axes)
+            _plot_ticks(focus, top_ruler, trims, t_space, axes)
+            return t_space, top_ruler, 'reused'
+
+    t_space, top_ruler, focus = _estimate(image_rgb, ruler_bin, axes)
+    calibrations[key] = (t_space, _ticks_signature(focus, t_space))
+
+    return t_space, top_ruler, 'estimated'
+
+
+def _ticks_signature(focus, t_space):
+    """Helper function. Returns the normalized magnitude of the ruler signal
+    at the frequency of ticks `t_space / 2` pixels apart, and the number of
+    ticks in the signal."""
+    signal = np.sum(focus, axis=0) > 0
+    phases = np.exp(-4j * np.pi / t_space * np.arange(signal.size))
+    magnitude = np.abs(np.dot(signal, phases)) / signal.size
+    ticks = np.count_nonzero(signal[1:] & ~signal[:-1]) + int(signal[0])
+    return magnitude, ticks
+
+
+def _matches(signature, expected):
+    """Helper function. Checks if a ruler signature is close enough to the
+    signature of a calibration; see `_ticks_signature`."""
+    (magnitude, ticks), (magnitude_exp, ticks_exp) = signature, expected
+    # rulers with ticks a multiple of t_space apart also match at the ticks
+    # frequency, but have fewer ticks.
+    return (magnitude >= CALIBRATION_TOLERANCE * magnitude_exp and
+            abs(ticks - ticks_exp) <= CALIBRATION_TICKS_TOLERANCE * ticks_exp)
@@ -0,0 +1,473 @@
+import multiprocessing
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Small values returned for each processed image.
+RESULT_KEYS = ('t_space', 'top_ruler', 'first_tag_edge', 'points_interest',
+               'dist_pix', 'dist_mm', 'position', 'gender', 'probabilities',
+               'calibration')
+
+# Plots waiting to be rendered, per plot worker; analysis waits for the
+# oldest plot beyond that, bounding the memory they take.
+PLOT_BACKLOG = 4
+
+# Flags of the chunks started by a worker process; see `_run_pool`.
+_started = None
+
+
+def setup_cache(args):
+    """Enables the computation cache if requested.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the pipeline; see `misc._generate_parser`.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Cached results are keyed by the arguments changing them, and by the
+    network weights; see `cache.StageCache`. The cache is bounded by
+    `args.cache_size` (in MB) and `args.cache_items`, where 0 means no limit.
+    """
+    from mothra import binarization, cache, identification
+
+    cache.stage_cache = None
+    if args.cache:
+        params = {'auto_rotate': args.auto_rotate,
+                  'draft_decode': args.draft_decode,
+                  'reuse_calibration': args.reuse_calibration}
+        cache.stage_cache = cache.StageCache(
+            cache.DEFAULT_LOCATION, params,
+            files=(binarization.WEIGHTS_BIN, identification.WEIGHTS_CLASSES),
+            max_bytes=args.cache_size * 2**20 or None,
+            max_items=args.cache_items or None
+            )
+    return None
+
+
+def setup(args):
+    """Configures mothra in the current process according to the pipeline
+    arguments, and loads the networks needed.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the pipeline; see `misc._generate_parser`.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    This function is also the initializer of the worker processes.
+    """
+    setup_cache(args)
+
+    from mothra import (binarization, connection, identification, misc,
+                        registry, ruler_detection, tracing)
+
+    # checking if OS is windows-based; if yes, fixing path accordingly
+    misc._set_platform_path()
+
+    # setting up how weights are verified and downloaded.
+    connection.offline = args.offline
+    connection.check_once = args.check_weights_once
+    connection.mirror_url = args.mirror_url
+
+    # tracing both wings of each image at the same time.
+    tracing.parallel_wings = args.parallel_wings
+
+    # reusing ruler calibrations of previous images from the same rig.
+    ruler_detection.calibrations = {} if args.reuse_calibration else None
+
+    # loading the networks once, instead of once per image.
+    planned = _planned_stages(args)
+    weights = []
+    if 'segment' in planned:
+        weights.append(binarization.WEIGHTS_BIN)
+    if 'identification' in planned:
+        weights.append(identification.WEIGHTS_CLASSES)
+    try:
+        registry.warm_up(*weights)
+    except Exception as exc:
+        print(f"* Could not load the networks in advance. More details:\n {exc}")
+
+    return None
+
+
+def _planned_stages(args):
+    """Helper function. Returns the names of the stages run for args.stage."""
+    from mothra import stages
+    targets = stages.resolve_targets(args.stage)
+    known = stages.INPUTS
+    if args.draft_decode:
+        known += ('image_segment', 'image_shape')
+    return [stage.name for stage in stages.plan(targets, known)]
+
+
+def _plot_level(args):
+    """Helper function. Returns the plot level for the pipeline arguments."""
+    if args.detailed_plot:
+        return 2
+    if args.plot:
+        return 1
+    return 0
+
+
+def _prefetch_images(image_paths, args, depth):
+    """Helper function. Decodes (and orients) images ahead of their use,
+    yielding (image_path, image, error) in input order. With
+    `args.draft_decode`, each image is a tuple (image_small, shape,
+    image_rgb), where `image_rgb` is None unless the ruler is measured; see
+    `_decode_reduced`. Unless plotting, images whose results are all cached
+    are not decoded, and are None."""
+    from mothra import prefetch, preprocessing, stages
+
+    max_bytes = None
+    if args.prefetch_memory:
+        max_bytes = args.prefetch_memory * 2**20
+
+    # plotted images are always processed; see `stages.run`.
+    targets = stages.resolve_targets(args.stage)
+    plotted = _plot_level(args) > 0
+    measured = 'ruler' in _planned_stages(args)
+
+    def load(image_path):
+        if not plotted and stages.cached(image_path, targets):
+            return None
+        if args.draft_decode:
+            full = measured and (plotted or
+                                 not stages.cached(image_path, ['ruler']))
+            return _decode_reduced(image_path, args, full)
+        return preprocessing.load_image(image_path, orient=args.auto_rotate)
+
+    return prefetch.prefetch(image_paths, load, depth=depth,
+                             threads=args.prefetch_threads,
+                             max_bytes=max_bytes)
+
+
+def _decode_reduced(image_path, args, full):
+    """Helper function. Decodes an image for the networks at reduced
+    resolution, returning (image_small, shape, image_rgb). If `full`, the
+    image is decoded once at full resolution, for the ruler, and reduced
+    for the networks; see `preprocessing.reduce_image`. Otherwise, JPEG
+    images are only decoded at reduced resolution, and `image_rgb` is None;
+    see `preprocessing.load_image_draft`."""
+    from mothra import binarization, preprocessing
+
+    size = binarization.input_size()
+    if full:
+        image_rgb = preprocessing.load_image(image_path,
+                                             orient=args.auto_rotate)
+        return (preprocessing.reduce_image(image_rgb, size),
+                image_rgb.shape[:2], image_rgb)
+    image_small, shape = preprocessing.load_image_draft(
+        image_path, size, orient=args.auto_rotate
+        )
+    return image_small, shape, None
+
+
+def process_chunk(image_paths, args, images=None):
+    """Processes a chunk of images, recording their plots if requested.
+
+    Parameters
+    ----------
+    image_paths : list of str
+        Paths of the input images.
+    args : argparse.Namespace
+        Arguments of the pipeline; see `misc._generate_parser`.
+    images : list of (image, error), optional
+        Decoded and oriented images, or the errors raised while decoding
+        them. Images are tuples (image_small, shape, image_rgb) with
+        `args.draft_decode`. If None, images are decoded here, in
+        `args.prefetch_threads` threads when `args.prefetch` or
+        `args.draft_decode` are set.
+
+    Returns
+    -------
+    results : list of dict
+        For each image, a dictionary with `image_path`, `error` (None, or
+        the error message if the image could not be processed) and the
+        values in `RESULT_KEYS` computed for it. Plotted images also have
+        `plot`, the arguments of `plotting.render`.
+    timer : stages.Timer
+        Time spent in each stage.
+    """
+    from mothra import plotting, stages
+
+    targets = stages.resolve_targets(args.stage)
+    planned = _planned_stages(args)
+    plot_level = _plot_level(args)
+    n_plots = max(1, len({'ruler', 'tags', 'tracing'}.intersection(planned)))
+    dpi = args.dpi
+    if plot_level == 2:
+        dpi = int(1.5 * args.dpi)
+
+    if images is None and (args.prefetch > 0 or args.draft_decode):
+        images = [(image, error) for _, image, error in
+                  _prefetch_images(image_paths, args, len(image_paths))]
+
+    contexts = []
+    for idx, image_path in enumerate(image_paths):
+        print(f'\nImage: {os.path.basename(image_path)}')
+        context = {
+            'image_path': image_path,
+            'auto_rotate': args.auto_rotate,
+            # recording the plots, drawn later by plotting.render.
+            'axes': plotting.record_layout(n_plots, plot_level, dpi),
+            }
+        # decoded images skip the decode and rotate stages; reduced
+        # resolution images are only seen by the networks. Images whose
+        # results were cached are not decoded, and are decoded by the stages
+        # if their results were evicted from the cache meanwhile.
+        if images is not None:
+            image, error = images[idx]
+            if image is not None and args.draft_decode:
+                image_small, shape, image_rgb = image
+                context['image_segment'], context['image_shape'] = \
+                    image_small, shape
+                if image_rgb is not None:
+                    context['image_rgb'] = image_rgb
+            elif image is not None:
+                context['image_rgb'] = image
+            if error is not None:
+                context['error'] = error
+                context['failed_stage'] = 'decode'
+        contexts.append(context)
+
+    timer = stages.Timer()
+    stages.run(contexts, targets, hooks=[timer])
+
+    results = []
+    for context in contexts:
+        image_path = context['image_path']
+        result = {'image_path': image_path, 'error': None}
+        if 'error' in context:
+            result['error'] = f"{context['failed_stage']}: {context['error']}"
+        else:
+            result.update((key, context[key]) for key in RESULT_KEYS
+                          if key in context)
+
+        if plot_level > 0 and 'error' not in context:
+            output_path = os.path.normpath(
+                os.path.join(args.output_folder, os.path.basename(image_path))
+                )
+            result['plot'] = (context['axes'], n_plots, plot_level,
+                              output_path, dpi)
+
+        results.append(result)
+
+    return results, timer
+
+
+def run(image_paths, args, timer=None):
+    """Processes images in chunks, in this process or in a pool of worker
+    processes.
+
+    Parameters
+    ----------
+    image_paths : list of str
+        Paths of the input images.
+    args : argparse.Namespace
+        Arguments of the pipeline; see `misc._generate_parser`. Uses
+        `batch_size` (images per chunk), `workers` (number of processes),
+        `completion_order` and `plot_workers`.
+    timer : stages.Timer, optional
+        If given, time spent in each stage is added to it.
+
+    Yields
+    ------
+    result : dict
+        Result for each image, as returned by `process_chunk`. Results are
+        in input order, unless `args.completion_order` is set.
+
+    Notes
+    -----
+    Each worker loads its own networks. If a worker dies (e.g. out of
+    memory), the images of the chunks being processed are retried one by one
+    in a new worker, and images that kill it again are reported as errors;
+    the other chunks are processed by a new pool of workers.
+
+    Plots are saved in `args.plot_workers` other processes, while the next
+    images are processed; see `_render_plots`. Results are yielded before
+    their plots are saved, and all plots are saved when the generator ends.
+    """
+    yield from _render_plots(_run_chunks(image_paths, args, timer), args)
+
+
+def _run_chunks(image_paths, args, timer):
+    """Helper function. Processes images in chunks, yielding their results
+    as `run` does, with their `plot`."""
+    chunks = [list(range(start, min(start + args.batch_size, len(image_paths))))
+              for start in range(0, len(image_paths), args.batch_size)]
+
+    if args.workers <= 1:
+        setup(args)
+        # decoding the next images while the current chunk is processed.
+        loaded = None
+        if args.prefetch > 0:
+            loaded = _prefetch_images(image_paths, args, args.prefetch)
+        for chunk in chunks:
+            images = None
+            if loaded is not None:
+                images = [next(loaded)[1:] for _ in chunk]
+            results, chunk_timer = process_chunk(
+                [image_paths[idx] for idx in chunk], args, images
+                )
+            if timer is not None:
+                timer.merge(chunk_timer)
+            yield from results
+        return
+
+    done, next_idx = {}, 0
+    for idx, result in _run_pool(image_paths, chunks, args, timer):
+        if args.completion_order:
+            yield result
+            continue
+        done[idx] = result
+        while next_idx in done:
+            yield done.pop(next_idx)
+            next_idx += 1
+
+
+def _render_plots(results, args):
+    """Helper function. Saves the plots of `results` in a pool of
+    `args.plot_workers` processes (or in this process, with 0), yielding
+    results without waiting for their plots."""
+    from mothra import plotting
+
+    pool, pending = None, deque()
+    try:
+        for result in results:
+            plot = result.pop('plot', None)
+            if plot is not None and args.plot_workers <= 0:
+                _wait_plot(result['image_path'], plotting.render, *plot)
+            elif plot is not None:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=args.plot_workers)
+                pending.append((result['image_path'],
+                                pool.submit(plotting.render, *plot)))
+                while pending and (pending[0][1].done() or len(pending) >
+                                   PLOT_BACKLOG * args.plot_workers):
+                    image_path, future = pending.popleft()
+                    _wait_plot(image_path, future.result)
+            yield result
+        while pending:
+            image_path, future = pending.popleft()
+            _wait_plot(image_path, future.result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _wait_plot(image_path, function, *args):
+    """Helper function. Calls `function` to save the plot of an image,
+    reporting errors instead of raising them."""
+    try:
+        function(*args)
+    except Exception as exc:
+        print(f"* Sorry, could not plot {image_path}. More details:\n {exc}")
+    return None
+
+
+def _run_pool(image_paths, chunks, args, timer):
+    """Helper function. Processes chunks in a pool of worker processes,
+    yielding (index, result) for each image as chunks complete.
+
+    When a worker dies, the pool breaks: chunks that were being processed
+    are retried one image at a time, so a crash points to its image, and
+    chunks that had not started are processed in a new pool."""
+    pending = list(range(len(chunks)))
+    while pending:
+        # flags set by the workers when they start a chunk; shared memory
+        # is written at once, even by workers killed right after.
+        started = multiprocessing.RawArray('b', len(chunks))
+        suspects, not_started = [], []
+        with ProcessPoolExecutor(max_workers=args.workers,
+                                 initializer=_setup_worker,
+                                 initargs=(args, started)) as pool:
+            futures = {
+                pool.submit(_process_started_chunk, chunk_idx,
+                            [image_paths[idx] for idx in chunks[chunk_idx]],
+                            args): chunk_idx
+                for chunk_idx in pending
+                }
+            for future in as_completed(futures):
+                chunk_idx = futures[future]
+                chunk = chunks[chunk_idx]
+                try:
+                    results, chunk_timer = future.result()
+                except BrokenProcessPool:
+                    if started[chunk_idx]:
+                        suspects.extend(chunk)
+                    else:
+                        not_started.append(chunk_idx)
+                    continue
+                except Exception as exc:
+                    results = [{'image_path': image_paths[idx],
+                                'error': f'worker: {exc}'} for idx in chunk]
+                else:
+                    if timer is not None:
+                        timer.merge(chunk_timer)
+                yield from zip(chunk, results)
+
+        # without any chunk started, workers die while starting; images are
+        # then retried one by one, to report their errors.
+        if not_started and len(not_started) == len(pending):
+            suspects.extend(idx for chunk_idx in not_started
+                            for idx in chunks[chunk_idx])
+            not_started = []
+        yield from _retry_suspects(image_paths, suspects, args, timer)
+        pending = not_started
+
+
+def _setup_worker(args, started):
+    """Helper function. Initializer of the worker processes of `_run_pool`,
+    keeping the flags of started chunks."""
+    global _started
+    _started = started
+    setup(args)
+    return None
+
+
+def _process_started_chunk(chunk_idx, image_paths, args):
+    """Helper function. Flags chunk `chunk_idx` as started, and processes
+    it; see `process_chunk`."""
+    _started[chunk_idx] = 1
+    return process_chunk(image_paths, args)
+
+
+def _retry_suspects(image_paths, suspects, args, timer):
+    """Helper function. Retries images whose worker died one at a time, in
+    a single worker, yielding (index, result) for each image."""
+    pool = None
+    for idx in sorted(suspects):
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=1, initializer=setup,
+                                       initargs=(args,))
+        try:
+            (result,), chunk_timer = pool.submit(process_chunk,
+                                                 [image_paths[idx]],
+                                                 args).result()
+            if timer is not None:
+                timer.merge(chunk_timer)
+        except BrokenProcessPool as exc:
+            result = {'image_path': image_paths[idx],
+                      'error': f'worker died: {exc}'}
+            pool.shutdown()
+            pool = None
+        except Exception as exc:
+            result = {'image_path': image_paths[idx],
+                      'error': f'worker: {exc}'}
+        yield idx, result
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,376 @@
+import time
+
+from collections import namedtuple
+from skimage.io import imread
+
+from mothra import (binarization, cache, identification, labels,
+                    measurement, preprocessing, ruler_detection, tracing)
+
+
+# A step of the pipeline: it needs the values named in `inputs`, and
+# returns the values named in `outputs`. Batched stages receive one list per
+# input, with the values for all images, and return one tuple of outputs (or
+# the exception raised) per image; other stages receive the values for a
+# single image. Outputs of `cached` stages are kept in the stage cache, if
+# enabled.
+Stage = namedtuple('Stage', ['name', 'inputs', 'outputs', 'function',
+                             'batched', 'cached'], defaults=(False,))
+
+# Values given by the pipeline for each image.
+INPUTS = ('image_path', 'auto_rotate', 'axes')
+
+# Stages requested by the pipeline for each of its legacy stage names.
+STAGE_ALIASES = {
+    'ruler_detection': ('ruler',),
+    'binarization': ('ruler', 'tags'),
+    'measurements': ('ruler', 'tags', 'measurement', 'identification'),
+}
+
+
+def _decode(image_path):
+    return (imread(image_path),)
+
+
+def _rotate(image_raw, image_path, auto_rotate):
+    # check image orientation and untilt it, if necessary.
+    if auto_rotate:
+        return (preprocessing.auto_rotate(image_raw, image_path),)
+    return (image_raw,)
+
+
+def _segment_input(image_rgb):
+    # without a reduced resolution decode, the networks see the full image.
+    return (image_rgb, image_rgb.shape[:2])
+
+
+def _segment(images, shapes, axes):
+    # an image failing does not fail the others in its batch.
+    label_maps = list(binarization.binarization_batch(
+        images, batch_size=len(images), shapes=shapes, clean=True,
+        errors=True
+        ))
+
+    results = []
+    for label_map, image_axes in zip(label_maps, axes):
+        if isinstance(label_map, Exception):
+            results.append(label_map)
+            continue
+        if image_axes:
+            binarization.plot_bins(label_map.mask(labels.LEPIDOP),
+                                   axes=image_axes)
+        results.append((label_map,))
+
+    return results
+
+
+def _ruler(label_map, image_rgb, image_path, axes):
+    ruler_bin = label_map.mask(labels.RULER)
+    if ruler_detection.calibrations is None:
+        t_space, top_ruler = ruler_detection.main(image_rgb, ruler_bin, axes)
+        return t_space, top_ruler, 'estimated'
+    # images from the same camera, with the ruler at the same place, share
+    # their calibration.
+    camera = preprocessing.read_camera(image_path)
+    key = ruler_detection.calibration_key(camera, image_rgb.shape,
+                                          label_map.bbox(labels.RULER))
+    return ruler_detection.main_calibrated(image_rgb, ruler_bin, key, axes)
+
+
+def _tags(label_map, top_ruler, axes):
+    first_tag_edge = binarization.find_tags_edge(label_map.mask(labels.TAGS),
+                                                 top_ruler, axes)
+    if axes and axes[3]:
+        axes[3].axvline(x=first_tag_edge, color='c', linestyle='dashed')
+    return (first_tag_edge,)
+
+
+def _tracing(label_map, axes):
+    return (tracing.main(label_map.mask(labels.LEPIDOP), axes),)
+
+
+def _measurement(points_interest, t_space, axes):
+    return measurement.main(points_interest, t_space, axes)
+
+
+def _identification(images):
+    return identification.main_batch(images, batch_size=len(images),
+                                     errors=True)
+
+
+STAGES = [
+    Stage('decode', ('image_path',), ('image_raw',), _decode, False),
+    Stage('rotate', ('image_raw', 'image_path', 'auto_rotate'),
+          ('image_rgb',), _rotate, False),
+    Stage('segment_input', ('image_rgb',), ('image_segment', 'image_shape'),
+          _segment_input, False),
+    Stage('segment', ('image_segment', 'image_shape', 'axes'),
+          ('label_map',), _segment, True, True),
+    # the ruler is measured at full resolution. When the networks get a
+    # reduced resolution image, the runner decodes the full image ahead,
+    # with it; otherwise it is decoded after segmentation.
+    Stage('ruler', ('label_map', 'image_rgb', 'image_path', 'axes'),
+          ('t_space', 'top_ruler', 'calibration'), _ruler, False, True),
+    Stage('tags', ('label_map', 'top_ruler', 'axes'), ('first_tag_edge',),
+          _tags, False, True),
+    Stage('tracing', ('label_map', 'axes'), ('points_interest',),
+          _tracing, False, True),
+    Stage('measurement', ('points_interest', 't_space', 'axes'),
+          ('dist_pix', 'dist_mm'), _measurement, False, True),
+    Stage('identification', ('image_segment',),
+          ('position', 'gender', 'probabilities'), _identification, True,
+          True),
+]
+
+
+def resolve_targets(stage):
+    """Returns the names of the stages to be computed for `stage`.
+
+    Parameters
+    ----------
+    stage : str
+        Name of a stage in `STAGES`, or one of the legacy names in
+        `STAGE_ALIASES`.
+
+    Returns
+    -------
+    targets : tuple of str
+        Names of the target stages.
+    """
+    if stage in STAGE_ALIASES:
+        return STAGE_ALIASES[stage]
+    if stage in [item.name for item in STAGES]:
+        return (stage,)
+    raise ValueError(f"unknown stage '{stage}'")
+
+
+def plan(targets, known=(), stages=None):
+    """Returns the stages needed to compute `targets`, in execution order.
+
+    Parameters
+    ----------
+    targets : iterable of str
+        Names of the target stages.
+    known : iterable of str, optional
+        Names of the values given by the caller. Stages whose outputs are
+        all known are not executed.
+    stages : list of Stage, optional
+        Stages of the graph. Defaults to `STAGES`.
+
+    Returns
+    -------
+    ordered : list of Stage
+        Stages to be executed, each one after the stages it depends on.
+    """
+    if stages is None:
+        stages = STAGES
+    by_name = {stage.name: stage for stage in stages}
+    producers = {output: stage for stage in stages for output in stage.outputs}
+    known = set(known)
+
+    ordered, visiting = [], set()
+
+    def visit(stage):
+        if stage in ordered:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"stage '{stage.name}' depends on itself")
+        visiting.add(stage.name)
+        for value in stage.inputs:
+            if value in known:
+                continue
+            if value not in producers:
+                raise ValueError(f"no value or stage provides '{value}', "
+                                 f"required by stage '{stage.name}'")
+            visit(producers[value])
+        visiting.discard(stage.name)
+        ordered.append(stage)
+
+    for target in targets:
+        if target not in by_name:
+            raise ValueError(f"unknown stage '{target}'")
+        if not known.issuperset(by_name[target].outputs):
+            visit(by_name[target])
+
+    return ordered
+
+
+def run(contexts, targets, hooks=(), stages=None, store=None):
+    """Runs the stages needed to compute `targets`, once per image.
+
+    Parameters
+    ----------
+    contexts : list of dict
+        One dictionary per image, containing the values given by the caller
+        (e.g. `image_path`, `auto_rotate`, `axes`). Stage outputs are added
+        to them.
+    targets : iterable of str
+        Names of the target stages.
+    hooks : iterable of callables, optional
+        Each hook is called as `hook(stage, n_images, seconds)` after every
+        stage execution.
+    stages : list of Stage, optional
+        Stages of the graph. Defaults to `STAGES`.
+    store : cache.StageCache, optional
+        Cache of the outputs of cached stages. Defaults to
+        `cache.stage_cache`.
+
+    Returns
+    -------
+    contexts : list of dict
+        The input contexts. If a stage fails for an image, the exception is
+        stored under `error`, and the image is skipped by later stages.
+
+    Notes
+    -----
+    Values given for some images only (e.g. images decoded in advance,
+    except the ones whose outputs were cached) are computed by the stages
+    for the other images, if they need them. Intermediate values which are
+    not outputs of `targets` are removed once no remaining stage needs them.
+
+    With a cache, outputs of cached stages are looked up for each image
+    (with an `image_path`, and not being plotted) before running any stage,
+    and stages are only run for the images that still need them; e.g. images
+    whose target outputs are all cached are not even decoded. Computed
+    outputs of cached stages are added to the cache.
+    """
+    if not contexts:
+        return contexts
+    if store is None:
+        store = cache.stage_cache
+
+    known = set.intersection(*[set(context) for context in contexts])
+    ordered = plan(targets, known, stages)
+
+    keep = set(known)
+    for stage in ordered:
+        if stage.name in targets:
+            keep.update(stage.outputs)
+
+    required = [_required(context, ordered, keep, store)
+                for context in contexts]
+
+    for idx, stage in enumerate(ordered):
+        pending = [context for context, names in zip(contexts, required)
+                   if 'error' not in context and stage.name in names]
+
+        if pending:
+            start = time.perf_counter()
+            if stage.batched:
+                try:
+                    args = [[context[value] for context in pending]
+                            for value in stage.inputs]
+                    results = list(stage.function(*args))
+                except Exception as exc:
+                    results = [exc] * len(pending)
+            else:
+                results = []
+                for context in pending:
+                    try:
+                        results.append(stage.function(
+                            *[context[value] for value in stage.inputs]
+                            ))
+                    except Exception as exc:
+                        results.append(exc)
+            seconds = time.perf_counter() - start
+
+            for context, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    context['error'] = result
+                    context['failed_stage'] = stage.name
+                    continue
+                context.update(zip(stage.outputs, result))
+                if (store is not None and stage.cached and
+                        'image_path' in context):
+                    store.save(context['image_path'], stage.name, result)
+
+            for hook in hooks:
+                hook(stage, len(pending), seconds)
+
+        # releasing values that are not needed anymore.
+        needed = keep.union(*[later.inputs for later in ordered[idx+1:]])
+        for context in contexts:
+            for value in set(context) - needed - {'error', 'failed_stage'}:
+                del context[value]
+
+    return contexts
+
+
+def _required(context, ordered, wanted, store):
+    """Helper function. Returns the names of the stages in `ordered` to be
+    run for an image to compute the values in `wanted`, after adding the
+    cached outputs of stages to its context."""
+    use_cache = (store is not None and 'image_path' in context and
+                 not context.get('axes'))
+
+    names, needed = set(), set(wanted)
+    for stage in reversed(ordered):
+        missing = [value for value in stage.outputs if value not in context]
+        if not needed.intersection(missing):
+            continue
+        if use_cache and stage.cached:
+            outputs = store.load(context['image_path'], stage.name)
+            if outputs is not None:
+                context.update(zip(stage.outputs, outputs))
+                continue
+        names.add(stage.name)
+        needed.update(stage.inputs)
+
+    return names
+
+
+def cached(image_path, targets, store=None, stages=None):
+    """Checks if the outputs of `targets` are cached for an image, so that
+    it does not need to be decoded.
+
+    Parameters
+    ----------
+    image_path : str
+        Path of the input image.
+    targets : iterable of str
+        Names of the target stages.
+    store : cache.StageCache, optional
+        Cache of the outputs of cached stages. Defaults to
+        `cache.stage_cache`.
+    stages : list of Stage, optional
+        Stages of the graph. Defaults to `STAGES`.
+
+    Returns
+    -------
+    cached : bool
+        True if the outputs of all target stages are cached.
+    """
+    if store is None:
+        store = cache.stage_cache
+    if stages is None:
+        stages = STAGES
+    by_name = {stage.name: stage for stage in stages}
+    return store is not None and all(
+        by_name[target].cached and store.contains(image_path, target)
+        for target in targets
+        )
+
+
+class Timer:
+    """Hook for `run` that accumulates the time spent in each stage."""
+    def __init__(self):
+        self.seconds = {}
+        self.images = {}
+
+    def __call__(self, stage, n_images, seconds):
+        self.seconds[stage.name] = self.seconds.get(stage.name, 0) + seconds
+        self.images[stage.name] = self.images.get(stage.name, 0) + n_images
+
+    def merge(self, other):
+        """Adds the times accumulated by another Timer."""
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0) + seconds
+            self.images[name] = self.images.get(name, 0) + other.images[name]
+        return None
+
+    def report(self):
+        """Prints the total and per image time spent in each stage."""
+        print('\nTime spent per stage:')
+        for name, seconds in self.seconds.items():
+            per_image = seconds / max(self.images[name], 1)
+            print(f'* {name}: {seconds:.2f} s ({per_image:.2f} s per image)')
+        return None
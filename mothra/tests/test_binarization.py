@@ -1,8 +1,9 @@
 import numpy as np
 import pytest
+import scipy as sp
 
-from mothra import binarization
-from skimage import draw
+from mothra import binarization, labels, measurement, tracing
+from skimage import draw, transform
 from skimage.io import imread
 from skimage.util import img_as_bool
 
@@ -241,3 +242,168 @@ def test_return_largest_region(fake_lepid_layout):
     img_expect = (lepid == 3)  # getting only the lepidopteran
 
     assert (img_expect.all() == img_result.all())
+
+
+def test_group_by_aspect():
+    """Testing function binarization._group_by_aspect.
+
+    Summary
+    -------
+    We pass shapes of landscape and portrait images, and check how they are
+    grouped into batches.
+
+    Expected
+    --------
+    Landscape and portrait images are not mixed, batches have at most
+    batch_size images, and all images are in a batch.
+    """
+    shapes = [(300, 400), (400, 300), (310, 400), (400, 300), (300, 400)]
+    batches = binarization._group_by_aspect(shapes, batch_size=2,
+                                            aspect_tolerance=0.1)
+
+    assert sorted(idx for batch in batches for idx in batch) == [0, 1, 2, 3, 4]
+    assert [1, 3] in batches
+    for batch in batches:
+        assert len(batch) <= 2
+        assert len({shapes[idx][0] > shapes[idx][1] for idx in batch}) == 1
+
+
+def test_binarization_batch(monkeypatch):
+    """Testing function binarization.binarization_batch.
+
+    Summary
+    -------
+    We replace the U-net by a function returning class probabilities that
+    depend on each input image, and compare the batched results with the
+    ones for single images.
+
+    Expected
+    --------
+    Results are returned in input order, and are equal to the ones obtained
+    one image at a time.
+    """
+    def fake_probs(image):
+        probs = np.zeros((4, 30, 40))
+        probs[image[0, 0, 0] % 4, 10:20, 10:30] = 1
+        return probs
+
+    forward_passes = []
+
+    def fake_predict_batch(learner, images):
+        forward_passes.append(len(images))
+        return [fake_probs(image) for image in images]
+
+    monkeypatch.setattr(binarization.registry, 'get_learner',
+                        lambda weights: None)
+    monkeypatch.setattr(binarization, '_predict_batch', fake_predict_batch)
+
+    images = [np.full((60 + 60 * (idx % 2), 80, 3), idx, dtype='uint8')
+              for idx in range(7)]
+    results = list(binarization.binarization_batch(iter(images),
+                                                   batch_size=3))
+
+    assert len(results) == len(images)
+    assert max(forward_passes) <= 3
+    assert sum(forward_passes) == len(images)
+    for image, result in zip(images, results):
+        expected = binarization._classes_to_labels(image.shape,
+                                                    fake_probs(image))
+        assert result == expected
+        for mask_result, mask_expected in zip(result, expected):
+            assert mask_result.shape == image.shape[:2]
+            np.testing.assert_array_equal(mask_result, mask_expected)
+
+
+
+def test_binarization_batch_errors(monkeypatch):
+    """Testing function binarization.binarization_batch when an image of a
+    batch fails.
+
+    Summary
+    -------
+    We replace the U-net by a function returning class probabilities where
+    one image has no lepidopteran, which fails when cleaning it, and
+    another image fails the forward pass.
+
+    Expected
+    --------
+    The exceptions of the failed images are yielded in their place, and the
+    other images of their batch are segmented.
+    """
+    def fake_probs(image):
+        probs = np.zeros((4, 30, 40))
+        if image[0, 0, 0] != 1:
+            probs[3, 10:20, 10:30] = 1
+        return probs
+
+    def fake_predict_batch(learner, images):
+        if any(image[0, 0, 0] == 2 for image in images):
+            raise RuntimeError('forward pass failed')
+        return [fake_probs(image) for image in images]
+
+    monkeypatch.setattr(binarization.registry, 'get_learner',
+                        lambda weights: None)
+    monkeypatch.setattr(binarization, '_predict_batch', fake_predict_batch)
+
+    images = [np.full((60, 80, 3), idx, dtype='uint8') for idx in range(4)]
+    results = list(binarization.binarization_batch(images, batch_size=4,
+                                                   clean=True, errors=True))
+
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], RuntimeError)
+    for idx in (0, 3):
+        assert results[idx].mask(labels.LEPIDOP).any()
+
+    with pytest.raises(RuntimeError):
+        list(binarization.binarization_batch(images, batch_size=4))
+
+
+def test_classes_to_labels_lengths():
+    """Checks if measuring masks upscaled with nearest neighbor sampling
+    gives the lengths of the former bilinear upscaling.
+
+    Summary
+    -------
+    We create smooth lepidopteran probabilities at a quarter of the image
+    resolution, as the U-net would, and measure the lepidopteran in the
+    mask of binarization._classes_to_labels and in the mask obtained by
+    rescaling the probabilities bilinearly before thresholding them.
+
+    Expected
+    --------
+    Points of interest move by at most 2 U-net pixels, and lengths change
+    by at most 4 U-net pixels, i.e. 1.5% of the wing lengths.
+    """
+    scale = 4
+    shape = (1000, 2000)
+    butterfly = np.zeros(shape)
+    butterfly[250:500, 250:500] = 1  # left wing
+    butterfly[250:500, 1500:1750] = 1  # right wing
+    butterfly[500:900, 400:1600] = 1  # body
+    butterfly[250:500, 800:1200] = 1  # head
+
+    lepidop = sp.ndimage.gaussian_filter(
+        transform.resize(butterfly, (250, 500), anti_aliasing=True), 1.5
+        )
+    classes = np.stack([1 - lepidop, np.zeros_like(lepidop),
+                        np.zeros_like(lepidop), lepidop])
+
+    nearest = binarization._classes_to_labels(shape, classes)
+    bilinear = sp.ndimage.binary_fill_holes(
+        transform.resize(lepidop, shape, order=1) > 0.5
+        )
+
+    points_nearest = tracing.main(nearest.mask(labels.LEPIDOP))
+    points_bilinear = tracing.main(bilinear)
+    for name, point in points_nearest.items():
+        assert np.abs(np.subtract(point, points_bilinear[name])).max() <= \
+            2 * scale
+
+    dist_nearest, _ = measurement.main(points_nearest, 1)
+    dist_bilinear, _ = measurement.main(points_bilinear, 1)
+    for name, dist in dist_nearest.items():
+        assert abs(dist - dist_bilinear[name]) <= 4 * scale
+    for name in ('dist_l', 'dist_r', 'dist_l_center', 'dist_r_center',
+                 'dist_span'):
+        assert dist_nearest[name] == pytest.approx(dist_bilinear[name],
+                                                   rel=0.015)
@@ -0,0 +1,199 @@
+import importlib
+import numpy as np
+import os
+
+from argparse import Namespace
+
+from mothra import cache, labels
+
+
+def test_stage_cache(tmp_path):
+    """Testing class cache.StageCache.
+
+    Summary
+    -------
+    We save the outputs of a stage for an image, and load them back for the
+    same image, for another stage, and for caches with other parameters.
+
+    Expected
+    --------
+    Outputs are only found for the same image, stage and parameters, and
+    are equal to the saved ones.
+    """
+    image_path = tmp_path / 'image.jpg'
+    image_path.write_bytes(b'image')
+    location = tmp_path / 'cachedir'
+
+    label_map = labels.LabelMap(np.eye(8, dtype=np.uint8) * labels.RULER,
+                                (80, 80))
+    outputs = (label_map, 1.5, {'dist_l': 2.0})
+
+    store = cache.StageCache(location, {'auto_rotate': False})
+    assert store.load(image_path, 'segment') is None
+    assert not store.contains(image_path, 'segment')
+
+    store.save(image_path, 'segment', outputs)
+    assert store.contains(image_path, 'segment')
+    assert store.load(image_path, 'segment') == outputs
+    assert store.load(image_path, 'ruler') is None
+
+    same = cache.StageCache(location, {'auto_rotate': False})
+    assert same.load(image_path, 'segment') == outputs
+    other = cache.StageCache(location, {'auto_rotate': True})
+    assert other.load(image_path, 'segment') is None
+
+
+def test_stage_cache_files(tmp_path):
+    """Checks if cached results depend on the files given to
+    cache.StageCache, e.g. network weights.
+
+    Expected
+    --------
+    Results saved with a version of a file are not found after modifying
+    it.
+    """
+    image_path = tmp_path / 'image.jpg'
+    image_path.write_bytes(b'image')
+    weights = tmp_path / 'weights.pkl'
+    weights.write_bytes(b'weights')
+
+    store = cache.StageCache(tmp_path / 'cachedir', files=[weights])
+    store.save(image_path, 'segment', (1,))
+
+    weights.write_bytes(b'new weights')
+    store = cache.StageCache(tmp_path / 'cachedir', files=[weights])
+    assert store.load(image_path, 'segment') is None
+
+
+def test_source_digest(tmp_path):
+    """Testing function cache.source_digest.
+
+    Expected
+    --------
+    The digest changes when a file is modified, and is different for
+    files with the same contents in other paths.
+    """
+    first, second = tmp_path / 'first.jpg', tmp_path / 'second.jpg'
+    first.write_bytes(b'image')
+    second.write_bytes(b'image')
+    os.utime(first, ns=(0, 0))
+    os.utime(second, ns=(0, 0))
+
+    digest = cache.source_digest(first)
+    assert digest == cache.source_digest(str(first))
+    assert digest != cache.source_digest(second)
+
+    os.utime(first, ns=(0, 10))
+    assert digest != cache.source_digest(first)
+
+
+def test_stage_cache_masks(tmp_path):
+    """Checks if binary masks are stored compactly by cache.StageCache.
+
+    Expected
+    --------
+    A large binary mask is loaded back exactly, from a file much smaller
+    than the mask.
+    """
+    image_path = tmp_path / 'image.jpg'
+    image_path.write_bytes(b'image')
+    mask = np.random.default_rng(0).random((1000, 1000)) > 0.5
+
+    store = cache.StageCache(tmp_path / 'cachedir')
+    store.save(image_path, 'tracing', (mask,))
+
+    (result,) = store.load(image_path, 'tracing')
+    np.testing.assert_array_equal(result, mask)
+    size = sum(path.stat().st_size
+               for path in (tmp_path / 'cachedir').rglob('*') if path.is_file())
+    assert size < mask.size / 7
+
+
+def _fill_cache(store, tmp_path, count):
+    """Helper function. Saves results for `count` images, each one accessed
+    a second after the previous one; returns the paths of the images."""
+    image_paths = []
+    for idx in range(count):
+        image_path = tmp_path / f'image_{idx}.jpg'
+        image_path.write_bytes(b'image')
+        store.save(image_path, 'ruler', (np.arange(1000),))
+        entry = store._path(store.key(image_path, 'ruler'))
+        os.utime(entry, (1000 + idx, 1000 + idx))
+        image_paths.append(image_path)
+    return image_paths
+
+
+def test_prune(tmp_path):
+    """Testing method cache.StageCache.prune.
+
+    Summary
+    -------
+    We cache results for five images, use the oldest one, and prune the
+    cache to three results, and then to the size of a single result.
+
+    Expected
+    --------
+    The least recently used results are evicted first; the result that was
+    used is kept.
+    """
+    store = cache.StageCache(tmp_path / 'cachedir')
+    image_paths = _fill_cache(store, tmp_path, 5)
+    assert store.stats()['items'] == 5
+
+    assert store.load(image_paths[0], 'ruler') is not None
+
+    removed_items, removed_bytes = store.prune(max_items=3)
+    assert removed_items == 2
+    assert [store.contains(image_path, 'ruler')
+            for image_path in image_paths] == [True, False, False, True, True]
+
+    size = store.stats()['bytes'] // 3
+    store.prune(max_bytes=size)
+    assert store.stats() == {'items': 1, 'bytes': size,
+                             'oldest': store.stats()['oldest'],
+                             'newest': store.stats()['oldest']}
+    assert store.contains(image_paths[0], 'ruler')
+
+
+def test_prune_while_saving(tmp_path):
+    """Checks if caches with limits are pruned while results are saved.
+
+    Expected
+    --------
+    The cache never holds more results than its limit.
+    """
+    store = cache.StageCache(tmp_path / 'cachedir', max_items=10)
+    for idx in range(30):
+        image_path = tmp_path / f'image_{idx}.jpg'
+        image_path.write_bytes(b'image')
+        store.save(image_path, 'ruler', (idx,))
+        assert store.stats()['items'] <= 10
+
+
+def test_cache_command(tmp_path, capsys):
+    """Testing the `python -m mothra cache` command.
+
+    Summary
+    -------
+    We print the statistics of a cache with five results, and prune it to
+    two results.
+
+    Expected
+    --------
+    Statistics report five results; pruning removes three of them.
+    """
+    commands = importlib.import_module('mothra.__main__')
+    location = tmp_path / 'cachedir'
+    _fill_cache(cache.StageCache(location), tmp_path, 5)
+
+    args = Namespace(action='stats', cache_dir=location, max_size=None,
+                     max_items=None)
+    commands.cache_command(args)
+    assert '* results: 5' in capsys.readouterr().out
+
+    args = Namespace(action='prune', cache_dir=location, max_size=None,
+                     max_items=2)
+    commands.cache_command(args)
+    output = capsys.readouterr().out
+    assert 'Removed 3 results' in output
+    assert '* results: 2' in output
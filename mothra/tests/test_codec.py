@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from mothra import codec
+
+
+RNG = np.random.default_rng(0)
+
+
+@pytest.mark.parametrize('mask', [
+    RNG.random((37, 53)) > 0.5,
+    np.zeros((0, 5), dtype=bool),
+    np.ones(9, dtype=bool),
+    RNG.integers(0, 4, (33, 17, 2)).astype(np.uint8),
+    np.zeros(0, dtype=np.uint8),
+    np.full((16, 16), 255, dtype=np.uint8),
+])
+@pytest.mark.parametrize('level', [0, codec.COMPRESSION_LEVEL])
+def test_encode_mask(mask, level):
+    """Checks if masks are decoded exactly as they were encoded.
+
+    Summary
+    -------
+    We encode and decode binary masks and label images, with and without
+    compression, including empty masks and sizes that are not multiples of
+    8.
+
+    Expected
+    --------
+    Decoded masks have the same type, shape and values as the originals.
+    """
+    result = codec.decode_mask(codec.encode_mask(mask, level))
+
+    assert result.dtype == mask.dtype
+    assert result.shape == mask.shape
+    np.testing.assert_array_equal(result, mask)
+
+
+def test_encode_mask_size():
+    """Checks if masks are encoded compactly.
+
+    Expected
+    --------
+    Without compression, binary masks take 1 bit per pixel; with it, a
+    blob and a label image with three regions take a few kilobytes.
+    """
+    mask = np.zeros((1000, 1500), dtype=bool)
+    mask[200:800, 300:1200] = True
+    labels = np.zeros((1024, 1024), dtype=np.uint8)
+    labels[100:300, 200:800] = 3
+    labels[900:] = 2
+
+    assert len(codec.encode_mask(mask, level=0)) < mask.size / 8 + 100
+    assert len(codec.encode_mask(mask)) < 5000
+    assert len(codec.encode_mask(labels)) < 5000
+
+
+def test_save_mask(tmp_path):
+    """Checks if masks are saved to and loaded from files.
+
+    Expected
+    --------
+    The loaded mask is equal to the saved one.
+    """
+    mask = RNG.random((20, 30)) > 0.7
+    codec.save_mask(tmp_path / 'mask.bin', mask)
+
+    np.testing.assert_array_equal(codec.load_mask(tmp_path / 'mask.bin'),
+                                  mask)
+
+
+def test_encode_mask_errors():
+    """Checks if invalid masks and data raise errors.
+
+    Expected
+    --------
+    Masks of other types, data which is not an encoded mask, and truncated
+    label images raise ValueError.
+    """
+    with pytest.raises(ValueError):
+        codec.encode_mask(np.zeros((3, 3), dtype=float))
+    with pytest.raises(ValueError):
+        codec.decode_mask(b'not a mask')
+
+    data = codec.encode_mask(np.arange(10, dtype=np.uint8), level=0)
+    with pytest.raises(ValueError):
+        codec.decode_mask(data[:-4])
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from mothra import components
+from skimage.measure import label, regionprops
+
+
+@pytest.mark.parametrize('connectivity', [1, 2])
+def test_components(connectivity):
+    """Testing class components.Components.
+
+    Summary
+    -------
+    We label a random binary image with Components and with skimage, and
+    compare the statistics of their components.
+
+    Expected
+    --------
+    Labels, areas, bounding boxes, centroids, eccentricities, filled areas
+    and coordinates are equal to the ones computed by skimage's
+    regionprops.
+    """
+    rng = np.random.default_rng(0)
+    image_bin = rng.random((60, 80)) > 0.6
+
+    regions = components.Components(image_bin, connectivity=connectivity)
+    props = regionprops(label(image_bin, connectivity=connectivity))
+
+    np.testing.assert_array_equal(regions.markers,
+                                  label(image_bin, connectivity=connectivity))
+    assert regions.count == len(props)
+    np.testing.assert_array_equal(regions.areas, [prop.area for prop in props])
+    np.testing.assert_array_equal(regions.bboxes, [prop.bbox for prop in props])
+    np.testing.assert_allclose(regions.centroids(),
+                               [prop.centroid for prop in props])
+    np.testing.assert_allclose(regions.eccentricities(),
+                               [prop.eccentricity for prop in props],
+                               atol=1e-12)
+    np.testing.assert_array_equal(regions.filled_areas(image_bin),
+                                  [prop.area_filled for prop in props])
+
+    largest = max(props, key=lambda prop: prop.area)
+    assert regions.largest() == largest.label
+    np.testing.assert_array_equal(regions.coords(largest.label),
+                                  largest.coords)
+
+
+def test_components_empty():
+    """Checks Components for a binary image without components.
+
+    Expected
+    --------
+    There are no components, and asking for the largest one raises
+    ValueError.
+    """
+    regions = components.Components(np.zeros((10, 10), dtype=bool))
+
+    assert regions.count == 0
+    assert regions.bboxes.shape == (0, 4)
+    with pytest.raises(ValueError):
+        regions.largest()
+
+
+def test_row_extremes():
+    """Testing method components.Components.row_extremes.
+
+    Summary
+    -------
+    We compute the leftmost and rightmost pixels of each row of a component
+    with row_extremes, and from all its coordinates.
+
+    Expected
+    --------
+    Both give the same pixels, in raster order.
+    """
+    rng = np.random.default_rng(1)
+    image_bin = rng.random((60, 80)) > 0.4
+
+    regions = components.Components(image_bin, connectivity=1)
+    largest = regions.largest()
+    coords = regions.coords(largest)
+
+    expected = []
+    for row in np.unique(coords[:, 0]):
+        cols = coords[coords[:, 0] == row, 1]
+        expected.extend([(row, cols.min()), (row, cols.max())])
+
+    np.testing.assert_array_equal(regions.row_extremes(largest), expected)
@@ -0,0 +1,108 @@
+import hashlib
+import pytest
+
+from mothra import connection
+
+
+@pytest.fixture()
+def mirror(tmp_path, monkeypatch):
+    """Implements a local mirror folder containing weights and their hash
+    file, and an empty folder for the local weights."""
+    mirror_dir = tmp_path / 'mirror'
+    mirror_dir.mkdir()
+    content = b'fake weights'
+    (mirror_dir / 'fake_weights.pkl').write_bytes(content)
+    hash_val = hashlib.sha256(content).hexdigest()
+    (mirror_dir / 'SHA256SUM-fake_weights').write_text(
+        f'{hash_val}  fake_weights.pkl\n'
+        )
+
+    monkeypatch.setattr(connection, 'mirror_url', str(mirror_dir))
+    monkeypatch.setattr(connection, 'offline', True)
+    monkeypatch.setattr(connection, 'check_once', False)
+
+    def no_internet():
+        raise AssertionError('the internet should not be used')
+
+    monkeypatch.setattr(connection, 'has_internet', no_internet)
+
+    return tmp_path / 'models' / 'fake_weights.pkl', hash_val
+
+
+def test_download_weights_from_mirror(mirror):
+    """Checks if missing weights are fetched from a local mirror, and if
+    their hash is recorded in the manifest.
+
+    Expected
+    --------
+    Weights are copied, and are trusted as verified afterwards.
+    """
+    weights, hash_val = mirror
+
+    connection.download_weights(weights)
+
+    assert weights.read_bytes() == b'fake weights'
+    assert connection.is_verified(weights)
+    assert connection.local_hash(weights) == hash_val
+
+
+def test_local_hash_uses_manifest(mirror, monkeypatch):
+    """Checks if unchanged weights are not hashed again.
+
+    Summary
+    -------
+    We fetch weights, forbid reading their hash from disk and ask for the
+    hash again; then we change the weights.
+
+    Expected
+    --------
+    The hash comes from the manifest while the file is unchanged, and
+    modified weights are not considered verified.
+    """
+    weights, hash_val = mirror
+    connection.download_weights(weights)
+
+    def forbidden_read(weights):
+        raise AssertionError('weights should not be hashed again')
+
+    monkeypatch.setattr(connection, 'read_hash_local', forbidden_read)
+    assert connection.local_hash(weights) == hash_val
+
+    weights.write_bytes(b'modified weights')
+    assert not connection.is_verified(weights)
+
+
+def test_download_weights_offline_without_mirror(mirror, monkeypatch):
+    """Checks if missing weights raise an error when offline and no mirror
+    is given.
+
+    Expected
+    --------
+    FileNotFoundError is raised, and the internet is not used.
+    """
+    weights, _ = mirror
+    monkeypatch.setattr(connection, 'mirror_url', None)
+
+    with pytest.raises(FileNotFoundError):
+        connection.download_weights(weights)
+
+
+def test_download_weights_check_once(mirror, monkeypatch):
+    """Checks if verified weights are not checked for updates again when
+    check_once is set.
+
+    Expected
+    --------
+    The hash file in the mirror is not read.
+    """
+    weights, _ = mirror
+    connection.download_weights(weights)
+
+    monkeypatch.setattr(connection, 'offline', False)
+    monkeypatch.setattr(connection, 'check_once', True)
+
+    def forbidden_read(url_hash):
+        raise AssertionError('hash should not be checked again')
+
+    monkeypatch.setattr(connection, 'read_hash_from_url', forbidden_read)
+    connection.download_weights(weights)
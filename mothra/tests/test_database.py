@@ -0,0 +1,179 @@
+import importlib
+import os
+import sqlite3
+
+from argparse import Namespace
+from csv import reader
+from mothra import database, manifest, writing
+
+
+def _row(image_id, left_wing, gender='female'):
+    """Helper function. Returns a row of results; see `writing.csv_row`."""
+    return [image_id, left_wing, 'N/A', 'N/A', 'N/A', 'N/A', 'N/A',
+            'right-side up', gender, 0.1, 0.8, 0.1, 'estimated']
+
+
+def _images(tmp_path, number):
+    """Helper function. Returns the paths of `number` small input files."""
+    image_paths = []
+    for index in range(number):
+        image_path = tmp_path / f'image_{index}.jpg'
+        image_path.write_bytes(bytes([index]) * 10)
+        image_paths.append(str(image_path))
+    return image_paths
+
+
+def test_result_store(tmp_path):
+    """Testing the SQLite results store.
+
+    Summary
+    -------
+    We write the results of two images, write the first image again, then
+    change it on disk and write it a third time, from another run.
+
+    Expected
+    --------
+    Processing an unchanged image again replaces its row; a changed image
+    gets a new row, found instead of the former one, which is kept in the
+    history. Columns are typed, missing values are null, and the database
+    uses write-ahead logging.
+    """
+    fname = tmp_path / 'results.sqlite'
+    image_paths = _images(tmp_path, 2)
+
+    with database.ResultStore(fname, 'run_0', 'measurements',
+                              flush_rows=2) as store:
+        store.write(image_paths[0], _row('image_0', '10.5'))
+        store.write(image_paths[1], _row('image_1', '11'))
+        store.write(image_paths[0], _row('image_0', '12'))
+    with database.ResultStore(fname) as store:
+        results = store.find('image_0')
+    assert len(results) == 1
+    assert results[0]['left_wing (mm)'] == 12.0
+    assert results[0]['right_wing (mm)'] is None
+    assert results[0]['run_id'] == 'run_0'
+    assert results[0]['image_path'] == os.path.abspath(image_paths[0])
+    assert results[0]['input_fingerprint'] == \
+        manifest.fingerprint(image_paths[0])
+
+    with open(image_paths[0], 'ab') as image_file:
+        image_file.write(b'changed')
+    with database.ResultStore(fname, 'run_1', 'measurements') as store:
+        store.write(image_paths[0], _row('image_0', '13'))
+        latest = store.find('image_0')
+        results = store.find('image_0', history=True)
+    assert [result['left_wing (mm)'] for result in latest] == [13.0]
+    assert [result['left_wing (mm)'] for result in results] == [13.0, 12.0]
+    assert [result['run_id'] for result in results] == ['run_1', 'run_0']
+
+    connection = sqlite3.connect(fname)
+    assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert connection.execute('SELECT run_id, stage FROM runs '
+                              'ORDER BY started_at').fetchall() == \
+        [('run_0', 'measurements'), ('run_1', 'measurements')]
+    connection.close()
+
+
+def test_export_csv(tmp_path):
+    """Testing the export of a SQLite results store to a CSV file.
+
+    Summary
+    -------
+    We write the results of two runs, where the second one processes a
+    changed image again, and export the results, the results of the second
+    run only, and all the results of each image.
+
+    Expected
+    --------
+    Exported files have the columns of the CSV files written by the
+    pipeline, with 'N/A' for missing values, in processing order. Only the
+    most recent results of each image are exported, unless asked for all
+    of them.
+    """
+    fname = tmp_path / 'results.sqlite'
+    image_paths = _images(tmp_path, 3)
+
+    with database.ResultStore(fname, 'run_0') as store:
+        store.write(image_paths[0], _row('image_0', '10.5'))
+        store.write(image_paths[1], _row('image_1', 'N/A', gender='N/A'))
+    with database.ResultStore(fname, 'run_1') as store:
+        store.write(image_paths[2], _row('image_2', '9'))
+        with open(image_paths[0], 'ab') as image_file:
+            image_file.write(b'changed')
+        store.write(image_paths[0], _row('image_0', '11'))
+        assert store.export_csv(tmp_path / 'latest.csv') == 3
+        assert store.export_csv(tmp_path / 'run.csv', 'run_1') == 2
+        assert store.export_csv(tmp_path / 'all.csv', history=True) == 4
+
+    with open(tmp_path / 'latest.csv') as csv_file:
+        lines = list(reader(csv_file))
+    assert lines[0] == writing.DATA_COLS
+    assert [line[:3] for line in lines[1:]] == [['image_1', 'N/A', 'N/A'],
+                                                ['image_2', '9.0', 'N/A'],
+                                                ['image_0', '11.0', 'N/A']]
+    assert lines[1][8] == 'N/A'
+    with open(tmp_path / 'run.csv') as csv_file:
+        assert [line[0] for line in reader(csv_file)] == ['image_id',
+                                                          'image_2',
+                                                          'image_0']
+    with open(tmp_path / 'all.csv') as csv_file:
+        assert [line[1] for line in reader(csv_file)][1:] == \
+            ['10.5', 'N/A', '9.0', '11.0']
+
+
+def test_open_result_writer(tmp_path):
+    """Testing the SQLite results store when resuming a run.
+
+    Summary
+    -------
+    We open a results database with results recorded by the manifest of a
+    run, twice, as when a run is resumed twice.
+
+    Expected
+    --------
+    Results are written once, and results of other images are kept.
+    """
+    fname = tmp_path / 'results.sqlite'
+    image_paths = _images(tmp_path, 2)
+    with database.ResultStore(fname, 'run_0') as store:
+        store.write(image_paths[1], _row('image_1', '11'))
+
+    results = [(image_paths[0], _row('image_0', '10.5'))]
+    for _ in range(2):
+        writing.open_result_writer(fname, 'sqlite', results, 'run_1').close()
+
+    with database.ResultStore(fname) as store:
+        assert store.export_csv(tmp_path / 'results.csv') == 2
+
+
+def test_results_command(tmp_path, capsys):
+    """Testing the `python -m mothra results` command.
+
+    Summary
+    -------
+    We export a results database with two results, and print the results
+    of one image.
+
+    Expected
+    --------
+    Both results are exported; the results of the image are printed.
+    """
+    commands = importlib.import_module('mothra.__main__')
+    fname = tmp_path / 'results.sqlite'
+    image_paths = _images(tmp_path, 2)
+    with database.ResultStore(fname, 'run_0') as store:
+        store.write(image_paths[0], _row('image_0', '10.5'))
+        store.write(image_paths[1], _row('image_1', '11'))
+
+    args = Namespace(action='export', database=str(fname),
+                     target=str(tmp_path / 'results.csv'), run_id=None,
+                     all=False)
+    commands.results_command(args)
+    assert 'Exported 2 results' in capsys.readouterr().out
+
+    args = Namespace(action='find', database=str(fname), target='image_1',
+                     run_id=None, all=False)
+    commands.results_command(args)
+    output = capsys.readouterr().out
+    assert 'left_wing (mm): 11.0' in output
+    assert 'run_id: run_0' in output
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import torch
+
+from contextlib import nullcontext
+from mothra import identification
+from types import SimpleNamespace
+
+
+class FakeLearner:
+    """Mimics the parts of a fastai classification learner used by
+    identification.predicting_classes_batch."""
+    def __init__(self, probabilities):
+        self.probabilities = torch.tensor(probabilities)
+        self.dls = SimpleNamespace(vocab=['down', 'female', 'male'],
+                                   test_dl=self.test_dl)
+        self.forward_passes = 0
+
+    def test_dl(self, images, bs, num_workers):
+        return images
+
+    def no_bar(self):
+        return nullcontext()
+
+    def get_preds(self, dl):
+        # each fake image holds the index of its probabilities.
+        self.forward_passes += 1
+        idxs = [int(image[0, 0, 0]) for image in dl]
+        return self.probabilities[idxs], None
+
+
+def test_predicting_classes_batch(monkeypatch):
+    """Checks if predictions are returned as a structured array.
+
+    Summary
+    -------
+    We replace the network by a fake learner with known probabilities and
+    classify three images at once.
+
+    Expected
+    --------
+    One forward pass is done, and the predicted classes are the ones with
+    the highest probabilities.
+    """
+    learner = FakeLearner([[0.8, 0.1, 0.1],
+                           [0.1, 0.6, 0.3],
+                           [0.2, 0.2, 0.6]])
+    monkeypatch.setattr(identification.registry, 'get_learner',
+                        lambda weights: learner)
+
+    images = [np.full((10, 10, 3), idx, dtype='uint8') for idx in range(3)]
+    predictions = identification.predicting_classes_batch(images)
+
+    assert learner.forward_passes == 1
+    assert list(predictions['prediction']) == ['down', 'female', 'male']
+    np.testing.assert_allclose(predictions['probabilities'][1],
+                               [0.1, 0.6, 0.3])
+
+    results = identification.main_batch(images, batch_size=2)
+    assert [result[:2] for result in results] == [('upside_down', 'N/A'),
+                                                  ('right-side_up', 'female'),
+                                                  ('right-side_up', 'male')]
+    assert learner.forward_passes == 3
+
+
+def test_main_batch_errors(monkeypatch):
+    """Checks if an image failing does not fail the others in its batch.
+
+    Summary
+    -------
+    We classify three images in one batch, where the second one has no
+    probabilities in the fake learner, so its forward pass fails.
+
+    Expected
+    --------
+    The exception is returned for the second image, and the others are
+    classified.
+    """
+    learner = FakeLearner([[0.8, 0.1, 0.1],
+                           [0.2, 0.2, 0.6]])
+    monkeypatch.setattr(identification.registry, 'get_learner',
+                        lambda weights: learner)
+
+    images = [np.full((10, 10, 3), idx, dtype='uint8') for idx in (0, 5, 1)]
+    results = identification.main_batch(images, batch_size=3, errors=True)
+
+    assert isinstance(results[1], IndexError)
+    assert [results[0][:2], results[2][:2]] == [('upside_down', 'N/A'),
+                                                ('right-side_up', 'male')]
+
+    with pytest.raises(IndexError):
+        identification.main_batch(images, batch_size=3)
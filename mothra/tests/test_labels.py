@@ -0,0 +1,79 @@
+import numpy as np
+import pickle
+
+from mothra import labels
+
+
+def test_upscale_mask():
+    """Testing function labels._upscale_mask.
+
+    Summary
+    -------
+    We upscale a small binary mask by integer and non-integer factors, and
+    compare the results with nearest neighbor upscaling of the whole mask.
+
+    Expected
+    --------
+    Results are equal to upscaling the whole mask, and empty masks stay
+    empty.
+    """
+    mask = np.zeros((10, 20), dtype=bool)
+    mask[2:5, 3:9] = True
+    mask[6, 12] = True
+
+    result = labels._upscale_mask(mask, (40, 80))
+    np.testing.assert_array_equal(result, mask.repeat(4, 0).repeat(4, 1))
+
+    shape = (33, 47)
+    rows = (np.arange(shape[0]) + 0.5) * mask.shape[0] / shape[0]
+    cols = (np.arange(shape[1]) + 0.5) * mask.shape[1] / shape[1]
+    expected = mask[np.ix_(rows.astype(int), cols.astype(int))]
+    np.testing.assert_array_equal(labels._upscale_mask(mask, shape),
+                                  expected)
+
+    result = labels._upscale_mask(np.zeros((10, 20), dtype=bool), (40, 80))
+    assert result.shape == (40, 80)
+    assert not result.any()
+
+
+def test_label_map():
+    """Testing class labels.LabelMap.
+
+    Summary
+    -------
+    We build a label map from small binary images of tags, ruler and
+    lepidopteran, for an image three times larger, and pickle it.
+
+    Expected
+    --------
+    Binary images and bounding boxes are returned at full resolution and
+    match each other; the pickled label map does not contain binary images,
+    and is equal to the original one.
+    """
+    tags_bin = np.zeros((10, 20), dtype=bool)
+    ruler_bin = np.zeros((10, 20), dtype=bool)
+    lepidop_bin = np.zeros((10, 20), dtype=bool)
+    tags_bin[1:4, 15:19] = True
+    ruler_bin[8:, :] = True
+    lepidop_bin[2:7, 2:12] = True
+
+    label_map = labels.LabelMap.from_masks(tags_bin, ruler_bin, lepidop_bin,
+                                           (30, 60))
+    assert label_map.labels.dtype == np.uint8
+
+    for label, image_bin in zip(labels.CLASSES, (tags_bin, ruler_bin,
+                                                  lepidop_bin)):
+        mask = label_map.mask(label)
+        np.testing.assert_array_equal(mask,
+                                      image_bin.repeat(3, 0).repeat(3, 1))
+        rows, cols = np.nonzero(mask)
+        assert label_map.bbox(label) == (rows.min(), cols.min(),
+                                         rows.max() + 1, cols.max() + 1)
+    assert label_map.bbox(labels.BACKGROUND + 4) is None
+
+    tags_result, ruler_result, lepid_result = label_map
+    assert lepid_result is label_map.mask(labels.LEPIDOP)
+
+    restored = pickle.loads(pickle.dumps(label_map))
+    assert restored == label_map
+    assert restored._masks == {}
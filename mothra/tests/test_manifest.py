@@ -0,0 +1,54 @@
+import os
+
+from mothra import manifest
+
+
+def test_manifest(tmp_path):
+    """Checks if a manifest records the processed images, and is loaded
+    back after a crash.
+
+    Summary
+    -------
+    We record three images (two done, one failed), cut the last line of the
+    manifest as a crash would, load it, and modify one of the images.
+
+    Expected
+    --------
+    The cut record is ignored; only done images that did not change are
+    completed, and their results are returned in processing order. Records
+    added after loading start a new line.
+    """
+    image_paths = []
+    for idx in range(4):
+        image_path = tmp_path / f'image_{idx}.jpg'
+        image_path.write_bytes(b'image')
+        image_paths.append(str(image_path))
+
+    path = tmp_path / manifest.MANIFEST_NAME
+    run_manifest = manifest.Manifest.create(path, 'measurements',
+                                            tmp_path / 'results.csv', 'csv')
+    run_manifest.record(image_paths[1], manifest.DONE, ['image_1', 1.5])
+    run_manifest.record(image_paths[0], manifest.DONE, ['image_0', 2])
+    run_manifest.record(image_paths[2], manifest.FAILED, error='failed')
+    run_manifest.record(image_paths[3], manifest.DONE, ['image_3', 3])
+
+    # cutting the last record.
+    with open(path, 'rb+') as manifest_file:
+        manifest_file.truncate(os.path.getsize(path) - 10)
+
+    loaded = manifest.Manifest.load(path)
+    assert loaded.run['stage'] == 'measurements'
+    assert loaded.run['results'] == str(tmp_path / 'results.csv')
+    assert loaded.run['format'] == 'csv'
+    assert loaded.completed(image_paths) == image_paths[:2]
+    assert loaded.results(image_paths) == [(image_paths[1], ['image_1', '1.5']),
+                                           (image_paths[0], ['image_0', '2'])]
+    assert len(loaded.run['run_id']) == 32
+
+    os.utime(image_paths[0], ns=(0, 0))
+    assert loaded.completed(image_paths) == image_paths[1:2]
+
+    loaded.record(image_paths[3], manifest.DONE, ['image_3', 3])
+    reloaded = manifest.Manifest.load(path)
+    assert reloaded.completed(image_paths) == [image_paths[1],
+                                               image_paths[3]]
@@ -1,5 +1,7 @@
+import os
+
 from glob import glob
-from mothra import misc
+from mothra import misc, writing
 from skimage.io import imread
 
 PATH_TEST_FILES = 'mothra/tests/test_files'
@@ -60,3 +62,28 @@ def test_read_paths_in_file():
     image_paths = misc._read_paths_in_file(TEST_INPUT_FILE)
 
     assert image_paths.sort() == TEST_INPUT_IMAGES.sort()
+
+
+def test_initialize_path_keep(tmp_path):
+    """Checks if the output folder is emptied, keeping a results database.
+
+    Summary
+    -------
+    We initialize an output folder containing the results of a previous
+    run, including a SQLite database and its write-ahead log, keeping the
+    files of the database as the pipeline does.
+
+    Expected
+    --------
+    Only the files of the database are left.
+    """
+    fnames = ['results.sqlite', 'results.sqlite-wal', 'results.csv',
+              'manifest.jsonl', 'image.png']
+    for fname in fnames:
+        (tmp_path / fname).write_text('')
+
+    kept_files = writing.kept_files(tmp_path / 'results.csv', 'sqlite')
+    misc.initialize_path(str(tmp_path), kept_files)
+
+    assert sorted(os.listdir(tmp_path)) == ['results.sqlite',
+                                            'results.sqlite-wal']
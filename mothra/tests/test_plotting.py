@@ -1,3 +1,6 @@
+import numpy as np
+import pickle
+
 from mothra import plotting
 
 
@@ -28,3 +31,33 @@ def test_create_layout():
         assert ax
     for ax in axes[3:]:
         assert ax is None
+
+
+def test_record_layout(tmp_path):
+    """Checks if plots recorded by plotting.record_layout are saved by
+    plotting.render, with small recordings.
+
+    Summary
+    -------
+    We record a large image and a line on the layout of detailed plots,
+    pickle it, as when sending it to another process, and render it.
+
+    Expected
+    --------
+    Recorded Axes are in the slots of plotting.create_layout; the image is
+    downsampled, keeping its coordinates, and the figure is saved.
+    """
+    axes = plotting.record_layout(1, 2, dpi=100)
+    assert [ax is None for ax in axes] == \
+        [ax is None for ax in plotting.create_layout(1, 2)]
+
+    axes[0].imshow(np.zeros((1000, 2000, 3), dtype=np.uint8))
+    axes[0].plot([0, 1999], [0, 999], color='r')
+    name, (image,), kwargs = axes[0].calls[0]
+    assert name == 'imshow'
+    assert image.shape[:2] == (112, 223)
+    assert kwargs['extent'] == (-0.5, 1999.5, 999.5, -0.5)
+
+    output_path = tmp_path / 'plot.png'
+    plotting.render(pickle.loads(pickle.dumps(axes)), 1, 2, output_path, 100)
+    assert output_path.is_file()
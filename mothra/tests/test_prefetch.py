@@ -0,0 +1,68 @@
+import numpy as np
+import threading
+
+from mothra import prefetch
+
+
+def test_prefetch_order_and_errors():
+    """Checks if prefetched items are returned in input order, with their
+    errors.
+
+    Summary
+    -------
+    We prefetch items with several threads, where one item raises an
+    exception while loading.
+
+    Expected
+    --------
+    Items are returned in input order; the failed item returns its error.
+    """
+    def load(item):
+        if item == 3:
+            raise ValueError('cannot load')
+        return np.full(10, item)
+
+    results = list(prefetch.prefetch(range(6), load, depth=3, threads=3))
+
+    assert [item for item, _, _ in results] == list(range(6))
+    for item, value, error in results:
+        if item == 3:
+            assert value is None and isinstance(error, ValueError)
+        else:
+            assert error is None and value[0] == item
+
+
+def test_prefetch_bounded():
+    """Checks if prefetching respects the queue depth and the memory
+    budget.
+
+    Summary
+    -------
+    We count how many items were loaded before the first item is consumed.
+
+    Expected
+    --------
+    No more than `depth` items are loaded; with a memory budget smaller than
+    one item, items are loaded one at a time.
+    """
+    loaded = []
+    lock = threading.Lock()
+
+    def load(item):
+        with lock:
+            loaded.append(item)
+        return np.zeros(1000, dtype='uint8')
+
+    items = prefetch.prefetch(range(10), load, depth=4, threads=2)
+    next(items)
+    assert len(loaded) <= 5
+    list(items)
+    assert sorted(loaded) == list(range(10))
+
+    loaded.clear()
+    items = prefetch.prefetch(range(10), load, depth=4, threads=1,
+                              max_bytes=100)
+    next(items)
+    assert len(loaded) <= 3
+    list(items)
+    assert sorted(loaded) == list(range(10))
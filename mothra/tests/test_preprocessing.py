@@ -41,3 +41,60 @@ def test_read_angle():
     angle = preprocessing.read_angle(TEST_IMAGE_90DEG)
 
     assert angle == 90
+
+
+def test_load_image_draft():
+    """Checks if images are decoded at reduced resolution.
+
+    Summary
+    -------
+    We decode a test image and a version of it tagged as tilted by 90 deg,
+    asking for a small size, and compare them with the full resolution
+    image.
+
+    Expected
+    --------
+    The images are smaller than the full resolution one, but not smaller
+    than the size asked; the shape returned is the full resolution one,
+    after rotation.
+    """
+    image_0deg = imread(TEST_IMAGE_0DEG)
+
+    image_small, shape = preprocessing.load_image_draft(TEST_IMAGE_0DEG,
+                                                        size=(100, 100))
+    assert shape == image_0deg.shape[:2]
+    assert image_small.shape[0] < shape[0]
+    assert min(image_small.shape[:2]) >= 100
+
+    image_small, shape = preprocessing.load_image_draft(TEST_IMAGE_90DEG,
+                                                        size=(100, 100),
+                                                        orient=True)
+    assert shape == image_0deg.shape[1::-1]
+    assert image_small.shape[0] < shape[0]
+    assert image_small.shape[0] > image_small.shape[1]
+
+
+def test_reduce_image():
+    """Checks if full resolution images are reduced as by load_image_draft.
+
+    Summary
+    -------
+    We reduce a test image, asking for the size of the image decoded by
+    preprocessing.load_image_draft, and for a size larger than the image.
+
+    Expected
+    --------
+    The reduced image has the shape of the one decoded at reduced
+    resolution, and close colors; images that cannot be reduced are
+    returned as they are.
+    """
+    image_0deg = imread(TEST_IMAGE_0DEG)
+    draft, _ = preprocessing.load_image_draft(TEST_IMAGE_0DEG,
+                                              size=(100, 100))
+
+    image_small = preprocessing.reduce_image(image_0deg, size=(100, 100))
+    assert image_small.shape == draft.shape
+    assert abs(image_small.mean() - draft.mean()) < 2
+
+    assert preprocessing.reduce_image(image_0deg, size=(10**5, 1)) is \
+        image_0deg
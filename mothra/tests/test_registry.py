@@ -0,0 +1,87 @@
+import pytest
+
+from mothra import connection, registry
+
+
+@pytest.fixture()
+def fake_weights(tmp_path, monkeypatch):
+    """Creates a fake weights file, and replaces fastai's loader and the
+    download of weights so that loads can be counted."""
+    weights = tmp_path / 'fake_weights.pkl'
+    weights.write_bytes(b'fake weights')
+
+    loads = []
+
+    def fake_load_learner(fname):
+        loads.append(fname)
+        return object()
+
+    monkeypatch.setattr(registry, 'load_learner', fake_load_learner)
+    monkeypatch.setattr(connection, 'download_weights', lambda weights: None)
+
+    yield weights, loads
+
+    registry.release()
+
+
+def test_get_learner_loads_once(fake_weights):
+    """Checks if learners are loaded only once per weights file.
+
+    Summary
+    -------
+    We request the same learner several times from registry.get_learner.
+
+    Expected
+    --------
+    The learner is loaded once, and the same object is always returned.
+    """
+    weights, loads = fake_weights
+
+    learner = registry.get_learner(weights)
+    for _ in range(5):
+        assert registry.get_learner(str(weights)) is learner
+
+    assert len(loads) == 1
+
+
+def test_get_learner_reloads_changed_weights(fake_weights):
+    """Checks if learners are reloaded when their weights change on disk.
+
+    Summary
+    -------
+    We load a learner, overwrite its weights file with different content and
+    request the learner again.
+
+    Expected
+    --------
+    A new learner is loaded, and the old one is released.
+    """
+    weights, loads = fake_weights
+
+    learner_old = registry.get_learner(weights)
+    weights.write_bytes(b'new fake weights')
+    learner_new = registry.get_learner(weights)
+
+    assert learner_new is not learner_old
+    assert len(loads) == 2
+    assert len(registry.loaded()) == 1
+
+
+def test_warm_up_and_release(fake_weights):
+    """Checks if registry.warm_up and registry.release fill and empty the
+    registry.
+
+    Expected
+    --------
+    The learner is in the registry after warm up, and is gone after release.
+    """
+    weights, loads = fake_weights
+
+    registry.warm_up(weights)
+    assert [path for path, _ in registry.loaded()] == [weights.resolve()]
+
+    registry.release(weights)
+    assert registry.loaded() == []
+
+    registry.get_learner(weights)
+    assert len(loads) == 2
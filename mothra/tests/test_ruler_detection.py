@@ -1,6 +1,10 @@
 from mothra import ruler_detection
 import numpy as np
 from numpy import testing as nt
+from scipy import ndimage as ndi
+from skimage import color
+from skimage.draw import disk
+from skimage.measure import regionprops
 
 
 RULER_TOP = 50
@@ -18,6 +22,55 @@ def test_binarize_ruler():
     nt.assert_equal(ruler_detection.binarize_ruler(input), output)
 
 
+def test_binarize_ruler_uint8():
+    """Checks if uint8 rulers are binarized as with float conversion.
+
+    Summary
+    -------
+    We binarize a ruler with dark ticks over a light, noisy background, as
+    uint8 and as float.
+
+    Expected
+    --------
+    The integer and float paths return the same binary image, and the
+    integer luminance is close to skimage's.
+    """
+    rng = np.random.default_rng(0)
+    ruler = rng.integers(180, 230, size=(100, 400, 3), dtype=np.uint8)
+    ruler[50:, ::20] = rng.integers(10, 60, size=(50, 20, 3))
+
+    result = ruler_detection.binarize_ruler(ruler)
+
+    assert result.dtype == bool
+    nt.assert_equal(result, ruler_detection.binarize_ruler(ruler / 255))
+    gray = ruler_detection._luminance_uint8(ruler)
+    assert np.abs(gray - 255 * color.rgb2gray(ruler)).max() < 1.5
+
+
+def test_luminance_uint8_saturated():
+    """Checks if the integer luminance does not overflow.
+
+    Summary
+    -------
+    We compute the luminance of saturated white, red, green and blue
+    pixels, and of black pixels.
+
+    Expected
+    --------
+    Luminances are close to skimage's: white stays 255 instead of
+    wrapping around, and black stays 0.
+    """
+    pixels = np.array([[[255, 255, 255], [255, 0, 0], [0, 255, 0],
+                        [0, 0, 255], [0, 0, 0]]], dtype=np.uint8)
+
+    gray = ruler_detection._luminance_uint8(pixels)
+
+    assert gray.dtype == np.uint8
+    assert gray[0, 0] == 255
+    assert gray[0, -1] == 0
+    assert np.abs(gray - 255 * color.rgb2gray(pixels)).max() < 1.5
+
+
 def test_fourier():
 
     T_BIG = 8
@@ -36,3 +89,118 @@ def test_main_ruler_detection():
     data[425:500, 10:500:20, :] = 0
     t_space, top_space = ruler_detection.main(data, data[:, :, 0])
     nt.assert_almost_equal(t_space, 20, decimal=0)
+
+
+def _ruler_image(spacing):
+    """Helper function. Returns an image of a ruler with ticks every
+    `spacing` pixels, alternating long and short ticks."""
+    data = np.ones((500, 500, 3))
+    data[150:500, 0:500:spacing, :] = 0
+    data[250:500, spacing//2:500:spacing, :] = 0
+    return data
+
+
+def test_main_calibrated(monkeypatch):
+    """Testing function ruler_detection.main_calibrated.
+
+    Summary
+    -------
+    We measure rulers sharing a calibration key: the first one is
+    estimated, the second one has the same ticks, and the others have ticks
+    further apart, by a multiple of the first distance or not.
+
+    Expected
+    --------
+    The calibration of the first ruler is reused for the second one, and
+    the others are estimated again, as by `main`.
+    """
+    monkeypatch.setattr(ruler_detection, 'calibrations', {})
+    key = ruler_detection.calibration_key(('Canon', 'Canon EOS 650D'),
+                                          (500, 500, 3), (0, 0, 500, 500))
+
+    results, expected = [], []
+    for spacing in (20, 20, 40, 26):
+        data = _ruler_image(spacing)
+        results.append(ruler_detection.main_calibrated(data, data[:, :, 0],
+                                                       key))
+        expected.append(ruler_detection.main(data, data[:, :, 0]))
+
+    assert [result[2] for result in results] == ['estimated', 'reused',
+                                                 'estimated', 'estimated']
+    nt.assert_almost_equal(results[0][0], 20, decimal=0)
+    assert [result[:2] for result in results] == expected
+
+
+def test_calibration_key():
+    """Testing function ruler_detection.calibration_key.
+
+    Summary
+    -------
+    We compute keys for rulers slightly and clearly displaced, and for
+    another camera.
+
+    Expected
+    --------
+    Only the slightly displaced ruler shares the key of the first one.
+    """
+    camera = ('Canon', 'Canon EOS 650D')
+    key = ruler_detection.calibration_key(camera, (1000, 2000),
+                                          (805, 120, 945, 1880))
+
+    assert key == ruler_detection.calibration_key(camera, (1000, 2000),
+                                                  (806, 122, 944, 1881))
+    assert key != ruler_detection.calibration_key(camera, (1000, 2000),
+                                                  (705, 120, 845, 1880))
+    assert key != ruler_detection.calibration_key(None, (1000, 2000),
+                                                  (805, 120, 945, 1880))
+
+
+def _remove_numbers_regionprops(focus):
+    """Former implementation of ruler_detection.remove_numbers, based on
+    regionprops."""
+    markers, _ = ndi.label(focus, ndi.generate_binary_structure(2, 1))
+    regions = regionprops(markers)
+    avg_area = np.mean([region.area_filled for region in regions])
+
+    focus_numbers_filled = np.copy(focus)
+    for region in regions:
+        if region.eccentricity < 0.99 and region.area_filled > avg_area:
+            min_row, min_col, max_row, max_col = region.bbox
+            focus_numbers_filled[min_row:max_row, min_col:max_col] = 0
+
+    return focus_numbers_filled
+
+
+def test_remove_numbers_parity():
+    """Checks if remove_numbers matches its former implementation, based on
+    regionprops.
+
+    Summary
+    -------
+    We draw a ruler with ticks, numbers (rings, with and without dots in
+    their holes) and noise, and remove its numbers with both
+    implementations.
+
+    Expected
+    --------
+    Both implementations return the same binary image, without numbers.
+    """
+    rng = np.random.default_rng(0)
+    focus = np.zeros((150, 1000), dtype=bool)
+    focus[40:150, ::20] = True
+    focus[80:150, 10::20] = True
+    for idx in range(10):
+        rows, cols = disk((20, 50 + 100 * idx), 12)
+        focus[rows, cols] = True
+        rows, cols = disk((20, 50 + 100 * idx), 6)
+        focus[rows, cols] = False
+        if idx % 2:
+            focus[19:22, 49 + 100 * idx:52 + 100 * idx] = True
+    focus[rng.integers(0, 150, 200), rng.integers(0, 1000, 200)] = True
+
+    result = ruler_detection.remove_numbers(focus)
+
+    nt.assert_equal(result, _remove_numbers_regionprops(focus))
+    for idx in range(10):
+        assert not result[8:33, 38 + 100 * idx:63 + 100 * idx].any()
+
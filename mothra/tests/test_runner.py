@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import pytest
+import time
+
+from argparse import Namespace
+from mothra import runner, stages
+
+
+def fake_process_chunk(image_paths, args, images=None):
+    """Mimics runner.process_chunk: images named 'error' fail, images named
+    'crash' kill their worker, and images named 'slow...' take some time."""
+    results = []
+    for image_path in image_paths:
+        if image_path == 'crash':
+            os._exit(1)
+        if image_path.startswith('slow'):
+            time.sleep(0.2)
+        error = 'failed' if image_path == 'error' else None
+        results.append({'image_path': image_path, 'error': error,
+                        'pid': os.getpid()})
+    return results, stages.Timer()
+
+
+@pytest.fixture()
+def fake_runner(monkeypatch):
+    monkeypatch.setattr(runner, 'process_chunk', fake_process_chunk)
+    monkeypatch.setattr(runner, 'setup', lambda args: None)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='workers need to inherit the fake functions')
+def test_run_workers(fake_runner):
+    """Checks if images processed by several workers are returned in input
+    order, and if failures do not stop the other images.
+
+    Summary
+    -------
+    We process images with two workers, where one image fails and another
+    one kills its worker.
+
+    Expected
+    --------
+    All images are returned in input order; the failed and crashed images
+    carry errors, and the others do not.
+    """
+    image_paths = [f'image_{idx}' for idx in range(7)]
+    image_paths[2] = 'error'
+    image_paths[5] = 'crash'
+    args = Namespace(batch_size=2, workers=2, completion_order=False,
+                     prefetch=0, draft_decode=False)
+
+    results = list(runner.run(image_paths, args))
+
+    assert [result['image_path'] for result in results] == image_paths
+    failed = [result['image_path'] for result in results if result['error']]
+    assert failed == ['error', 'crash']
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='workers need to inherit the fake functions')
+def test_run_workers_crash(fake_runner):
+    """Checks if the images not started when a worker dies are still
+    processed in parallel.
+
+    Summary
+    -------
+    We process slow images with two workers, one image per chunk, where the
+    second image kills its worker.
+
+    Expected
+    --------
+    Only the crashed image carries an error. The images started after the
+    crash are processed by several workers, and the images being processed
+    when the worker died are retried in a single worker.
+    """
+    image_paths = [f'slow_{idx}' for idx in range(10)]
+    image_paths[1] = 'crash'
+    args = Namespace(batch_size=1, workers=2, completion_order=False,
+                     prefetch=0, draft_decode=False)
+
+    results = list(runner.run(image_paths, args))
+
+    assert [result['image_path'] for result in results] == image_paths
+    failed = [result['image_path'] for result in results if result['error']]
+    assert failed == ['crash']
+    # at most two images were being processed when the worker died.
+    assert len({result['pid'] for result in results[3:]}) >= 2
+
+
+def test_run_single_process(fake_runner):
+    """Checks if images are processed in this process when there is only one
+    worker.
+
+    Expected
+    --------
+    All images are returned in input order.
+    """
+    image_paths = [f'image_{idx}' for idx in range(5)]
+    args = Namespace(batch_size=2, workers=1, completion_order=False,
+                     prefetch=0, draft_decode=False)
+
+    results = list(runner.run(image_paths, args))
+
+    assert [result['image_path'] for result in results] == image_paths
+
+
+def test_prefetch_images_reduced(monkeypatch):
+    """Checks which images are decoded at full resolution when the networks
+    get reduced resolution images.
+
+    Summary
+    -------
+    We prefetch a test image with `draft_decode`, for the stages measuring
+    the ruler and for identification only.
+
+    Expected
+    --------
+    The full resolution image is decoded ahead, with the reduced one, only
+    when the ruler is measured.
+    """
+    from mothra import binarization
+    from skimage.io import imread
+
+    monkeypatch.setattr(binarization, 'input_size', lambda: (100, 100))
+    image_path = 'mothra/tests/test_files/test_input/' \
+        'BMNHE_1105737_angle0.JPG'
+    args = Namespace(stage='measurements', draft_decode=True,
+                     auto_rotate=False, plot=False, detailed_plot=False,
+                     prefetch_memory=0, prefetch_threads=1)
+
+    [(_, image, error)] = runner._prefetch_images([image_path], args, 1)
+    image_small, shape, image_rgb = image
+    assert error is None
+    assert (image_rgb == imread(image_path)).all()
+    assert shape == image_rgb.shape[:2]
+    assert image_small.shape[0] < shape[0]
+
+    args.stage = 'identification'
+    [(_, image, error)] = runner._prefetch_images([image_path], args, 1)
+    assert image[1] == shape
+    assert image[2] is None
@@ -0,0 +1,227 @@
+import os
+import pytest
+
+from mothra import cache, stages
+
+
+@pytest.fixture()
+def fake_stages():
+    """Implements a small graph of stages that records its calls.
+
+    Notes
+    -----
+    'double' fails for negative numbers; 'total' is batched.
+    """
+    calls = []
+
+    def double(number):
+        calls.append('double')
+        if number < 0:
+            raise ValueError('negative number')
+        return (2 * number,)
+
+    def square(number):
+        calls.append('square')
+        return (number ** 2,)
+
+    def add(doubled, squared):
+        calls.append('add')
+        return (doubled + squared,)
+
+    def total(added):
+        calls.append('total')
+        return [(sum(added),)] * len(added)
+
+    graph = [
+        stages.Stage('add', ('doubled', 'squared'), ('added',), add, False),
+        stages.Stage('double', ('number',), ('doubled',), double, False),
+        stages.Stage('square', ('number',), ('squared',), square, False),
+        stages.Stage('total', ('added',), ('total',), total, True),
+    ]
+    return graph, calls
+
+
+def test_plan(fake_stages):
+    """Checks if stages are ordered according to their dependencies.
+
+    Expected
+    --------
+    Stages run after the ones they depend on, and stages whose outputs are
+    known are not planned.
+    """
+    graph, _ = fake_stages
+
+    ordered = [stage.name for stage in stages.plan(['total'], ['number'],
+                                                   graph)]
+    assert ordered == ['double', 'square', 'add', 'total']
+
+    ordered = [stage.name for stage in stages.plan(['add'],
+                                                   ['number', 'doubled'],
+                                                   graph)]
+    assert ordered == ['square', 'add']
+
+    with pytest.raises(ValueError):
+        stages.plan(['add'], [], graph)
+
+
+def test_run(fake_stages):
+    """Checks if stages run once per image, and if failures are kept to the
+    image where they happened.
+
+    Expected
+    --------
+    Each stage runs once per image (batched stages, once per call), failed
+    images carry their error, and intermediate values are released.
+    """
+    graph, calls = fake_stages
+
+    contexts = [{'number': number} for number in (1, -1, 3)]
+    stages.run(contexts, ['add', 'total'], stages=graph)
+
+    assert calls.count('double') == 3
+    assert calls.count('square') == 2
+    assert calls.count('add') == 2
+    assert calls.count('total') == 1
+
+    assert contexts[0] == {'number': 1, 'added': 3, 'total': 18}
+    assert contexts[2] == {'number': 3, 'added': 15, 'total': 18}
+    assert isinstance(contexts[1]['error'], ValueError)
+    assert contexts[1]['failed_stage'] == 'double'
+
+
+def test_resolve_targets():
+    """Checks if legacy stage names are translated into stages of the
+    pipeline.
+
+    Expected
+    --------
+    Legacy names return their stages, stages return themselves, and
+    unknown names raise ValueError.
+    """
+    assert stages.resolve_targets('ruler_detection') == ('ruler',)
+    assert stages.resolve_targets('tracing') == ('tracing',)
+    with pytest.raises(ValueError):
+        stages.resolve_targets('unknown')
+
+    ordered = [stage.name for stage in stages.plan(
+        stages.resolve_targets('measurements'), stages.INPUTS)]
+    assert ordered.count('segment') == 1
+    assert ordered.index('segment') < ordered.index('ruler')
+
+
+def test_plan_reduced_resolution():
+    """Checks the stages run when the networks get a reduced resolution
+    image.
+
+    Summary
+    -------
+    We plan the 'measurements' stages, giving the network input and the
+    full resolution shape of the image.
+
+    Expected
+    --------
+    The full resolution image is decoded only after segmentation, for the
+    ruler; identification does not need it.
+    """
+    known = stages.INPUTS + ('image_segment', 'image_shape')
+
+    ordered = [stage.name for stage in stages.plan(
+        stages.resolve_targets('measurements'), known)]
+    assert 'segment_input' not in ordered
+    assert ordered.index('segment') < ordered.index('decode')
+    assert ordered.index('decode') < ordered.index('ruler')
+
+    ordered = [stage.name for stage in stages.plan(['identification'], known)]
+    assert ordered == ['identification']
+
+
+def test_run_cached(fake_stages, tmp_path):
+    """Checks if cached outputs are reused, skipping the stages they depend
+    on.
+
+    Summary
+    -------
+    We run the 'add' stage (cached) twice for the same images, with the same
+    cache, and then once more after modifying one of the images.
+
+    Expected
+    --------
+    The second run computes nothing and returns the same results; the third
+    run only computes the modified image.
+    """
+    graph, calls = fake_stages
+    graph = [stage._replace(cached=stage.name == 'add') for stage in graph]
+    store = cache.StageCache(tmp_path / 'cachedir')
+
+    image_paths = []
+    for number in (1, 3):
+        image_path = tmp_path / f'image_{number}.txt'
+        image_path.write_text(str(number))
+        image_paths.append(str(image_path))
+
+    def run_images():
+        contexts = [{'image_path': image_path,
+                     'number': int(open(image_path).read())}
+                    for image_path in image_paths]
+        return stages.run(contexts, ['add'], stages=graph, store=store)
+
+    first = run_images()
+    assert calls.count('add') == 2
+
+    calls.clear()
+    assert run_images() == first
+    assert calls == []
+    assert stages.cached(image_paths[0], ['add'], store, graph)
+
+    with open(image_paths[1], 'w') as image_file:
+        image_file.write('4')
+    os.utime(image_paths[1], ns=(0, 0))
+    assert run_images()[1]['added'] == 24
+    assert calls == ['double', 'square', 'add']
+
+
+def test_run_evicted(fake_stages, tmp_path):
+    """Checks if images whose outputs were cached when deciding not to read
+    them are still processed if their outputs are evicted before running.
+
+    Summary
+    -------
+    We cache the outputs of two images, read the first one in advance and
+    skip the second one, whose outputs are cached, as the prefetching of
+    the pipeline does. The cache is then emptied before running the stages.
+
+    Expected
+    --------
+    The second image is read by its stage, and both images get their
+    results.
+    """
+    graph, calls = fake_stages
+
+    def read(image_path):
+        calls.append('read')
+        return (int(open(image_path).read()),)
+
+    graph = [stage._replace(cached=stage.name == 'add') for stage in graph]
+    graph.append(stages.Stage('read', ('image_path',), ('number',), read,
+                              False))
+    store = cache.StageCache(tmp_path / 'cachedir')
+
+    image_paths = []
+    for number in (1, 3):
+        image_path = tmp_path / f'image_{number}.txt'
+        image_path.write_text(str(number))
+        image_paths.append(str(image_path))
+    stages.run([{'image_path': image_path} for image_path in image_paths],
+               ['add'], stages=graph, store=store)
+
+    contexts = [{'image_path': image_paths[0], 'number': 1},
+                {'image_path': image_paths[1]}]
+    assert stages.cached(image_paths[1], ['add'], store, graph)
+    store.prune(max_items=0)
+    calls.clear()
+
+    stages.run(contexts, ['add'], stages=graph, store=store)
+
+    assert [context['added'] for context in contexts] == [3, 15]
+    assert calls.count('read') == 1
+    assert 'error' not in contexts[1]
@@ -1,5 +1,6 @@
 import numpy as np
 import pytest
+import scipy as sp
 from numpy.testing import assert_array_equal
 
 from mothra import tracing
@@ -38,6 +39,57 @@ def test_remove_antenna(fake_butterfly):
     assert np.sum(without_antenna_r[260, 201:501]) == 0
 
 
+def _remove_antenna_dilation(half_binary):
+    """Former implementation of tracing.remove_antenna, dilating the
+    background and the largest hole 35 times each."""
+    markers, _ = sp.ndimage.label(
+        1 - half_binary,
+        sp.ndimage.generate_binary_structure(2, 1)
+    )
+    areas = np.bincount(markers.ravel())[1:]
+    idx_sorted = 1 + np.argsort(-areas)[:2]
+
+    try:
+        dilated_bg = sp.ndimage.binary_dilation(
+            markers == idx_sorted[0], iterations=35
+        )
+        dilated_hole = sp.ndimage.binary_dilation(
+            markers == idx_sorted[1], iterations=35
+        )
+    except IndexError:
+        return half_binary
+    without_antenna = np.copy(half_binary)
+    without_antenna[np.minimum(dilated_bg, dilated_hole)] = 0
+
+    return without_antenna
+
+
+def test_remove_antenna_parity(fake_butterfly):
+    """Checks if tracing.remove_antenna matches its former implementation,
+    based on binary dilations.
+
+    Summary
+    -------
+    We add antennae and noise to the halves of the fake butterfly, and
+    remove antennae with both implementations.
+
+    Expected
+    --------
+    Both implementations return the same binary images.
+    """
+    rng = np.random.default_rng(0)
+    middle = tracing.split_picture(fake_butterfly)
+    fake_butterfly[260, 500:800] = 1
+    fake_butterfly[255:265:2, 1300:1500] = 1
+    fake_butterfly[rng.integers(200, 950, 300),
+                   rng.integers(0, 2000, 300)] = 1
+
+    for half_binary in (fake_butterfly[:, :middle],
+                        fake_butterfly[:, middle:]):
+        assert_array_equal(tracing.remove_antenna(half_binary),
+                           _remove_antenna_dilation(half_binary))
+
+
 def test_outer_pix(fake_butterfly):
     middle = tracing.split_picture(fake_butterfly)
 
@@ -58,6 +110,35 @@ def test_outer_pix(fake_butterfly):
     assert_array_equal(outer_pix_r, np.array([250, 1749]))
 
 
+def test_outer_pix_ties():
+    """Checks if tracing.detect_outer_pix breaks ties between the farthest
+    pixels as when checking all pixels of the wing.
+
+    Summary
+    -------
+    We use wings symmetric about the center, with several pixels at the
+    largest distance, and compare detect_outer_pix with a search on all
+    pixels.
+
+    Expected
+    --------
+    Both return the first farthest pixel, in raster order.
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        wing = rng.random((41, 41)) > 0.3
+        wing = wing | wing[::-1] | wing[:, ::-1]
+        center = (20, 20)
+
+        markers, _ = sp.ndimage.label(wing)
+        largest = np.argmax(np.bincount(markers.ravel())[1:]) + 1
+        coords = np.argwhere(markers == largest)
+        distances = np.linalg.norm(coords - center, axis=-1)
+
+        assert_array_equal(tracing.detect_outer_pix(wing, center),
+                           coords[np.argmax(distances)])
+
+
 def test_inner_pix(fake_butterfly):
     middle = tracing.split_picture(fake_butterfly)
 
@@ -76,3 +157,43 @@ def test_inner_pix(fake_butterfly):
 
     assert_array_equal(inner_pix_l, np.array([499, 799]))
     assert_array_equal(inner_pix_r, np.array([499, 1200]))
+
+
+def test_main_cropped(fake_butterfly):
+    """Checks if tracing.main returns points in coordinates of the input
+    picture, while tracing the butterfly within its bounding box.
+
+    Summary
+    -------
+    We trace the fake butterfly, and the same butterfly with an extra empty
+    area on the left of the picture.
+
+    Expected
+    --------
+    Points of interest are shifted by the width of the extra area.
+    """
+    points_interest = tracing.main(fake_butterfly)
+
+    padded = np.pad(fake_butterfly, ((0, 0), (700, 0)))
+    points_padded = tracing.main(padded)
+
+    for key, point in points_interest.items():
+        assert_array_equal(np.asarray(points_padded[key]),
+                           np.asarray(point) + np.array([0, 700]))
+
+
+def test_main_parallel(fake_butterfly):
+    """Checks if tracing both wings at the same time gives the same results.
+
+    Expected
+    --------
+    Points of interest are equal with and without parallel processing.
+    """
+    fake_butterfly[260, 500:800] = 1
+
+    points_interest = tracing.main(fake_butterfly, parallel=False)
+    points_parallel = tracing.main(fake_butterfly, parallel=True)
+
+    for key, point in points_interest.items():
+        assert_array_equal(np.asarray(points_parallel[key]),
+                           np.asarray(point))
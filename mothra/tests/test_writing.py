@@ -1,3 +1,6 @@
+import os
+import pytest
+
 from csv import reader
 from mothra import writing
 from pathlib import Path
@@ -63,10 +66,11 @@ def test_write_csv_data():
         ['image_id', 'left_wing (mm)', 'right_wing (mm)',
          'left_wing_center (mm)', 'right_wing_center (mm)',
          'wing_span (mm)', 'wing_shoulder (mm)', 'position',
-         'gender', 'prob_upside_down', 'prob_female', 'prob_male'],
+         'gender', 'prob_upside_down', 'prob_female', 'prob_male',
+         'ruler_calibration'],
         ['test_image', 'test_l', 'test_r', 'test_dcl', 'test_dcr',
          'test_span', 'test_shoulder', 'test_pos', 'test_gender',
-         'test_prob_ud', 'test_prob_f', 'test_prob_m']
+         'test_prob_ud', 'test_prob_f', 'test_prob_m', 'estimated']
         ]
 
     result_csv = writing.initialize_csv_file(csv_fname)
@@ -83,6 +87,80 @@ def test_write_csv_data():
     result_csv.unlink()
 
 
+ROWS = [['image_0', 1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 'right-side_up', 'male',
+         0.1, 0.2, 0.7, 'estimated'],
+        ['image_1', 1, 2, 3, 4, 5, 6, 'upside_down', 'N/A', 0.9, 0.05, 0.05,
+         'reused']]
+
+
+def test_result_writer_csv(tmp_path):
+    """Testing class writing.ResultWriter, with CSV files.
+
+    Summary
+    -------
+    We replace a file with a writer given a first row, write two more rows,
+    and read the file after each one.
+
+    Expected
+    --------
+    The file is replaced with the header and given rows at once, leaving
+    no temporary file; other rows are kept until enough of them are kept,
+    and are written after the header, as by writing.write_csv_data.
+    """
+    csv_fname = tmp_path / 'results.csv'
+    csv_fname.write_text('old contents\n')
+
+    result_writer = writing.ResultWriter(csv_fname,
+                                         results=[('image_0', ROWS[0])],
+                                         flush_rows=2)
+    result_writer.write('image_1', ROWS[1])
+    with open(csv_fname, newline='') as csv:
+        assert len(list(reader(csv))) == 2
+
+    result_writer.write('image_0', ROWS[0])
+    with open(csv_fname, newline='') as csv:
+        assert len(list(reader(csv))) == 4
+    result_writer.close()
+    with open(csv_fname, newline='') as csv:
+        rows = list(reader(csv))
+    expected = [[str(value) for value in row] for row in ROWS + ROWS[:1]]
+    assert rows == [writing.DATA_COLS] + expected
+    assert os.listdir(tmp_path) == ['results.csv']
+
+
+def test_result_writer_parquet(tmp_path):
+    """Testing class writing.ResultWriter, with Parquet files.
+
+    Summary
+    -------
+    We replace a file with a writer, writing rows in two batches, including
+    a row read from a manifest (with values as strings), and read the file
+    back.
+
+    Expected
+    --------
+    The file is only replaced when closing the writer. Distances and
+    probabilities are floats, and missing values are null.
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+    fname = tmp_path / 'results.parquet'
+    fname.write_text('old contents\n')
+
+    text_row = [str(value) for value in ROWS[0]]
+    with writing.ResultWriter(fname, 'parquet',
+                              results=[('image_0', text_row)],
+                              flush_rows=1) as result_writer:
+        result_writer.write('image_1', ROWS[1])
+        assert fname.read_text() == 'old contents\n'
+
+    assert os.listdir(tmp_path) == ['results.parquet']
+    table = pq.read_table(fname)
+    assert table.column_names == writing.DATA_COLS
+    assert table.column('left_wing (mm)').to_pylist() == [1.5, 1.0]
+    assert table.column('gender').to_pylist() == ['male', None]
+    assert str(table.schema.field('prob_male').type) == 'double'
+
+
 def test_check_aux_file():
     """Checks if filename is updated correctly if file already exists
     in disk.
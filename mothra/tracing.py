@@ -1,10 +1,21 @@
 import numpy as np
 import scipy as sp
-from skimage.measure import regionprops
-from joblib import Memory
+from concurrent.futures import ThreadPoolExecutor
+from mothra import components
 
 
-from .cache import memory
+# Maximum distance, in pixels, from both the background and the largest hole
+# of a wing for pixels removed as part of an antenna.
+ANTENNA_DISTANCE = 35
+
+# Margin, in pixels, kept around the butterfly while tracing it. Larger than
+# ANTENNA_DISTANCE, so the background considered when removing antennae is
+# unchanged.
+CROP_MARGIN = 2 * ANTENNA_DISTANCE
+
+# Default for processing both wings at the same time in `main`; set by the
+# pipeline.
+parallel_wings = False
 
 
 def remove_antenna(half_binary):
@@ -20,33 +31,48 @@ def remove_antenna(half_binary):
     without_antenna : 2D array
         binary image, same shape as input without antenna (if it touches the
         wing)
-    """
 
-    markers, _ = sp.ndimage.label(
-        1 - half_binary,
-        sp.ndimage.generate_binary_structure(2, 1)
-    )
-    regions = regionprops(markers)
+    Notes
+    -----
+    Pixels closer than `ANTENNA_DISTANCE` to both the background and the
+    largest hole are removed. Distances are taxicab distances, so this is
+    the same as intersecting both regions dilated `ANTENNA_DISTANCE` times
+    by a cross.
+    """
+    regions = components.Components(1 - half_binary, connectivity=1)
+    markers = regions.markers
 
-    areas = np.array([r.area for r in regions])
-    idx_sorted = 1 + np.argsort(-areas)[:2]
+    idx_sorted = 1 + np.argsort(-regions.areas)[:2]
 
     try:
-        dilated_bg = sp.ndimage.binary_dilation(
-            markers == idx_sorted[0], iterations=35
-        )
-        dilated_hole = sp.ndimage.binary_dilation(
-            markers == idx_sorted[1], iterations=35
-        )
-        intersection = np.minimum(dilated_bg, dilated_hole)
+        # only pixels close to the hole can be removed; the background is
+        # considered up to `ANTENNA_DISTANCE` further away.
+        min_row, min_col, max_row, max_col = regions.bbox(idx_sorted[1])
+        margin = 2 * ANTENNA_DISTANCE
+        window = (slice(max(min_row - margin, 0), max_row + margin),
+                  slice(max(min_col - margin, 0), max_col + margin))
+
+        close_bg = _within_distance(markers[window] == idx_sorted[0],
+                                    ANTENNA_DISTANCE)
+        close_hole = _within_distance(markers[window] == idx_sorted[1],
+                                      ANTENNA_DISTANCE)
         without_antenna = np.copy(half_binary)
-        without_antenna[intersection] = 0
+        without_antenna[window][close_bg & close_hole] = 0
     except IndexError:
         return half_binary
 
     return without_antenna
 
 
+def _within_distance(region, distance):
+    """Helper function. Returns the pixels at a taxicab distance of at most
+    `distance` from `region`."""
+    if not region.any():
+        return region
+    return sp.ndimage.distance_transform_cdt(~region,
+                                             metric='taxicab') <= distance
+
+
 def detect_outer_pix(half_binary, center):
     """Relative (r, c) coordinates of outer pixel (wing's tip)
 
@@ -61,16 +87,17 @@ def detect_outer_pix(half_binary, center):
     -------
     outer_pix : 1D array
         relative coordinates of the outer pixel (r, c)
+
+    Notes
+    -----
+    Only the leftmost and rightmost pixels of each row of the wing are
+    checked, since they contain the pixels farthest from any point.
     """
-    markers, _ = sp.ndimage.label(
-        half_binary,
-        sp.ndimage.generate_binary_structure(2, 1)
-    )
-    regions = regionprops(markers)
-    areas = [r.area for r in regions]
-    idx_max = np.argmax(areas)
-
-    coords = regions[idx_max].coords
+    regions = components.Components(half_binary, connectivity=1)
+
+    # the farthest pixels are at the left or right end of their rows; they
+    # are checked in raster order, so ties are broken as for all pixels.
+    coords = regions.row_extremes(regions.largest())
     distances = np.linalg.norm(coords - center, axis=-1)
     idx_outer_pix = np.argmax(distances)
     outer_pix = coords[idx_outer_pix]
@@ -78,7 +105,7 @@ def detect_outer_pix(half_binary, center):
     return outer_pix
 
 
-def detect_inner_pix(half_binary, outer_pix, side):
+def detect_inner_pix(half_binary, outer_pix, side, lower_bound=None):
     """Relative (r, c) coordinates of the inner pixel (between wing and body)
 
     Arguments
@@ -89,6 +116,9 @@ def detect_inner_pix(half_binary, outer_pix, side):
         (r, c) coordinates (relative) of the outer pixel
     side : str
         left ('l') or right ('r') wing
+    lower_bound : int, optional
+        Row below which `inner_pix` is not searched. Defaults to 3/4 of the
+        height of `half_binary`.
 
     Returns
     -------
@@ -105,7 +135,8 @@ def detect_inner_pix(half_binary, outer_pix, side):
        lepidopteran — the farthest point at the rows — is chosen
        as `inner_pix`.
     """
-    lower_bound = int(half_binary.shape[0]*0.75)
+    if lower_bound is None:
+        lower_bound = int(half_binary.shape[0]*0.75)
 
     if side == 'l':
         focus = half_binary[:lower_bound, outer_pix[1]:]
@@ -114,14 +145,11 @@ def detect_inner_pix(half_binary, outer_pix, side):
 
     focus_inv = 1 - focus
 
-    markers, _ = sp.ndimage.label(
-        focus_inv, sp.ndimage.generate_binary_structure(2, 1)
-    )
-    regions = regionprops(markers)
+    regions = components.Components(focus_inv, connectivity=1)
 
-    # if idx in regions is not 0, bottom region is considered for inner_pix,
+    # if the label is not 1, bottom region is considered for inner_pix,
     # instead of top region
-    coords = regions[0].coords
+    coords = regions.coords(1)
     y_max = np.max(coords[:, 0])
     mask = (coords[:, 0] == y_max)
     selection = coords[mask]
@@ -160,8 +188,17 @@ def split_picture(binary):
     return int(column_centroid)
 
 
-@memory.cache(ignore=['axes'])
-def main(binary, axes=None):
+def _trace_wing(half_binary, center, side, lower_bound):
+    """Helper function. Removes the antenna of a wing and returns the wing
+    without antenna, with its outer and inner pixels."""
+    without_antenna = remove_antenna(half_binary)
+    outer_pix = detect_outer_pix(without_antenna, center)
+    inner_pix = detect_inner_pix(without_antenna, outer_pix, side,
+                                 lower_bound)
+    return without_antenna, outer_pix, inner_pix
+
+
+def main(binary, axes=None, parallel=None):
     """Find and returns the coordinates of the 4 points of interest
 
     Arguments
@@ -171,6 +208,9 @@ def main(binary, axes=None):
     ax : obj
         If any is provided, POI, smoothed wings boundaries and binary will
         be plotted on it
+    parallel : bool, optional
+        If True, both wings are processed at the same time, in two threads.
+        Results are the same. Defaults to `parallel_wings`.
 
     Returns
     -------
@@ -178,7 +218,24 @@ def main(binary, axes=None):
         Dictionary containing the points of interest in the form [y, x],
         keyed with "outer_pix_l", "inner_pix_l", "outer_pix_r", "inner_pix_r",
         "body_center"
+
+    Notes
+    -----
+    The butterfly is traced within its bounding box, plus `CROP_MARGIN`
+    pixels; points of interest are returned in coordinates of `binary`.
     """
+    # Crop the butterfly
+    rows = np.flatnonzero(binary.any(axis=1))
+    cols = np.flatnonzero(binary.any(axis=0))
+    top = max(rows[0] - CROP_MARGIN, 0)
+    left = max(cols[0] - CROP_MARGIN, 0)
+    offset = np.array([top, left])
+
+    # lower bound for the inner pixels, as for the entire picture.
+    lower_bound = max(int(binary.shape[0]*0.75) - top, 0)
+    binary = binary[top:rows[-1] + 1 + CROP_MARGIN,
+                    left:cols[-1] + 1 + CROP_MARGIN]
+
     # Split the butterfly
     middle = split_picture(binary)
 
@@ -190,26 +247,32 @@ def main(binary, axes=None):
     middle_y = int(np.mean(np.argwhere(middle_arr)))
     body_center = (middle_y, middle)
 
-    # Left wing
-    without_antenna_l = remove_antenna(binary_left)
-    outer_pix_l = detect_outer_pix(without_antenna_l, body_center)
-    inner_pix_l = detect_inner_pix(without_antenna_l, outer_pix_l, 'l')
+    # Left and right wings
+    body_center_r = (middle_y, 0)  # to calculate outer_pix_r correctly
+    wings = [(binary_left, body_center, 'l', lower_bound),
+             (binary_right, body_center_r, 'r', lower_bound)]
+    if parallel is None:
+        parallel = parallel_wings
+    if parallel:
+        # scipy.ndimage releases the GIL, so wings are traced concurrently.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            wing_l, wing_r = pool.map(lambda wing: _trace_wing(*wing), wings)
+    else:
+        wing_l, wing_r = [_trace_wing(*wing) for wing in wings]
+
+    without_antenna_l, outer_pix_l, inner_pix_l = wing_l
     inner_pix_l = inner_pix_l + np.array([0, outer_pix_l[1]])
 
-    # Right wing
-    body_center_r = (middle_y, 0)  # to calculate outer_pix_r correctly
-    without_antenna_r = remove_antenna(binary_right)
-    outer_pix_r = detect_outer_pix(without_antenna_r, body_center_r)
-    inner_pix_r = detect_inner_pix(without_antenna_r, outer_pix_r, 'r')
+    without_antenna_r, outer_pix_r, inner_pix_r = wing_r
     inner_pix_r = inner_pix_r + np.array([0, middle])
     outer_pix_r = outer_pix_r + np.array([0, middle])
 
     points_interest = {
-        "outer_pix_l": outer_pix_l,
-        "inner_pix_l": inner_pix_l,
-        "outer_pix_r": outer_pix_r,
-        "inner_pix_r": inner_pix_r,
-        "body_center": body_center
+        "outer_pix_l": outer_pix_l + offset,
+        "inner_pix_l": inner_pix_l + offset,
+        "outer_pix_r": outer_pix_r + offset,
+        "inner_pix_r": inner_pix_r + offset,
+        "body_center": (middle_y + top, middle + left)
     }
 
     # Reconstruct binary image without antennae
@@ -217,8 +280,11 @@ def main(binary, axes=None):
                                       axis=1)
     if axes and axes[2]:
         axes[2].set_title('Points of interest')
-        axes[2].imshow(without_antennae)
-        axes[2].axvline(middle, color='m', linestyle='dashed')
+        # showing the cropped butterfly in coordinates of the picture.
+        axes[2].imshow(without_antennae,
+                       extent=(left - 0.5, left + binary.shape[1] - 0.5,
+                               top + binary.shape[0] - 0.5, top - 0.5))
+        axes[2].axvline(middle + left, color='m', linestyle='dashed')
         markersize = 10
         if axes[3]:
             markersize = 2
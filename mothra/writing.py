@@ -1,7 +1,44 @@
+import os
+import time
+
 from csv import writer
 from pathlib import Path
 
 
+# Data columns of the CSV file.
+DATA_COLS = ['image_id',
+             'left_wing (mm)',
+             'right_wing (mm)',
+             'left_wing_center (mm)',
+             'right_wing_center (mm)',
+             'wing_span (mm)',
+             'wing_shoulder (mm)',
+             'position',
+             'gender',
+             'prob_upside_down',
+             'prob_female',
+             'prob_male',
+             'ruler_calibration']
+
+# Type of each data column in typed (Parquet) files; distances and
+# probabilities are floats, and missing values (e.g. 'N/A') are null.
+DATA_TYPES = ['string'] + ['float64'] * 6 + ['string'] * 2 + \
+    ['float64'] * 3 + ['string']
+
+# Formats of the results file, and their extensions.
+FORMATS = ('csv', 'parquet', 'sqlite')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'sqlite': '.sqlite'}
+
+# Suffixes of the files of a SQLite database: the database, its write-ahead
+# log and its shared memory index.
+SQLITE_SUFFIXES = ('', '-wal', '-shm')
+
+# Rows kept by ResultWriter before writing them, and maximum time, in
+# seconds, they are kept.
+FLUSH_ROWS = 256
+FLUSH_SECONDS = 30
+
+
 def initialize_csv_file(csv_fname):
     """Sets up a CSV file to store the measurement results.
 
@@ -12,53 +49,260 @@ def initialize_csv_file(csv_fname):
 
     Returns
     -------
-    None
+    csv_fname : pathlib.Path
+        The filename of the CSV file, with a number added to it if
+        `csv_fname` existed already.
     """
     csv_fname = Path(csv_fname)
     # renaming csv file if it exists on disk already.
     csv_fname = _check_aux_file(csv_fname)
 
-    # setting up the data columns that will be in the file.
-    DATA_COLS = ['image_id',
-                 'left_wing (mm)',
-                 'right_wing (mm)',
-                 'left_wing_center (mm)',
-                 'right_wing_center (mm)',
-                 'wing_span (mm)',
-                 'wing_shoulder (mm)',
-                 'position',
-                 'gender',
-                 'prob_upside_down',
-                 'prob_female',
-                 'prob_male']
-
     with open(csv_fname, 'w') as csv_file:
         write_to_file = writer(csv_file)
         write_to_file.writerow(DATA_COLS)
     return csv_fname
 
 
-def write_csv_data(csv_file, image_name, dist_mm, position, gender,
-                   probabilities):
-    """Helper function. Writes data on the CSV input file."""
-    write_to_file = writer(csv_file)
-
+def csv_row(image_name, dist_mm, position, gender, probabilities,
+            calibration='estimated'):
+    """Helper function. Returns the row of the CSV file with the results of
+    an image. `calibration` tells if the ruler was 'estimated' or 'reused'
+    from a previous image."""
     # Separating probabilities into their own variables,
     # according to the order defined at the network
     prob_upside_down, prob_female, prob_male = probabilities
 
-    write_to_file.writerow([image_name,
-                            dist_mm["dist_l"],
-                            dist_mm["dist_r"],
-                            dist_mm["dist_l_center"],
-                            dist_mm["dist_r_center"],
-                            dist_mm["dist_span"],
-                            dist_mm["dist_shoulder"],
-                            position,
-                            gender,
-                            prob_upside_down,
-                            prob_female,
-                            prob_male])
+    return [image_name,
+            dist_mm["dist_l"],
+            dist_mm["dist_r"],
+            dist_mm["dist_l_center"],
+            dist_mm["dist_r_center"],
+            dist_mm["dist_span"],
+            dist_mm["dist_shoulder"],
+            position,
+            gender,
+            prob_upside_down,
+            prob_female,
+            prob_male,
+            calibration]
+
+
+def write_csv_data(csv_file, image_name, dist_mm, position, gender,
+                   probabilities, calibration='estimated'):
+    """Helper function. Writes data on the CSV input file. `calibration`
+    tells if the ruler was 'estimated' or 'reused' from a previous image."""
+    write_csv_row(csv_file, csv_row(image_name, dist_mm, position, gender,
+                                    probabilities, calibration))
+
+
+def write_csv_row(csv_file, row):
+    """Helper function. Writes a row on the CSV input file; see `csv_row`."""
+    write_to_file = writer(csv_file)
+    write_to_file.writerow(row)
+
+
+def results_fname(fname, file_format='csv'):
+    """Returns the filename of a results file in `file_format`, replacing the
+    '.csv' extension of `fname` by the extension of the format."""
+    fname = Path(fname)
+    if fname.suffix.lower() == '.csv':
+        fname = fname.with_suffix(EXTENSIONS[file_format])
+    return fname
+
+
+def kept_files(fname, file_format='csv'):
+    """Returns the files of the results file `fname` kept when a new run
+    starts: the files of SQLite databases, which keep the results of
+    previous runs. CSV and Parquet files are replaced."""
+    if file_format != 'sqlite':
+        return []
+    fname = results_fname(fname, file_format)
+    return [f'{fname}{suffix}' for suffix in SQLITE_SUFFIXES]
+
+
+def initialize_result_writer(fname, file_format='csv', run_id=None,
+                             stage=None):
+    """Sets up a file to store the measurement results, returning its writer.
+
+    Parameters
+    ----------
+    fname : str or pathlib.Path
+        The filename of the results file. With formats other than 'csv', the
+        '.csv' extension is replaced by the extension of the format.
+    file_format : str, optional
+        Format of the file; one of `FORMATS`.
+    run_id : str, optional
+        Identifier of the run; recorded by SQLite databases.
+    stage : str, optional
+        Stage computed by the run; recorded by SQLite databases.
+
+    Returns
+    -------
+    result_writer : ResultWriter or database.ResultStore
+        Writer of the results file. CSV and Parquet files are named as
+        `initialize_csv_file` does; SQLite databases keep their name and
+        previous results.
+    """
+    fname = results_fname(fname, file_format)
+    if file_format == 'sqlite':
+        return open_result_writer(fname, file_format, run_id=run_id,
+                                  stage=stage)
+    return ResultWriter(_check_aux_file(fname), file_format)
+
+
+def open_result_writer(fname, file_format='csv', results=(), run_id=None,
+                       stage=None):
+    """Returns the writer of an existing results file, e.g. when resuming a
+    run.
+
+    Parameters
+    ----------
+    fname : str or pathlib.Path
+        The filename of the results file.
+    file_format : str, optional
+        Format of the file; one of `FORMATS`.
+    results : iterable of (image_path, row) tuples, optional
+        Results written first. CSV and Parquet files are replaced by a file
+        with these results only; SQLite databases keep their other results.
+    run_id : str, optional
+        Identifier of the run; recorded by SQLite databases.
+    stage : str, optional
+        Stage computed by the run; recorded by SQLite databases.
+
+    Returns
+    -------
+    result_writer : ResultWriter or database.ResultStore
+        Writer of the results file.
+    """
+    if file_format != 'sqlite':
+        return ResultWriter(fname, file_format, results)
+
+    from mothra import database
+    store = database.ResultStore(fname, run_id, stage)
+    for image_path, row in results:
+        store.write(image_path, row)
+    return store
+
+
+class ResultWriter:
+    """Writes the measurement results of images to a CSV or Parquet file,
+    keeping it open and writing rows in batches.
+
+    Parameters
+    ----------
+    fname : str or pathlib.Path
+        The filename of the results file. An existing file is replaced.
+    file_format : str, optional
+        'csv' (text, as written by `write_csv_data`) or 'parquet' (typed
+        columns; see `DATA_TYPES`). Parquet files require pyarrow.
+    results : iterable of (image_path, row) tuples, optional
+        Results written first, e.g. results of a resumed run; see `write`.
+    flush_rows : int, optional
+        Number of rows kept before writing them.
+    flush_seconds : float, optional
+        Maximum time, in seconds, rows are kept before writing them.
+
+    Notes
+    -----
+    Rows are written when enough of them are kept, when they are kept for
+    too long (checked when a row is added), and when closing the writer.
+    An existing file is replaced atomically: CSV files are written with
+    their header and `results` to a temporary file, which replaces `fname`
+    before rows are appended; Parquet files are written to a temporary
+    file, which replaces `fname` when closing the writer. Each batch of
+    rows of a Parquet file is a row group.
+    """
+    def __init__(self, fname, file_format='csv', results=(),
+                 flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"unknown format '{file_format}'; expected "
+                             "'csv' or 'parquet'")
+        self.fname = Path(fname)
+        self.file_format = file_format
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self._temporary = self.fname.with_name(f'{self.fname.name}.tmp')
+
+        if file_format == 'csv':
+            with open(self._temporary, 'w') as csv_file:
+                write_to_file = writer(csv_file)
+                write_to_file.writerow(DATA_COLS)
+                write_to_file.writerows(row for _, row in results)
+            os.replace(self._temporary, self.fname)
+            self._file = open(self.fname, 'a')
+            self._writer = writer(self._file)
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise ImportError('writing Parquet files requires pyarrow') \
+                    from exc
+            self._schema = pa.schema(
+                [(column, getattr(pa, data_type)())
+                 for column, data_type in zip(DATA_COLS, DATA_TYPES)]
+                )
+            self._file = pq.ParquetWriter(self._temporary, self._schema)
+            self._rows.extend(row for _, row in results)
+            self.flush()
+
+    def write(self, image_path, row):
+        """Adds the row of results of the image in `image_path`; see
+        `csv_row`. The path is only used by database.ResultStore."""
+        self._rows.append(row)
+        if (len(self._rows) >= self.flush_rows or
+                time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+        return None
+
+    def flush(self):
+        """Writes the rows kept."""
+        if self.file_format == 'csv':
+            self._writer.writerows(self._rows)
+            self._file.flush()
+        elif self._rows:
+            import pyarrow as pa
+            columns = [[_typed(value, data_type) for value in column]
+                       for column, data_type in zip(zip(*self._rows),
+                                                    DATA_TYPES)]
+            self._file.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field
+                 in zip(columns, self._schema)], schema=self._schema
+                ))
+        self._rows = []
+        self._last_flush = time.monotonic()
+        return None
+
+    def close(self):
+        """Writes the rows kept and closes the file."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+            if self.file_format == 'parquet':
+                os.replace(self._temporary, self.fname)
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _typed(value, data_type):
+    """Helper function. Converts a value of the results to `data_type`, or
+    to None if it is missing."""
+    if value is None or value in ('', 'N/A', 'None', 'nan'):
+        return None
+    if data_type == 'float64':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return str(value)
 
 
 def _check_aux_file(filename):
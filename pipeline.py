@@ -1,10 +1,8 @@
 #!/bin/env python
 
 import os
-import matplotlib.pyplot as plt
 
 from mothra.misc import AlbumentationsTransform, label_func, _generate_parser
-from skimage.io import imread
 
 WSPACE_SUBPLOTS = 0.7
 
@@ -17,97 +15,106 @@ Example :
 def main():
     args = _generate_parser()
 
-    stages = ['ruler_detection', 'binarization', 'measurements']
+    from mothra import manifest, misc, registry, runner, stages, writing
 
-    if args.stage not in stages:
-        print(f"* mothra expects stage to be 'ruler_detection', "
-               f"binarization', or 'measurements'. Received '{args.stage}'")
+    try:
+        targets = stages.resolve_targets(args.stage)
+    except ValueError:
+        names = list(stages.STAGE_ALIASES) + [stage.name for stage in stages.STAGES]
+        print(f"* mothra expects stage to be one of {', '.join(names)}. "
+              f"Received '{args.stage}'")
         return None
 
-    plot_level = 0
-    if args.plot:
-        plot_level = 1
-    if args.detailed_plot:
-        plot_level = 2
-
-    # Set up caching and import mothra modules
-    if args.cache:
-        from mothra import cache
-        import joblib
-        cache.memory = joblib.Memory('./cachedir', verbose=0)
-
-    from mothra import (ruler_detection, tracing, measurement, binarization,
-                        identification, misc, plotting, preprocessing, writing)
-
-    # checking if OS is windows-based; if yes, fixing path accordingly
-    misc._set_platform_path()
-
-    # Initializing output folder
-    misc.initialize_path(args.output_folder)
-
-    stage_idx = stages.index(args.stage)
-    pipeline_process = stages[:stage_idx + 1]
-
     # reading and processing input path.
     input_name = args.input
     image_paths = misc.process_paths_in_input(input_name)
 
-    number_of_images = len(image_paths)
+    write_results = {'measurement', 'identification'}.issubset(targets)
+    manifest_path = os.path.join(args.output_folder, manifest.MANIFEST_NAME)
+
+    result_writer = None
+    if args.resume and os.path.isfile(manifest_path):
+        # resuming a previous run: skipping the images it completed, and
+        # keeping its results.
+        run_manifest = manifest.Manifest.load(manifest_path)
+        previous = (run_manifest.run['stage'], run_manifest.run['format'])
+        if previous != (args.stage, args.results_format):
+            print(f"* Cannot resume: the previous run computed stage "
+                  f"'{previous[0]}', with results in {previous[1]} format. "
+                  f"Received '{args.stage}', {args.results_format}")
+            return None
+        completed = run_manifest.completed(image_paths)
+        if write_results:
+            result_writer = writing.open_result_writer(
+                run_manifest.run['results'], args.results_format,
+                run_manifest.results(completed),
+                run_id=run_manifest.run['run_id'], stage=args.stage
+                )
+        completed = set(completed)
+        image_paths = [image_path for image_path in image_paths
+                       if image_path not in completed]
+        print(f'* Resuming: {len(completed)} images processed already.')
+    else:
+        # Initializing output folder, keeping the results database of
+        # previous runs.
+        kept_files = []
+        if write_results:
+            kept_files = writing.kept_files(args.path_csv,
+                                            args.results_format)
+        misc.initialize_path(args.output_folder, kept_files)
+
+        # Initializing results file
+        run_id = manifest.new_run_id()
+        results_path = None
+        if write_results:
+            result_writer = writing.initialize_result_writer(
+                args.path_csv, args.results_format, run_id, args.stage
+                )
+            results_path = result_writer.fname
+        run_manifest = manifest.Manifest.create(manifest_path, args.stage,
+                                                results_path,
+                                                args.results_format, run_id)
 
-    # Initializing csv file
-    if args.stage == 'measurements':
-        writing.initialize_csv_file(csv_fname=args.path_csv)
+    number_of_images = len(image_paths)
 
-    for i, image_path in enumerate(image_paths):
-        try:
-            # creating axes layout for plotting.
-            axes = plotting.create_layout(len(pipeline_process), plot_level)
+    timer = stages.Timer()
 
+    # a single writer collects the results from all workers.
+    try:
+        for i, result in enumerate(runner.run(image_paths, args, timer)):
+            image_path = result['image_path']
             image_name = os.path.basename(image_path)
-            print(f'\nImage {i+1}/{number_of_images} : {image_name}')
-
-            image_rgb = imread(image_path)
-
-            # check image orientation and untilt it, if necessary.
-            if args.auto_rotate:
-                image_rgb = preprocessing.auto_rotate(image_rgb, image_path)
-
-            for step in pipeline_process:
-                # first, binarize the input image and return its components.
-                _, ruler_bin, lepidop_bin = binarization.main(image_rgb, axes)
-
-                if step == 'ruler_detection':
-                    T_space, top_ruler = ruler_detection.main(image_rgb, ruler_bin, axes)
-
-                elif step == 'binarization':
-                    # already binarized in the beginning. Moving on...
-                    pass
-
-                elif step == 'measurements':
-                    points_interest = tracing.main(lepidop_bin, axes)
-                    _, dist_mm = measurement.main(points_interest,
-                                                  T_space,
-                                                  axes)
-                    # measuring position and gender
-                    position, gender, probabilities = identification.main(image_rgb)
-
-                    with open(args.path_csv, 'a') as csv_file:
-                        writing.write_csv_data(csv_file, image_name, dist_mm,
-                                               position, gender,
-                                               probabilities)
-
-            if plot_level > 0:
-                output_path = os.path.normpath(
-                    os.path.join(args.output_folder, image_name)
-                    )
-                dpi = args.dpi
-                if plot_level == 2:
-                    dpi = int(1.5 * args.dpi)
-                plt.savefig(output_path, dpi=dpi)
-                plt.close()
-        except Exception as exc:
-            print(f"* Sorry, could not process {image_path}. More details:\n {exc}")
-            continue
+            print(f'\nResult {i+1}/{number_of_images} : {image_name}')
+
+            if result['error']:
+                print(f"* Sorry, could not process {image_path}. More "
+                      f"details:\n {result['error']}")
+                run_manifest.record(image_path, manifest.FAILED,
+                                    error=result['error'])
+                continue
+
+            row = None
+            if write_results:
+                row = writing.csv_row(image_name,
+                                      result['dist_mm'],
+                                      result['position'],
+                                      result['gender'],
+                                      result['probabilities'],
+                                      result.get('calibration', 'estimated'))
+            # recording the image before writing its results: if the run
+            # stops in between, the results file is rebuilt from the
+            # manifest when resumed.
+            run_manifest.record(image_path, manifest.DONE, row)
+            if write_results:
+                result_writer.write(image_path, row)
+    finally:
+        if result_writer is not None:
+            result_writer.close()
+
+    if args.timings:
+        timer.report()
+
+    registry.release()
 
 
 if __name__ == "__main__":